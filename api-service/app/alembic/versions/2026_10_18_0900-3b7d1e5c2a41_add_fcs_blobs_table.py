@@ -0,0 +1,45 @@
+"""Add fcs_blobs table
+
+Revision ID: 3b7d1e5c2a41
+Revises: 64d47a11fc1d
+Create Date: 2026-10-18 09:00:12.472911
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+import sqlmodel.sql.sqltypes
+
+# revision identifiers, used by Alembic.
+revision: str = '3b7d1e5c2a41'
+down_revision: Union[str, None] = '64d47a11fc1d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('fcs_blobs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('sha256', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('s3_key', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('size_byte', sa.Integer(), nullable=False),
+    sa.Column('ref_count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id', name=op.f('pk_fcs_blobs')),
+    sa.UniqueConstraint('sha256', name=op.f('uq_fcs_blobs_sha256')),
+    sa.UniqueConstraint('s3_key', name=op.f('uq_fcs_blobs_s3_key')),
+    )
+    op.add_column('fcs_files', sa.Column('blob_id', sa.Integer(), nullable=True))
+    op.create_foreign_key(op.f('fk_fcs_files_blob_id_fcs_blobs'), 'fcs_files', 'fcs_blobs', ['blob_id'], ['id'])
+    # 內容重複之檔案共用同一個 S3 物件，s3_key 不再唯一；舊 constraint 當初未命名，兩種可能名稱都處理。
+    op.execute('ALTER TABLE fcs_files DROP CONSTRAINT IF EXISTS fcs_files_s3_key_key')
+    op.execute('ALTER TABLE fcs_files DROP CONSTRAINT IF EXISTS uq_fcs_files_s3_key')
+
+
+def downgrade() -> None:
+    op.create_unique_constraint(op.f('uq_fcs_files_s3_key'), 'fcs_files', ['s3_key'])
+    op.drop_constraint(op.f('fk_fcs_files_blob_id_fcs_blobs'), 'fcs_files', type_='foreignkey')
+    op.drop_column('fcs_files', 'blob_id')
+    op.drop_table('fcs_blobs')
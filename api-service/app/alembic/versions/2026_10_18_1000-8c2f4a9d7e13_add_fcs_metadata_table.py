@@ -0,0 +1,44 @@
+"""Add fcs_metadata table
+
+Revision ID: 8c2f4a9d7e13
+Revises: 3b7d1e5c2a41
+Create Date: 2026-10-18 10:00:41.208354
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+import sqlmodel.sql.sqltypes
+
+# revision identifiers, used by Alembic.
+revision: str = '8c2f4a9d7e13'
+down_revision: Union[str, None] = '3b7d1e5c2a41'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('fcs_metadata',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('fcs_version', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('pnn_labels', sa.JSON(), nullable=False),
+    sa.Column('event_count', sa.Integer(), nullable=False),
+    sa.Column('text_begin', sa.Integer(), nullable=False),
+    sa.Column('text_end', sa.Integer(), nullable=False),
+    sa.Column('data_begin', sa.Integer(), nullable=False),
+    sa.Column('data_end', sa.Integer(), nullable=False),
+    sa.Column('analysis_begin', sa.Integer(), nullable=False),
+    sa.Column('analysis_end', sa.Integer(), nullable=False),
+    sa.Column('keywords', sa.JSON(), nullable=False),
+    sa.Column('fcs_file_id', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['fcs_file_id'], ['fcs_files.id'], name=op.f('fk_fcs_metadata_fcs_file_id_fcs_files'), ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id', name=op.f('pk_fcs_metadata')),
+    sa.UniqueConstraint('fcs_file_id', name=op.f('uq_fcs_metadata_fcs_file_id')),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('fcs_metadata')
@@ -0,0 +1,36 @@
+"""Add storage codec columns
+
+Revision ID: d41e6b2c9f70
+Revises: 8c2f4a9d7e13
+Create Date: 2026-10-18 11:00:27.639105
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+import sqlmodel.sql.sqltypes
+
+# revision identifiers, used by Alembic.
+revision: str = 'd41e6b2c9f70'
+down_revision: Union[str, None] = '8c2f4a9d7e13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # 既有物件皆未壓縮，以 server_default 補上 IDENTITY。
+    for table in ['fcs_files', 'fcs_blobs']:
+        op.add_column(table, sa.Column('storage_codec', sqlmodel.sql.sqltypes.AutoString(), nullable=False, server_default='IDENTITY'))
+        op.add_column(table, sa.Column('stored_size_byte', sa.Integer(), nullable=True))
+        op.alter_column(table, 'storage_codec', server_default=None)
+    op.execute('UPDATE fcs_files SET stored_size_byte = file_size_byte')
+    op.execute('UPDATE fcs_blobs SET stored_size_byte = size_byte')
+
+
+def downgrade() -> None:
+    for table in ['fcs_blobs', 'fcs_files']:
+        op.drop_column(table, 'stored_size_byte')
+        op.drop_column(table, 'storage_codec')
@@ -0,0 +1,37 @@
+"""Add indexes for hot query paths
+
+Revision ID: 5e9a3c7b1f28
+Revises: d41e6b2c9f70
+Create Date: 2026-10-18 12:00:13.482716
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+import sqlmodel.sql.sqltypes
+
+# revision identifiers, used by Alembic.
+revision: str = '5e9a3c7b1f28'
+down_revision: Union[str, None] = 'd41e6b2c9f70'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # CONCURRENTLY 建索引不擋寫入，但不能在交易內執行。
+    with op.get_context().autocommit_block():
+        op.create_index(op.f('ix_fcs_files_user_id_id'), 'fcs_files', ['user_id', 'id'], postgresql_include=['file_size_byte'], postgresql_concurrently=True, if_not_exists=True)
+        op.create_index(op.f('ix_fcs_files_upload_batch_id_id'), 'fcs_files', ['upload_batch_id', 'id'], postgresql_concurrently=True, if_not_exists=True)
+        op.create_index(op.f('ix_fcs_files_blob_id'), 'fcs_files', ['blob_id'], postgresql_concurrently=True, if_not_exists=True)
+        op.create_index(op.f('ix_jobs_user_id_job_type_id'), 'jobs', ['user_id', 'job_type', 'id'], postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(op.f('ix_jobs_user_id_job_type_id'), table_name='jobs', postgresql_concurrently=True, if_exists=True)
+        op.drop_index(op.f('ix_fcs_files_blob_id'), table_name='fcs_files', postgresql_concurrently=True, if_exists=True)
+        op.drop_index(op.f('ix_fcs_files_upload_batch_id_id'), table_name='fcs_files', postgresql_concurrently=True, if_exists=True)
+        op.drop_index(op.f('ix_fcs_files_user_id_id'), table_name='fcs_files', postgresql_concurrently=True, if_exists=True)
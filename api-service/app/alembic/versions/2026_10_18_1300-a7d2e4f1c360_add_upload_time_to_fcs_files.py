@@ -0,0 +1,37 @@
+"""Add upload_time to fcs_files
+
+Revision ID: a7d2e4f1c360
+Revises: 5e9a3c7b1f28
+Create Date: 2026-10-18 13:00:41.902315
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+import sqlmodel.sql.sqltypes
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7d2e4f1c360'
+down_revision: Union[str, None] = '5e9a3c7b1f28'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('fcs_files', sa.Column('upload_time', sa.TIMESTAMP(timezone=True), nullable=True))
+    op.execute('UPDATE fcs_files SET upload_time = upload_batches.upload_time FROM upload_batches WHERE upload_batches.id = fcs_files.upload_batch_id')
+    op.alter_column('fcs_files', 'upload_time', nullable=False)
+    # CONCURRENTLY 不能在交易內執行，autocommit_block 會先提交上面之變更。
+    with op.get_context().autocommit_block():
+        op.create_index(op.f('ix_fcs_files_user_id_upload_time_id'), 'fcs_files', ['user_id', 'upload_time', 'id'], postgresql_concurrently=True, if_not_exists=True)
+        op.create_index(op.f('ix_fcs_files_user_id_file_size_byte_id'), 'fcs_files', ['user_id', 'file_size_byte', 'id'], postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(op.f('ix_fcs_files_user_id_file_size_byte_id'), table_name='fcs_files', postgresql_concurrently=True, if_exists=True)
+        op.drop_index(op.f('ix_fcs_files_user_id_upload_time_id'), table_name='fcs_files', postgresql_concurrently=True, if_exists=True)
+    op.drop_column('fcs_files', 'upload_time')
@@ -0,0 +1,36 @@
+"""Add trigram index on fcs_files.file_name
+
+Revision ID: c93f0b7a5d12
+Revises: a7d2e4f1c360
+Create Date: 2026-10-18 14:00:41.207385
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+import sqlmodel.sql.sqltypes
+
+# revision identifiers, used by Alembic.
+revision: str = 'c93f0b7a5d12'
+down_revision: Union[str, None] = 'a7d2e4f1c360'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # pg_trgm 為 trusted extension，資料庫擁有者即可建立，不需 superuser。
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    with op.get_context().autocommit_block():
+        op.create_index(
+            op.f('ix_fcs_files_file_name_trgm'), 'fcs_files', ['file_name'],
+            postgresql_using='gin', postgresql_ops={'file_name': 'gin_trgm_ops'}, postgresql_concurrently=True, if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    # 只移除索引；pg_trgm 可能另有他用，extension 留著。
+    with op.get_context().autocommit_block():
+        op.drop_index(op.f('ix_fcs_files_file_name_trgm'), table_name='fcs_files', postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,44 @@
+"""Add user_files_stats table
+
+Revision ID: e6b1d8f3a925
+Revises: c93f0b7a5d12
+Create Date: 2026-10-18 15:00:12.584307
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+import sqlmodel.sql.sqltypes
+
+# revision identifiers, used by Alembic.
+revision: str = 'e6b1d8f3a925'
+down_revision: Union[str, None] = 'c93f0b7a5d12'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('user_files_stats',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('upload_batch_id', sa.Integer(), nullable=False),
+    sa.Column('public', sa.Boolean(), nullable=False),
+    sa.Column('files_count', sa.Integer(), nullable=False),
+    sa.Column('files_size_byte_sum', sa.BigInteger(), nullable=False),
+    sa.ForeignKeyConstraint(['upload_batch_id'], ['upload_batches.id'], name=op.f('fk_user_files_stats_upload_batch_id_upload_batches'), ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], name=op.f('fk_user_files_stats_user_id_users'), ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id', 'upload_batch_id', 'public', name=op.f('pk_user_files_stats'))
+    )
+    # 回填時擋住檔案之寫入（讀取照常），計數與回填當下之檔案一致；之後之寫入由新版程式於同一交易內累加。
+    op.execute('LOCK TABLE fcs_files IN SHARE MODE')
+    op.execute(
+        'INSERT INTO user_files_stats (user_id, upload_batch_id, public, files_count, files_size_byte_sum) '
+        'SELECT user_id, upload_batch_id, public, count(*), sum(file_size_byte) FROM fcs_files WHERE user_id IS NOT NULL '
+        'GROUP BY user_id, upload_batch_id, public'
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('user_files_stats')
@@ -0,0 +1,42 @@
+"""Add user_files_totals table
+
+Revision ID: f2c7a9d4b816
+Revises: e6b1d8f3a925
+Create Date: 2026-10-18 16:00:41.903215
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+import sqlmodel.sql.sqltypes
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2c7a9d4b816'
+down_revision: Union[str, None] = 'e6b1d8f3a925'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('user_files_totals',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('public', sa.Boolean(), nullable=False),
+    sa.Column('files_count', sa.Integer(), nullable=False),
+    sa.Column('files_size_byte_sum', sa.BigInteger(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], name=op.f('fk_user_files_totals_user_id_users'), ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id', 'public', name=op.f('pk_user_files_totals'))
+    )
+    # 同 user_files_stats 之回填：擋住檔案之寫入，計數與回填當下之檔案一致。
+    op.execute('LOCK TABLE fcs_files IN SHARE MODE')
+    op.execute(
+        'INSERT INTO user_files_totals (user_id, public, files_count, files_size_byte_sum) '
+        'SELECT user_id, public, count(*), sum(file_size_byte) FROM fcs_files WHERE user_id IS NOT NULL '
+        'GROUP BY user_id, public'
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('user_files_totals')
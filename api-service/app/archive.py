@@ -0,0 +1,131 @@
+from dataclasses import dataclass
+from datetime import datetime
+import struct
+from typing import AsyncIterator, Awaitable, Callable
+import zlib
+
+
+
+_ZIP64_LIMIT = 0xFFFFFFFF
+_ZIP64_COUNT_LIMIT = 0xFFFF
+_ZIP64_MARKER = 0xFFFFFFFF # 超過上限之欄位一律填此值，實際值寫在 ZIP64 欄位
+_ZIP64_COUNT_MARKER = 0xFFFF
+_ZIP_VERSION = 20
+_ZIP64_VERSION = 45
+_ZIP_FLAGS = 0x0808 # bit 3：CRC 與大小寫在資料之後之 data descriptor；bit 11：檔名為 UTF-8
+
+
+
+@dataclass
+class ZipEntry:
+    name: str
+    size_byte: int
+    modified_time: datetime
+    open: Callable[[], Awaitable[AsyncIterator[bytes]]] # 輪到此檔時才開啟來源，同時只讀一個檔
+
+
+
+def _dos_time(time: datetime):
+    date = max(time.year - 1980, 0) << 9 | time.month << 5 | time.day
+    return time.hour << 11 | time.minute << 5 | time.second // 2, date
+
+
+
+class ZipStream:
+    '''
+    邊讀來源邊產生 ZIP 檔（store 模式，不壓縮），不落地暫存檔，記憶體只需放一段來源資料。
+
+    各檔大小事先已知，store 模式下整個 ZIP 之大小可事先算出，回應可帶 Content-Length；CRC 邊傳邊算，寫在各檔之後之 data descriptor。
+    單檔或位移超過 4GiB、檔案超過 65535 個時改寫 ZIP64 欄位。
+    '''
+
+    def __init__(self, entries: list[ZipEntry]):
+        self.entries = entries
+
+
+    @staticmethod
+    def _is_zip64(entry: ZipEntry): return entry.size_byte >= _ZIP64_LIMIT
+
+
+    def _local_header(self, entry: ZipEntry):
+        name = entry.name.encode()
+        time, date = _dos_time(entry.modified_time)
+        # 大小留待 data descriptor；ZIP64 檔須附 ZIP64 extra 欄位，讀取端才知道 data descriptor 是 8 位元組之大小。
+        extra = struct.pack('<HHQQ', 0x0001, 16, 0, 0) if self._is_zip64(entry) else b''
+        size = _ZIP64_MARKER if self._is_zip64(entry) else 0
+        return struct.pack(
+            '<IHHHHHIIIHH', 0x04034B50, _ZIP64_VERSION if self._is_zip64(entry) else _ZIP_VERSION, _ZIP_FLAGS, 0,
+            time, date, 0, size, size, len(name), len(extra),
+        ) + name + extra
+
+
+    def _data_descriptor(self, entry: ZipEntry, crc: int):
+        if self._is_zip64(entry): return struct.pack('<IIQQ', 0x08074B50, crc, entry.size_byte, entry.size_byte)
+        return struct.pack('<IIII', 0x08074B50, crc, entry.size_byte, entry.size_byte)
+
+
+    def _central_directory_header(self, entry: ZipEntry, crc: int, offset: int):
+        name = entry.name.encode()
+        time, date = _dos_time(entry.modified_time)
+        zip64_fields = []
+        if entry.size_byte >= _ZIP64_LIMIT: zip64_fields += [entry.size_byte, entry.size_byte]
+        if offset >= _ZIP64_LIMIT: zip64_fields.append(offset)
+        extra = struct.pack(f'<HH{len(zip64_fields)}Q', 0x0001, 8 * len(zip64_fields), *zip64_fields) if zip64_fields else b''
+        version = _ZIP64_VERSION if zip64_fields else _ZIP_VERSION
+        size = entry.size_byte if entry.size_byte < _ZIP64_LIMIT else _ZIP64_MARKER
+        return struct.pack(
+            '<IHHHHHHIIIHHHHHII', 0x02014B50, version, version, _ZIP_FLAGS, 0, time, date, crc, size, size,
+            len(name), len(extra), 0, 0, 0, 0o100644 << 16, offset if offset < _ZIP64_LIMIT else _ZIP64_MARKER,
+        ) + name + extra
+
+
+    def _end_of_central_directory(self, central_directory_offset: int, central_directory_size_byte: int):
+        count = len(self.entries)
+        output = b''
+        if count >= _ZIP64_COUNT_LIMIT or central_directory_offset >= _ZIP64_LIMIT or central_directory_size_byte >= _ZIP64_LIMIT:
+            zip64_end_offset = central_directory_offset + central_directory_size_byte
+            output += struct.pack(
+                '<IQHHIIQQQQ', 0x06064B50, 44, _ZIP64_VERSION, _ZIP64_VERSION, 0, 0,
+                count, count, central_directory_size_byte, central_directory_offset,
+            )
+            output += struct.pack('<IIQI', 0x07064B50, 0, zip64_end_offset, 1)
+        count = count if count < _ZIP64_COUNT_LIMIT else _ZIP64_COUNT_MARKER
+        return output + struct.pack(
+            '<IHHHHIIH', 0x06054B50, 0, 0, count, count,
+            central_directory_size_byte if central_directory_size_byte < _ZIP64_LIMIT else _ZIP64_MARKER,
+            central_directory_offset if central_directory_offset < _ZIP64_LIMIT else _ZIP64_MARKER, 0,
+        )
+
+
+    @property
+    def size_byte(self):
+        '''整個 ZIP 之位元組數；CRC 不影響大小，以 0 代入計算。'''
+        offset = 0
+        central_directory_size_byte = 0
+        for entry in self.entries:
+            central_directory_size_byte += len(self._central_directory_header(entry=entry, crc=0, offset=offset))
+            offset += len(self._local_header(entry)) + entry.size_byte + len(self._data_descriptor(entry=entry, crc=0))
+        return offset + central_directory_size_byte + len(self._end_of_central_directory(offset, central_directory_size_byte))
+
+
+    async def __aiter__(self):
+        offset = 0
+        central_directory: list[bytes] = []
+        for entry in self.entries:
+            local_header = self._local_header(entry)
+            yield local_header
+            crc = 0
+            size_byte = 0
+            if entry.size_byte:
+                async for data in await entry.open():
+                    crc = zlib.crc32(data, crc)
+                    size_byte += len(data)
+                    yield data
+            if size_byte != entry.size_byte: raise ValueError(f'{entry.name} is {size_byte} bytes, expected {entry.size_byte} bytes')
+            data_descriptor = self._data_descriptor(entry=entry, crc=crc)
+            yield data_descriptor
+            central_directory.append(self._central_directory_header(entry=entry, crc=crc, offset=offset))
+            offset += len(local_header) + size_byte + len(data_descriptor)
+        central_directory_size_byte = sum(len(header) for header in central_directory)
+        for header in central_directory: yield header
+        yield self._end_of_central_directory(offset, central_directory_size_byte)
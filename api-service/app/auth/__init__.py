@@ -4,12 +4,14 @@ from fastapi import Depends, HTTPException, Security, status
 from fastapi.security import OAuth2PasswordBearer
 import jwt
 from pwdlib import PasswordHash
-from sqlmodel import Session, select, update
+from sqlmodel import select, update
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app.db import User, get_db_session
 from app.logging import logger
 from app.models import JwtPayload
 from app.settings import Settings, get_settings
+from app.user_cache import user_cache
 
 
 
@@ -40,22 +42,25 @@ def decode_token(settings: Settings, token: str, verify_exp: bool = True) -> dic
 
 
 
-def verify_account_password(user: User, to_verify_password: str, db_session: Session):
-    '''認證帳密'''
+async def verify_account_password(user: User, to_verify_password: str, db_session: AsyncSession):
+    '''認證帳密；雜湊參數過時者換成新雜湊並 commit，登入用戶之快取一併失效。'''
     valid, _new_hash = password_hash.verify_and_update(to_verify_password, user.hashed_password)
-    if _new_hash: db_session.exec(update(User).where(User.id == user.id).values(hashed_password=_new_hash))
+    if _new_hash:
+        await db_session.exec(update(User).where(User.id == user.id).values(hashed_password=_new_hash))
+        await db_session.commit()
+        await user_cache.invalidate(user.username)
     return valid
 
 
 
-def authenticate_account(username: str, password: str, db_session: Session):
+async def authenticate_account(username: str, password: str, db_session: AsyncSession):
     ...
-    user = db_session.exec(select(User).where(User.username == username)).one_or_none()
+    user = (await db_session.exec(select(User).where(User.username == username))).one_or_none()
     if not user:
         logger.warning({'title': 'User not found', 'email': username, 'password': password})
         raise HTTPException(status.HTTP_401_UNAUTHORIZED)
     
-    _account_valid = verify_account_password(user=user, to_verify_password=password, db_session=db_session)
+    _account_valid = await verify_account_password(user=user, to_verify_password=password, db_session=db_session)
     if not _account_valid:
         logger.error({'email': username, 'password': password})
         raise HTTPException(status.HTTP_401_UNAUTHORIZED)
@@ -73,11 +78,15 @@ def _get_username_from_token(settings: Settings, token: str, verify_exp: bool =
 
 
 
-def get_requestor_user(
-    db_session: Session = Depends(get_db_session),
+async def get_requestor_user(
+    db_session: AsyncSession = Depends(get_db_session),
     settings: Settings = Depends(get_settings),
     oauth2_token: str | None = Security(oauth2_password_bearer),
 ):
+    '''用戶經 user_cache 快取，輪詢等頻繁之請求不必每次查資料庫；用戶資料異動後須呼叫 user_cache.invalidate。'''
     if not oauth2_token: return None
     _username = _get_username_from_token(settings=settings, token=oauth2_token)
-    return db_session.exec(select(User).where(User.username == _username)).one_or_none()
+    async def load():
+        return (await db_session.exec(select(User).where(User.username == _username))).one_or_none()
+
+    return await user_cache.get(username=_username, load=load)
@@ -0,0 +1,96 @@
+import struct
+
+import zstandard
+
+from app.db import StorageCodecEnum
+from app.settings import get_settings
+
+
+
+_SETTINGS = get_settings()
+ZSTD_SKIPPABLE_FRAME_MAGIC = 0x184D2A5E
+ZSTD_SEEKABLE_MAGIC = 0x8F92EAB1
+ZSTD_SEEK_TABLE_FOOTER_SIZE_BYTE = 9
+
+
+
+class ZstdSeekableEncoder:
+    '''
+    以 zstd seekable format 壓縮串流：每 frame_size_byte 原始資料壓成一個獨立 frame，結尾以 skippable frame 附上 seek table。
+
+    一般 zstd 解壓工具會略過 seek table，照常解出完整內容；需要隨機讀取時依 seek table 只解需要之 frame。
+    '''
+
+    def __init__(self, level: int = _SETTINGS.S3_ZSTD_LEVEL, frame_size_byte: int = _SETTINGS.S3_ZSTD_FRAME_SIZE_BYTE):
+        self.frame_size_byte = frame_size_byte
+        self.frames: list[tuple[int, int]] = [] # 各 frame 之（壓縮後大小, 原始大小）
+        self._compressor = zstandard.ZstdCompressor(level=level, write_checksum=True)
+        self._pending = bytearray()
+
+
+    def encode(self, data: bytes):
+        self._pending += data
+        output = bytearray()
+        while len(self._pending) >= self.frame_size_byte:
+            output += self._compress_frame(bytes(self._pending[:self.frame_size_byte]))
+            del self._pending[:self.frame_size_byte]
+        return bytes(output)
+
+
+    def finish(self):
+        output = bytearray(self._compress_frame(bytes(self._pending)) if self._pending else b'')
+        self._pending.clear()
+        seek_table = b''.join(struct.pack('<II', c, d) for c, d in self.frames)
+        seek_table += struct.pack('<IBI', len(self.frames), 0, ZSTD_SEEKABLE_MAGIC)
+        output += struct.pack('<II', ZSTD_SKIPPABLE_FRAME_MAGIC, len(seek_table)) + seek_table
+        return bytes(output)
+
+
+    def _compress_frame(self, data: bytes):
+        frame = self._compressor.compress(data)
+        self.frames.append((len(frame), len(data)))
+        return frame
+
+
+
+def zstd_seek_table_size(footer: bytes):
+    '''由物件最後 9 個位元組判斷整個 seek table skippable frame 之大小。'''
+    frame_count, descriptor, magic = struct.unpack('<IBI', footer[-ZSTD_SEEK_TABLE_FOOTER_SIZE_BYTE:])
+    if magic != ZSTD_SEEKABLE_MAGIC: raise ValueError('Not a zstd seekable object')
+    entry_size_byte = 12 if descriptor & 0x80 else 8 # 最高位元表示各 entry 附有 checksum
+    return 8 + frame_count * entry_size_byte + ZSTD_SEEK_TABLE_FOOTER_SIZE_BYTE
+
+
+
+def parse_zstd_seek_table(tail: bytes):
+    '''自物件結尾之資料解析 seek table，回傳各 frame 之（壓縮後大小, 原始大小）。'''
+    table = tail[-zstd_seek_table_size(tail):]
+    frame_count, descriptor, _ = struct.unpack('<IBI', table[-ZSTD_SEEK_TABLE_FOOTER_SIZE_BYTE:])
+    entry_size_byte = 12 if descriptor & 0x80 else 8
+    return [struct.unpack_from('<II', table, 8 + i * entry_size_byte) for i in range(frame_count)]
+
+
+
+def locate_zstd_frames(frames: list[tuple[int, int]], start: int, end: int):
+    '''
+    找出原始內容 [start, end] 落在哪幾個 frame。
+    回傳（第一個 frame 序號, 最後一個 frame 序號, 壓縮資料起點, 壓縮資料終點, 第一個 frame 之原始內容起點），起訖皆含端點。
+    '''
+    first = last = None
+    compressed_offset = decompressed_offset = 0
+    for i, (compressed_size, decompressed_size) in enumerate(frames):
+        if first is None and start < decompressed_offset + decompressed_size:
+            first, compressed_begin, decompressed_begin = i, compressed_offset, decompressed_offset
+        if first is not None and end < decompressed_offset + decompressed_size:
+            last, compressed_end = i, compressed_offset + compressed_size - 1
+            break
+        compressed_offset += compressed_size
+        decompressed_offset += decompressed_size
+    if first is None or last is None: raise ValueError(f'Range {start}-{end} is out of the content')
+    return first, last, compressed_begin, compressed_end, decompressed_begin
+
+
+
+def create_encoder(codec: StorageCodecEnum):
+    if codec == StorageCodecEnum.ZSTD: return ZstdSeekableEncoder()
+    return None
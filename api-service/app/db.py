@@ -1,13 +1,18 @@
 from datetime import UTC, datetime
 from enum import StrEnum
-from typing import Any
+from typing import Any, Optional
 from uuid import UUID, uuid4
 
 from pydantic import ConfigDict
-from sqlalchemy import MetaData, create_engine, VARCHAR
+from sqlalchemy import BigInteger, Connection, Engine, Index, MetaData, create_engine, event, VARCHAR
 from sqlalchemy.dialects.postgresql import JSONB
-from sqlmodel import AutoString, Field, Relationship, SQLModel, Session, JSON, TIMESTAMP
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm import ORMExecuteState, raiseload
+from sqlalchemy.pool import AsyncAdaptedQueuePool, ConnectionPoolEntry, QueuePool
+from sqlmodel import AutoString, Field, Relationship, SQLModel, Session, JSON, TIMESTAMP, or_
+from sqlmodel.ext.asyncio.session import AsyncSession
 
+from app.metrics import observe_db_pool, timed_pool_class
 from app.settings import get_settings
 
 
@@ -63,15 +68,66 @@ class UploadBatch(SQLModel, table=True):
     })
 
 
+class StorageCodecEnum(StrEnum):
+    IDENTITY = 'IDENTITY' # 原始內容
+    ZSTD = 'ZSTD' # zstd seekable format：每段原始資料壓成獨立 frame，結尾附 seek table
+
+
+
+class FcsBlob(SQLModel, table=True):
+    '''以內容 SHA-256 定址之 S3 物件，內容相同之 FcsFile 共用同一個 blob，ref_count 為引用之 FcsFile 數。'''
+    __tablename__ = 'fcs_blobs'
+
+    id: int | None = Field(None, primary_key=True)
+    sha256: str = Field(unique=True)
+    s3_key: str = Field(unique=True)
+    size_byte: int
+    storage_codec: StorageCodecEnum = Field(StorageCodecEnum.IDENTITY, sa_type=AutoString)
+    stored_size_byte: int | None = None # S3 物件實際大小，壓縮時小於 size_byte
+    ref_count: int = 0
+
+    files: list['FcsFile'] = Relationship(back_populates='blob')
+
+    model_config = ConfigDict(json_schema_extra={
+        'examples': [{
+            'id': 1,
+            "sha256": "9f86d081884c7d659a2feaa0c55ad015a3bf4f1b2b0b822cd15d6c15b0f00a08",
+            "s3_key": "01K7PXGBTMV8R5M3TZTJ79PSMF/abc.fcs",
+            "size_byte": 12345,
+            "storage_codec": StorageCodecEnum.ZSTD,
+            "stored_size_byte": 4321,
+            "ref_count": 1,
+        }],
+    })
+
+
+
 class FcsFile(SQLModel, table=True):
     __tablename__ = 'fcs_files'
+    __table_args__ = (
+        # 個人檔案列表依 id 排序；files stat 之 count 與 sum 只讀索引即可（index-only scan）。
+        Index('ix_fcs_files_user_id_id', 'user_id', 'id', postgresql_include=['file_size_byte']),
+        # 個人檔案列表之 keyset 分頁，依上傳時間或大小排序，同值再依 id。
+        Index('ix_fcs_files_user_id_upload_time_id', 'user_id', 'upload_time', 'id'),
+        Index('ix_fcs_files_user_id_file_size_byte_id', 'user_id', 'file_size_byte', 'id'),
+        # 檔名搜尋之包含與開頭比對（ILIKE），需 pg_trgm。
+        Index('ix_fcs_files_file_name_trgm', 'file_name', postgresql_using='gin', postgresql_ops={'file_name': 'gin_trgm_ops'}),
+        Index('ix_fcs_files_upload_batch_id_id', 'upload_batch_id', 'id'),
+        Index('ix_fcs_files_blob_id', 'blob_id'),
+    )
 
     id: int | None = Field(None, primary_key=True)
     file_idno: str = Field(unique=True)
     file_name: str
-    file_size_byte: int
-    s3_key: str | None = Field(unique=True)
+    file_size_byte: int # 原始內容之大小
+    s3_key: str | None = None # 內容重複之檔案共用 blob 之 key，故不唯一。
+    storage_codec: StorageCodecEnum = Field(StorageCodecEnum.IDENTITY, sa_type=AutoString)
+    stored_size_byte: int | None = None # S3 物件實際大小，壓縮時小於 file_size_byte
     public: bool = True
+    upload_time: datetime = Field(sa_type=TIMESTAMP(True)) # 同 upload_batch.upload_time，複製一份以便依上傳時間分頁時走索引
+
+    blob_id: int | None = Field(None, foreign_key='fcs_blobs.id')
+    blob: FcsBlob | None = Relationship(back_populates='files')
 
     user_id: int | None = Field(None, foreign_key='users.id')
     user: User | None = Relationship(back_populates='files')
@@ -79,6 +135,11 @@ class FcsFile(SQLModel, table=True):
     upload_batch_id: int = Field(foreign_key='upload_batches.id')
     upload_batch: UploadBatch = Relationship(back_populates='files')
 
+    fcs_metadata: Optional['FcsMetadata'] = Relationship(
+        back_populates='fcs_file',
+        sa_relationship_kwargs={'uselist': False, 'cascade': 'all, delete-orphan', 'passive_deletes': True},
+    )
+
     model_config = ConfigDict(json_schema_extra={
         'examples': [{
             'id': 1,
@@ -86,6 +147,10 @@ class FcsFile(SQLModel, table=True):
             'file_name': "abc.fcs",
             "file_size_byte": 12345,
             "s3_key": "01K7PXGBTMV8R5M3TZTJ79PSMF/abc.fcs",
+            "storage_codec": StorageCodecEnum.IDENTITY,
+            "stored_size_byte": 12345,
+            "upload_time": "2025-10-16T18:00:00Z",
+            "blob_id": 1,
             "user_id": 1,
             "upload_batch_id": 1,
         }],
@@ -93,6 +158,98 @@ class FcsFile(SQLModel, table=True):
 
 
 
+def fcs_file_readable_by(user: User | None):
+    '''請求者讀得到之檔案之 WHERE 條件：公開檔案或自己的檔案。'''
+    return FcsFile.public if user is None else or_(FcsFile.public, FcsFile.user_id == user.id)
+
+
+
+class FcsMetadata(SQLModel, table=True):
+    '''上傳時自 FCS HEADER 與 TEXT 段解析出之 metadata，偏移量皆為檔案內之位元組位置（含頭尾）。'''
+    __tablename__ = 'fcs_metadata'
+
+    id: int | None = Field(None, primary_key=True)
+    fcs_version: str
+    pnn_labels: list[str] = Field(sa_type=JSON)
+    event_count: int
+    text_begin: int
+    text_end: int
+    data_begin: int
+    data_end: int
+    analysis_begin: int = 0
+    analysis_end: int = 0
+    keywords: dict[str, str] = Field(sa_type=JSON)
+
+    fcs_file_id: int | None = Field(None, foreign_key='fcs_files.id', unique=True, ondelete='CASCADE')
+    fcs_file: FcsFile | None = Relationship(back_populates='fcs_metadata')
+
+    model_config = ConfigDict(json_schema_extra={
+        'examples': [{
+            'id': 1,
+            "fcs_version": "3.1",
+            "pnn_labels": ['FSC-H', 'SSC-H', 'FL1-H', 'FL2-H', 'FL3-H', 'FL2-A', 'FL4-H', 'Time'],
+            "event_count": 13367,
+            "text_begin": 58,
+            "text_end": 2047,
+            "data_begin": 2048,
+            "data_end": 430983,
+            "analysis_begin": 0,
+            "analysis_end": 0,
+            "keywords": {"$PAR": "8", "$TOT": "13367"},
+            "fcs_file_id": 1,
+        }],
+    })
+
+
+
+class UserFilesStat(SQLModel, table=True):
+    '''
+    用戶檔案數與總大小之計數，依上傳批次與公開與否分列，於上傳、公開與否異動與刪除時在同一交易內累加。
+    統計時只讀該用戶之少數幾列，不必掃過所有檔案；匿名上傳之檔案不計。
+    '''
+    __tablename__ = 'user_files_stats'
+
+    user_id: int = Field(foreign_key='users.id', primary_key=True, ondelete='CASCADE')
+    upload_batch_id: int = Field(foreign_key='upload_batches.id', primary_key=True, ondelete='CASCADE')
+    public: bool = Field(primary_key=True)
+    files_count: int = 0
+    files_size_byte_sum: int = Field(0, sa_type=BigInteger) # 單檔大小可達 1000 MiB，總和會超出 32 位元
+
+    model_config = ConfigDict(json_schema_extra={
+        'examples': [{
+            'user_id': 1,
+            "upload_batch_id": 1,
+            "public": True,
+            "files_count": 2,
+            "files_size_byte_sum": 123,
+        }],
+    })
+
+
+
+class UserFilesTotal(SQLModel, table=True):
+    '''
+    同 UserFilesStat，但只依公開與否分列，每個用戶至多兩列，與 UserFilesStat 在同一交易內累加。
+    不需依批次細分之統計讀此表，列數與批次數無關。
+    '''
+    __tablename__ = 'user_files_totals'
+
+    user_id: int = Field(foreign_key='users.id', primary_key=True, ondelete='CASCADE')
+    public: bool = Field(primary_key=True)
+    files_count: int = 0
+    files_size_byte_sum: int = Field(0, sa_type=BigInteger)
+
+    model_config = ConfigDict(json_schema_extra={
+        'examples': [{
+            'user_id': 1,
+            "public": True,
+            "files_count": 2,
+            "files_size_byte_sum": 123,
+        }],
+    })
+
+
+
 class JobTypeEnum(StrEnum):
     FILES_STAT = 'FILES_STAT'
     FCS_INFO = 'FCS_INFO'
@@ -108,6 +265,7 @@ class JobStatusEnum(StrEnum):
 
 class Job(SQLModel, table=True):
     __tablename__ = 'jobs'
+    __table_args__ = (Index('ix_jobs_user_id_job_type_id', 'user_id', 'job_type', 'id'),)
 
     id: int | None = Field(None, primary_key=True)
     queue_job_id: UUID | None = Field(None, unique=True)
@@ -139,10 +297,53 @@ _SETTINGS = get_settings()
 
 
 
+def _engine_options(pool_class: type[QueuePool], engine_name: str):
+    '''
+    連線池與 psycopg 連線參數，皆取自設定。
+
+    statement_timeout 平常以連線參數 options 帶入；PgBouncer transaction 模式下前後交易可能落在不同之伺服器連線，
+    不轉送 options，prepared statement 也無法沿用，故改為每個交易開頭 SET LOCAL，並關閉 prepared statement。
+    '''
+    connect_args: dict[str, Any] = {
+        'prepare_threshold': None if _SETTINGS.DB_PGBOUNCER_TRANSACTION_MODE else _SETTINGS.DB_PREPARE_THRESHOLD,
+    }
+    if _SETTINGS.DB_STATEMENT_TIMEOUT_MS and not _SETTINGS.DB_PGBOUNCER_TRANSACTION_MODE:
+        connect_args['options'] = f'-c statement_timeout={_SETTINGS.DB_STATEMENT_TIMEOUT_MS}'
+    return {
+        'poolclass': timed_pool_class(pool_class=pool_class, engine_name=engine_name),
+        'pool_size': _SETTINGS.DB_POOL_SIZE,
+        'max_overflow': _SETTINGS.DB_MAX_OVERFLOW,
+        'pool_timeout': _SETTINGS.DB_POOL_TIMEOUT_SECOND,
+        'pool_recycle': _SETTINGS.DB_POOL_RECYCLE_SECOND,
+        'pool_pre_ping': _SETTINGS.DB_POOL_PRE_PING,
+        'connect_args': connect_args,
+    }
+
+
+
+def _configure_engine(engine: Engine, engine_name: str):
+    observe_db_pool(engine=engine, engine_name=engine_name)
+
+    @event.listens_for(engine, 'connect')
+    def set_prepared_max(dbapi_connection, connection_record: ConnectionPoolEntry):
+        connection_record.driver_connection.prepared_max = _SETTINGS.DB_PREPARED_MAX
+
+    if _SETTINGS.DB_PGBOUNCER_TRANSACTION_MODE and _SETTINGS.DB_STATEMENT_TIMEOUT_MS:
+        @event.listens_for(engine, 'begin')
+        def set_statement_timeout(connection: Connection):
+            connection.exec_driver_sql(f'SET LOCAL statement_timeout = {_SETTINGS.DB_STATEMENT_TIMEOUT_MS}')
+
+
+
+# 同步 engine 只給 alembic 與測試使用，API 路由一律走非同步 engine，查詢時不會卡住 event loop。
 _engine = create_engine(
     _SETTINGS.DATABASE_URL,
     # echo='debug',
+    **_engine_options(pool_class=QueuePool, engine_name='sync'),
 )
+_async_engine = create_async_engine(_SETTINGS.DATABASE_URL, **_engine_options(pool_class=AsyncAdaptedQueuePool, engine_name='async'))
+_configure_engine(engine=_engine, engine_name='sync')
+_configure_engine(engine=_async_engine.sync_engine, engine_name='async')
 SQLModel.metadata.naming_convention = MetaData(naming_convention={
     "ix": "ix_%(column_0_label)s",
     "uq": "uq_%(table_name)s_%(column_0_name)s",
@@ -154,5 +355,22 @@ metadata = SQLModel.metadata
 
 
 
-def get_db_session():
-    with Session(_engine) as session: yield session
+class _AsyncSyncSession(Session):
+    '''AsyncSession 底下實際執行之同步 session，另開子類別以免 do_orm_execute 事件影響同步 session。'''
+
+
+
+@event.listens_for(_AsyncSyncSession, 'do_orm_execute')
+def _raise_on_lazy_load(orm_execute_state: ORMExecuteState):
+    '''
+    非同步 session 不能在存取屬性時偷偷查詢，關聯一律須在查詢時以 selectinload、joinedload 等選項明確載入；
+    沒載入就存取者直接拋錯，而不是在 await 之外觸發 IO。
+    '''
+    if orm_execute_state.is_select and not orm_execute_state.is_relationship_load and not orm_execute_state.is_column_load:
+        orm_execute_state.statement = orm_execute_state.statement.options(raiseload('*'))
+
+
+
+async def get_db_session():
+    # commit 後不使物件過期，之後讀取欄位不必再查詢。
+    async with AsyncSession(_async_engine, sync_session_class=_AsyncSyncSession, expire_on_commit=False) as session: yield session
@@ -0,0 +1,32 @@
+import hashlib
+
+from fastapi import Response, status
+
+
+
+CACHE_CONTROL_REVALIDATE = 'private, no-cache' # 每次都要以 If-None-Match 確認，未變更時回 304
+CACHE_CONTROL_IMMUTABLE = 'private, max-age=31536000, immutable' # 內容不會再變，例如已完成之 job
+NOT_MODIFIED_RESPONSES = {status.HTTP_304_NOT_MODIFIED: {'description': 'Not Modified：If-None-Match 與目前之 ETag 相符，沒有本體'}}
+
+
+
+def make_etag(*versions: object):
+    '''以能代表版本之少數欄位（例如 id 與狀態）算出 ETag，不必先序列化整個回應。經 GZipMiddleware 壓縮後位元組不同，故為弱 ETag。'''
+    return 'W/"' + hashlib.blake2b('\x1f'.join(map(str, versions)).encode(), digest_size=12).hexdigest() + '"'
+
+
+
+def etag_matches(if_none_match: str | None, etag: str):
+    '''If-None-Match 採弱比較：忽略 W/ 前綴，可為以逗號分隔之多個 ETag 或 *。'''
+    if not if_none_match: return False
+    opaque_tag = etag.removeprefix('W/')
+    return any(tag == '*' or tag.removeprefix('W/') == opaque_tag for tag in (tag.strip() for tag in if_none_match.split(',')))
+
+
+
+def check_not_modified(response: Response, if_none_match: str | None, etag: str, cache_control: str = CACHE_CONTROL_REVALIDATE):
+    '''將 ETag 與 Cache-Control 設於回應；客戶端已有相同版本時回傳 304 回應，路由直接回傳它，不必序列化本體。'''
+    headers = {'ETag': etag, 'Cache-Control': cache_control}
+    if etag_matches(if_none_match=if_none_match, etag=etag): return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
+    return None
@@ -0,0 +1,151 @@
+from aiobotocore.client import AioBaseClient
+from botocore.exceptions import BotoCoreError, ClientError
+
+from app.db import FcsMetadata, StorageCodecEnum
+from app.logging import logger
+from app.s3 import get_object_range
+
+
+
+FCS_HEADER_SIZE_BYTE = 58
+FCS_TEXT_MAX_SIZE_BYTE = 4 * 1024 * 1024
+
+
+
+class FcsMetadataParser:
+    '''
+    逐段餵入檔案資料，收齊 HEADER 與 TEXT 段即解析出 FcsMetadata，之後之資料直接略過。
+
+    HEADER 與 TEXT 通常只在檔案開頭數 KB 內，上傳串流經過時順便解析，不必另外下載整個檔案；
+    內容不是 FCS、TEXT 過大或 TEXT 結束於 text_end_max_byte 之後時只記下 error，不影響上傳本身。
+    HEADER 之後只保留 TEXT 段之資料，TEXT 之前之位元組收到即丟，每個串流之緩衝不超過 TEXT 之大小上限。
+    '''
+
+    def __init__(self, text_max_size_byte: int = FCS_TEXT_MAX_SIZE_BYTE, text_end_max_byte: int | None = None):
+        self.text_max_size_byte = text_max_size_byte
+        self.text_end_max_byte = FCS_HEADER_SIZE_BYTE + text_max_size_byte if text_end_max_byte is None else text_end_max_byte
+        self.metadata: FcsMetadata | None = None
+        self.error: str | None = None
+        self._buffer = bytearray()
+        self._buffer_begin = 0 # _buffer[0] 於檔案內之位置
+        self._offsets: dict[str, int] | None = None
+
+
+    @property
+    def done(self): return self.metadata is not None or self.error is not None
+
+
+    @property
+    def needed_byte(self):
+        '''解析完成前至少還要讀到檔案第幾個位元組（不含）。'''
+        if self._offsets is None: return FCS_HEADER_SIZE_BYTE
+        return self._offsets['text_end'] + 1
+
+
+    def feed(self, data: bytes):
+        if self.done: return
+        self._buffer += data
+        if self._offsets is None and len(self._buffer) >= FCS_HEADER_SIZE_BYTE: self._parse_header()
+        if self._offsets is None or self.done: return
+        if (skip_byte := min(self._offsets['text_begin'] - self._buffer_begin, len(self._buffer))) > 0:
+            del self._buffer[:skip_byte]
+            self._buffer_begin += skip_byte
+        if self._buffer_begin + len(self._buffer) >= self.needed_byte: self._parse_text()
+
+
+    def finish(self):
+        '''資料已全部餵完；尚未解析完成者視為截斷之檔案。'''
+        if not self.done: self._fail('FCS HEADER or TEXT segment is truncated')
+
+
+    def _fail(self, error: str):
+        self.error = error
+        self._buffer = bytearray()
+
+
+    def _parse_header(self):
+        header = bytes(self._buffer[:FCS_HEADER_SIZE_BYTE])
+        if not header.startswith(b'FCS'): return self._fail('Not an FCS file')
+        try:
+            names = ['text_begin', 'text_end', 'data_begin', 'data_end', 'analysis_begin', 'analysis_end']
+            self._offsets = {name: int(header[10 + i * 8:18 + i * 8].strip() or 0) for i, name in enumerate(names)}
+        except ValueError: return self._fail('Invalid FCS HEADER segment')
+        self._offsets['version'] = header[3:6].decode('ascii', 'replace').strip()
+        if not FCS_HEADER_SIZE_BYTE <= self._offsets['text_begin'] < self._offsets['text_end']:
+            return self._fail('Invalid FCS TEXT segment offsets')
+        if self._offsets['text_end'] - self._offsets['text_begin'] + 1 > self.text_max_size_byte:
+            return self._fail('FCS TEXT segment is too large')
+        # 只限制長度時，TEXT 可以宣稱從很後面開始，解析前得先收過之前所有資料。
+        if self._offsets['text_end'] + 1 > self.text_end_max_byte: return self._fail('FCS TEXT segment ends too far into the file')
+
+
+    def _parse_text(self):
+        offsets = self._offsets
+        text = bytes(self._buffer[offsets['text_begin'] - self._buffer_begin:offsets['text_end'] + 1 - self._buffer_begin])
+        self._buffer = bytearray()
+
+        # 第一個位元組為分隔字元，值中出現之分隔字元以連續兩個表示。
+        delimiter = text[:1]
+        fields: list[str] = []
+        field = bytearray()
+        i = 1
+        while i < len(text):
+            if text[i:i + 1] != delimiter: field += text[i:i + 1]
+            elif text[i + 1:i + 2] == delimiter and i + 1 < len(text) - 1:
+                field += delimiter
+                i += 1
+            else:
+                fields.append(field.decode('utf-8', 'replace'))
+                field = bytearray()
+            i += 1
+        if field: fields.append(field.decode('utf-8', 'replace'))
+        keywords = {k.strip().upper(): v.strip() for k, v in zip(fields[0::2], fields[1::2])}
+
+        try:
+            # 資料段超過 HEADER 八位數可表示之範圍時，HEADER 填 0，實際位置寫在 TEXT。
+            data_begin = offsets['data_begin'] or int(keywords.get('$BEGINDATA', 0))
+            data_end = offsets['data_end'] or int(keywords.get('$ENDDATA', 0))
+            analysis_begin = offsets['analysis_begin'] or int(keywords.get('$BEGINANALYSIS', 0))
+            analysis_end = offsets['analysis_end'] or int(keywords.get('$ENDANALYSIS', 0))
+            parameter_count = int(keywords['$PAR'])
+            event_count = int(keywords['$TOT'])
+        except (KeyError, ValueError): return self._fail('Missing or invalid $PAR, $TOT or segment offset keywords')
+
+        self.metadata = FcsMetadata(
+            fcs_version=offsets['version'],
+            pnn_labels=[keywords.get(f'$P{n}N', '') for n in range(1, parameter_count + 1)],
+            event_count=event_count,
+            text_begin=offsets['text_begin'],
+            text_end=offsets['text_end'],
+            data_begin=data_begin,
+            data_end=data_end,
+            analysis_begin=analysis_begin,
+            analysis_end=analysis_end,
+            keywords=keywords,
+        )
+
+
+
+async def read_fcs_metadata(
+    s3_client: AioBaseClient, key: str, size_byte: int,
+    codec: StorageCodecEnum = StorageCodecEnum.IDENTITY, stored_size_byte: int | None = None,
+):
+    '''
+    以 Range 請求只讀取 S3 物件開頭之 HEADER 與 TEXT 段解析 metadata，供伺服器沒經手檔案內容之上傳方式使用。
+    讀取失敗只記 log 並回傳 None，不影響上傳之登記。
+    '''
+    parser = FcsMetadataParser()
+    offset = 0
+    try:
+        while not parser.done and offset < size_byte:
+            end = min(max(parser.needed_byte, offset + 64 * 1024), size_byte) - 1
+            content = await get_object_range(
+                s3_client=s3_client, key=key, codec=codec, stored_size_byte=stored_size_byte or size_byte, start=offset, end=end,
+            )
+            async for data in content: parser.feed(data)
+            offset = end + 1
+    except (BotoCoreError, ClientError, ValueError) as error:
+        logger.warning({'title': 'Read FCS metadata failed', 'key': key, 'error': error})
+        return None
+    parser.finish()
+    return parser.metadata
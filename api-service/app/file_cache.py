@@ -0,0 +1,84 @@
+import asyncio
+from typing import Awaitable, Callable
+
+from redis.exceptions import RedisError
+
+from app.kv import kv
+from app.logging import logger
+from app.metrics import FILE_INFO_CACHE_REQUESTS
+from app.models import CachedFileInfo
+from app.settings import get_settings
+
+
+
+_SETTINGS = get_settings()
+_TOMBSTONE = ''
+_TOMBSTONE_SECOND = 30 # 須長於一次回填查詢之時間，invalidate 前開始之查詢才寫不回去
+
+
+
+class FileInfoCache:
+    '''
+    以 file_idno 為 key 之 Redis read-through 快取，存 CachedFileInfo（FileInfo 加上權限檢查與簽下載網址所需之欄位）。
+
+    同一 worker 內同一檔案同時 miss 時只有第一個請求查資料庫，其餘等它的結果。
+    異動公開與否後以 invalidate 寫入短效之墓碑，回填一律 SET NX，invalidate 之前就開始之查詢便無法以舊資料蓋回去。
+    Redis 無法連線時直接查資料庫，不影響請求。
+    '''
+
+    def __init__(self, ttl_second: int = _SETTINGS.FILE_INFO_CACHE_TTL_SECOND):
+        self.ttl_second = ttl_second
+        self._loading: dict[str, asyncio.Future[CachedFileInfo | None]] = {}
+
+
+    @staticmethod
+    def _kv_key(file_idno: str): return f'file-info:{file_idno}'
+
+
+    async def get(self, file_idno: str, load: Callable[[], Awaitable[CachedFileInfo | None]]):
+        '''取得快取之檔案資訊，沒有時以 load 查詢並回填；檔案不存在時回 None，不快取。'''
+        try: cached: str | None = await kv.get(self._kv_key(file_idno))
+        except RedisError as error:
+            FILE_INFO_CACHE_REQUESTS.labels(result='error').inc()
+            logger.warning({'title': 'Read file info cache failed', 'file_idno': file_idno, 'error': error})
+            return await load()
+        if cached:
+            FILE_INFO_CACHE_REQUESTS.labels(result='hit').inc()
+            return CachedFileInfo.model_validate_json(cached)
+
+        if loading := self._loading.get(file_idno):
+            try:
+                file = await asyncio.shield(loading)
+                FILE_INFO_CACHE_REQUESTS.labels(result='coalesced').inc()
+                return file
+            except asyncio.CancelledError:
+                if not loading.cancelled(): raise # 被取消的是這個請求本身
+            # 第一個請求中途被取消，改由這個請求自己查。
+
+        FILE_INFO_CACHE_REQUESTS.labels(result='miss').inc()
+        loading = self._loading[file_idno] = asyncio.get_running_loop().create_future()
+        try:
+            file = await load()
+            if file and cached is None: # 有墓碑時不回填
+                try: await kv.set(self._kv_key(file_idno), file.model_dump_json(), ex=self.ttl_second, nx=True)
+                except RedisError as error: logger.warning({'title': 'Write file info cache failed', 'file_idno': file_idno, 'error': error})
+            loading.set_result(file)
+            return file
+        except asyncio.CancelledError:
+            loading.cancel()
+            raise
+        except Exception as error:
+            loading.set_exception(error)
+            loading.exception() # 沒有人在等時，避免 asyncio 警告例外未被取出
+            raise
+        finally:
+            if self._loading.get(file_idno) is loading: del self._loading[file_idno]
+
+
+    async def invalidate(self, file_idno: str):
+        '''檔案資訊異動並 commit 後呼叫。Redis 錯誤不吞掉，否則舊的公開與否會留到 TTL 到期；重試異動即可再 invalidate。'''
+        await kv.set(self._kv_key(file_idno), _TOMBSTONE, ex=_TOMBSTONE_SECOND)
+
+
+
+file_info_cache = FileInfoCache()
@@ -0,0 +1,96 @@
+from typing import Iterable, NamedTuple
+
+from sqlalchemy import BigInteger, cast
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import func, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.db import UploadBatch, UserFilesStat, UserFilesTotal
+from app.models import FilesStatBreakdownEnum, FilesStatGroup, FilesStatReport
+
+
+
+class FilesStatDelta(NamedTuple):
+    '''一個或一組檔案對計數之增減：新增為正，刪除為負，公開與否異動為一負一正。'''
+    user_id: int | None
+    upload_batch_id: int
+    public: bool
+    files_count: int
+    files_size_byte_sum: int
+
+
+
+async def _upsert_counts(
+    db_session: AsyncSession, table: type[UserFilesStat] | type[UserFilesTotal], index_elements: list, grouped: dict[tuple, list[int]],
+):
+    '''grouped 之 key 依序對應 index_elements（主鍵各欄），值為（檔案數, 總大小）之增減。'''
+    rows = [
+        {**{column.key: value for column, value in zip(index_elements, key)}, 'files_count': counts[0], 'files_size_byte_sum': counts[1]}
+        for key, counts in sorted(grouped.items()) if counts != [0, 0]
+    ]
+    if not rows: return
+    statement = insert(table).values(rows)
+    statement = statement.on_conflict_do_update(
+        index_elements=index_elements,
+        set_={
+            'files_count': table.files_count + statement.excluded.files_count,
+            'files_size_byte_sum': table.files_size_byte_sum + statement.excluded.files_size_byte_sum,
+        },
+    )
+    await db_session.exec(statement)
+
+
+
+async def update_files_stat(db_session: AsyncSession, deltas: Iterable[FilesStatDelta]):
+    '''
+    於呼叫端之交易內累加 user_files_stats 與 user_files_totals，不 commit；匿名上傳（user_id 為 None）不計。
+
+    同一列之增減先合併，每個表再以一個多列 INSERT ... ON CONFLICT 寫入；兩表依固定順序、列依主鍵排序，並行之交易鎖列順序一致，不會互相死結。
+    '''
+    grouped: dict[tuple[int, int, bool], list[int]] = {}
+    totals: dict[tuple[int, bool], list[int]] = {}
+    for delta in deltas:
+        if delta.user_id is None: continue
+        for counts in (
+            grouped.setdefault((delta.user_id, delta.upload_batch_id, delta.public), [0, 0]), totals.setdefault((delta.user_id, delta.public), [0, 0]),
+        ):
+            counts[0] += delta.files_count
+            counts[1] += delta.files_size_byte_sum
+    await _upsert_counts(
+        db_session=db_session, table=UserFilesStat, index_elements=[UserFilesStat.user_id, UserFilesStat.upload_batch_id, UserFilesStat.public],
+        grouped=grouped,
+    )
+    await _upsert_counts(db_session=db_session, table=UserFilesTotal, index_elements=[UserFilesTotal.user_id, UserFilesTotal.public], grouped=totals)
+
+
+
+def files_stat_statement(user_id: int, breakdown: set[FilesStatBreakdownEnum]):
+    '''
+    依 breakdown 分組加總用戶之計數。依批次細分者讀 user_files_stats，列數與批次數成正比；
+    其餘讀 user_files_totals，至多兩列。皆與檔案數無關；batch_idno 為 ULID，依字串排序即上傳順序。
+    '''
+    table = UserFilesStat if FilesStatBreakdownEnum.BATCH in breakdown else UserFilesTotal
+    group_columns = []
+    if FilesStatBreakdownEnum.BATCH in breakdown: group_columns.append(UploadBatch.batch_idno)
+    if FilesStatBreakdownEnum.VISIBILITY in breakdown: group_columns.append(table.public)
+    files_count = func.sum(table.files_count)
+    statement = (
+        select(*group_columns, files_count, cast(func.sum(table.files_size_byte_sum), BigInteger))
+        .where(table.user_id == user_id).group_by(*group_columns).having(files_count > 0).order_by(*group_columns)
+    )
+    if FilesStatBreakdownEnum.BATCH in breakdown: statement = statement.join(UploadBatch, UploadBatch.id == UserFilesStat.upload_batch_id)
+    return group_columns, statement
+
+
+
+async def get_files_stat(db_session: AsyncSession, user_id: int, breakdown: Iterable[FilesStatBreakdownEnum] = ()):
+    '''讀出用戶之總計；指定 breakdown 時另依之細分於 groups。'''
+    group_columns, statement = files_stat_statement(user_id=user_id, breakdown=set(breakdown))
+    groups = [
+        FilesStatGroup(files_count=row[-2], files_size_byte_sum=row[-1], **{column.key: value for column, value in zip(group_columns, row)})
+        for row in await db_session.exec(statement)
+    ]
+    return FilesStatReport(
+        files_count=sum(group.files_count for group in groups), files_size_byte_sum=sum(group.files_size_byte_sum for group in groups),
+        groups=groups if group_columns else [],
+    )
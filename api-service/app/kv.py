@@ -0,0 +1,16 @@
+from redis.asyncio import Redis
+
+from app.settings import get_settings
+
+
+
+_SETTINGS = get_settings()
+
+
+
+# 與 job queue 共用同一個 Redis，但 RQ 只能用同步 client，這裡另開一個非同步 client 給路由存放暫態資料。
+kv = Redis.from_url(
+    str(_SETTINGS.REDIS_URL),
+    decode_responses=True,
+    protocol=3,
+)
@@ -1,15 +1,16 @@
 from contextlib import asynccontextmanager
-import time
-from typing import AsyncIterator, Awaitable, Callable
+from typing import AsyncIterator
 
-from fastapi import FastAPI, Request, Response
+from fastapi import FastAPI, Request
 from fastapi.exception_handlers import request_validation_exception_handler
 from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.gzip import GZipMiddleware
 
+from app.kv import kv
 from app.logging import logger
 from app.routers import router
+from app.s3 import close_s3_client, open_s3_client
 from app.settings import get_settings
 
 
@@ -21,13 +22,14 @@ _SETTINGS = get_settings()
 @asynccontextmanager
 async def lifespan(app: FastAPI) -> AsyncIterator:
     # Startup
-    ...
+    await open_s3_client()
     
 	# Run
     yield
     
     # Shutdown
-    ...
+    await close_s3_client()
+    await kv.aclose()
 
 
 
@@ -66,19 +68,6 @@ app.add_middleware(
     allow_credentials=True,
     expose_headers=[''],
 )
-@app.middleware('http')
-async def uploding_time_counter(request: Request, call_next: Callable[[Request], Awaitable[Response]]) -> Response:
-    if "multipart/form-data" in request.headers.get("content-type", ""):
-        start = time.perf_counter()
-        body = await request.body() # 這是 uvicorn 把全部檔案丟給 FastAPI 的時間，不是上傳時間。
-        uploading_time_counter = time.perf_counter() - start
-        logger.debug(f"File upload tooks {uploading_time_counter:.3f} seconds")
-
-        request_headers: list[tuple[bytes]] = request.scope['headers']
-        request_headers.append((b'uploading-time-counter', str(uploading_time_counter).encode()))
-        return await call_next(Request(request.scope, {"type": "http.request", "body": body, "more_body": False}))
-    else:
-        return await call_next(request)
 
 
 
@@ -0,0 +1,144 @@
+from collections import defaultdict
+from contextlib import contextmanager
+from enum import StrEnum
+import time
+from typing import AsyncIterator, TypeVar
+
+from fastapi import Response
+from prometheus_client import Counter, Gauge, Histogram
+from pydantic import BaseModel
+from sqlalchemy import Engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+
+
+T = TypeVar('T')
+
+
+
+class UploadPhaseEnum(StrEnum):
+    RECEIVE = 'receive' # 等客戶端送來資料
+    S3 = 's3' # 等 S3 傳輸完成
+    DB_COMMIT = 'db_commit'
+    SERIALIZE = 'serialize'
+
+
+
+UPLOAD_PHASE_DURATION_SECONDS = Histogram(
+    'upload_phase_duration_seconds',
+    'Time spent in each phase of an upload request',
+    ['route', 'phase', 'size_bucket'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600),
+)
+
+
+
+DB_POOL_CHECKOUT_WAIT_SECONDS = Histogram(
+    'db_pool_checkout_wait_seconds',
+    'Time spent waiting for a connection from the pool, including opening a new one',
+    ['engine'],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+DB_POOL_CHECKOUT_TIMEOUTS = Counter(
+    'db_pool_checkout_timeouts',
+    'Checkouts that gave up after DB_POOL_TIMEOUT_SECOND because the pool was exhausted',
+    ['engine'],
+)
+DB_POOL_CONNECTIONS = Gauge(
+    'db_pool_connections',
+    'Connections held by the pool, by state (in_use: checked out, idle: waiting in the pool)',
+    ['engine', 'state'],
+)
+
+
+
+FILE_INFO_CACHE_REQUESTS = Counter(
+    'file_info_cache_requests',
+    'File info cache lookups by result (hit; miss: queried the database; coalesced: waited for a concurrent miss; error: Redis unavailable)',
+    ['result'],
+)
+USER_CACHE_REQUESTS = Counter(
+    'user_cache_requests',
+    'Requestor user cache lookups by result (hit; miss: queried the database; error: Redis unavailable, queried the database)',
+    ['result'],
+)
+
+
+def size_bucket(size_byte: int):
+    for label, limit in (('lt_1mib', 1024 ** 2), ('lt_10mib', 10 * 1024 ** 2), ('lt_100mib', 100 * 1024 ** 2)):
+        if size_byte < limit: return label
+    return 'ge_100mib'
+
+
+
+class UploadMetrics:
+    '''
+    累計單一上傳請求各階段所花之時間，請求結束時以請求之總位元組數分桶記入 histogram。
+
+    串流上傳之接收與 S3 傳輸是交錯進行的，receive 只算等客戶端之時間，s3 只算等 S3 而卡住接收之時間，
+    兩者分開看就知道慢在客戶端頻寬、物件儲存還是資料庫。
+    '''
+
+    def __init__(self, route: str):
+        self.route = route
+        self.size_byte = 0
+        self.durations: dict[UploadPhaseEnum, float] = defaultdict(float)
+
+
+    @contextmanager
+    def phase(self, phase: UploadPhaseEnum):
+        start = time.perf_counter()
+        try: yield
+        finally: self.durations[phase] += time.perf_counter() - start
+
+
+    async def receive(self, events: AsyncIterator[T]) -> AsyncIterator[T]:
+        '''包住客戶端資料之 async iterator，等下一筆資料之時間計入 receive。'''
+        while True:
+            with self.phase(UploadPhaseEnum.RECEIVE):
+                try: event = await anext(events)
+                except StopAsyncIteration: return
+            yield event
+
+
+    def serialize(self, model: BaseModel, status_code: int = 200):
+        '''自行序列化回應並計時；直接回傳 Response，FastAPI 便不會再序列化一次。'''
+        with self.phase(UploadPhaseEnum.SERIALIZE): content = model.model_dump_json()
+        self.observe()
+        return Response(content=content, status_code=status_code, media_type='application/json')
+
+
+    def observe(self):
+        bucket = size_bucket(self.size_byte)
+        for phase, duration in self.durations.items():
+            UPLOAD_PHASE_DURATION_SECONDS.labels(route=self.route, phase=phase, size_bucket=bucket).observe(duration)
+
+
+
+def timed_pool_class(pool_class: type[QueuePool], engine_name: str) -> type[QueuePool]:
+    '''
+    回傳會記錄取得連線等待時間之連線池類別。
+
+    SQLAlchemy 沒有「開始等連線」之事件，只能包住 _do_get；池中沒有閒置連線時，這段時間包含等別人歸還或開新連線，
+    p99 上升或出現 timeout 即表示 DB_POOL_SIZE + DB_MAX_OVERFLOW 不夠這個 worker 用。
+    '''
+
+    class TimedPool(pool_class):
+        def _do_get(self):
+            start = time.perf_counter()
+            try: return super()._do_get()
+            except PoolTimeoutError:
+                DB_POOL_CHECKOUT_TIMEOUTS.labels(engine=engine_name).inc()
+                raise
+            finally: DB_POOL_CHECKOUT_WAIT_SECONDS.labels(engine=engine_name).observe(time.perf_counter() - start)
+
+    TimedPool.__name__ = TimedPool.__qualname__ = f'Timed{pool_class.__name__}'
+    return TimedPool
+
+
+
+def observe_db_pool(engine: Engine, engine_name: str):
+    '''連線數於抓取指標時才向連線池查詢；engine.dispose() 後會換新的連線池，故每次都重新取 engine.pool。'''
+    DB_POOL_CONNECTIONS.labels(engine=engine_name, state='in_use').set_function(lambda: engine.pool.checkedout())
+    DB_POOL_CONNECTIONS.labels(engine=engine_name, state='idle').set_function(lambda: engine.pool.checkedin())
@@ -1,10 +1,11 @@
 from datetime import UTC, datetime, timedelta
+from enum import StrEnum
 from typing import Any, Literal
 from uuid import UUID
 
-from pydantic import AwareDatetime, BaseModel, ConfigDict, TypeAdapter
+from pydantic import AwareDatetime, BaseModel, ConfigDict, Field, HttpUrl, TypeAdapter
 
-from app.db import FcsFile, JobStatusEnum, JobTypeEnum
+from app.db import FcsFile, Job, JobStatusEnum, JobTypeEnum, StorageCodecEnum
 
 
 
@@ -34,18 +35,43 @@ class Token(BaseModel):
 
 
 
+_SHA256_PATTERN = '^[0-9a-f]{64}$'
+
+
+
 class UploadFileSetting(BaseModel):
     filename: str
     public: bool
+    sha256: str | None = Field(None, pattern=_SHA256_PATTERN) # 選填之內容雜湊（hex），內容已存在時不再寫入 S3。
 
 upload_file_setting_list_adapter = TypeAdapter(list[UploadFileSetting])
 
 
 
+class FileInfo(BaseModel):
+    file_idno: str
+    file_name: str
+    file_size_byte: int
+    public: bool
+    upload_time: AwareDatetime
+
+    model_config = ConfigDict(
+        json_schema_extra={
+            'examples': [{
+                "file_idno": "01K7Q22M2BEXAD9XZGT3JZV58V",
+                "file_name": "abc.fcs",
+                "file_size_byte": 12345,
+                'upload_time': "2025-10-16T18:00:00Z",
+            }],
+        }
+    )
+
+
+
 class UploadBatchResult(BaseModel):
     batch_idno: str
     upload_time: datetime
-    files: list[FcsFile]
+    files: list[FileInfo] # 只列檔案資訊；引用既有內容者之 S3 key 屬於他人批次，不對外。
     failed_files: list[dict] = []
 
     model_config = ConfigDict(
@@ -61,20 +87,244 @@ class UploadBatchResult(BaseModel):
 
 
 
-class FileInfo(BaseModel):
-    file_idno: str
-    file_name: str
-    file_size_byte: int
+class PresignedUploadFile(BaseModel):
+    filename: str
+    size_byte: int = Field(ge=0)
+    public: bool = True
+    sha256: str | None = Field(None, pattern=_SHA256_PATTERN) # 選填之內容雜湊（hex），內容已存在時不必上傳。
+
+    model_config = ConfigDict(json_schema_extra={
+        'examples': [{
+            'filename': 'abc.fcs',
+            'size_byte': 12345,
+            'public': True,
+            'sha256': None,
+        }],
+    })
+
+
+
+class PresignedUploadTarget(BaseModel):
+    filename: str
+    key: str
+    upload_url: str | None = None # 小檔：整個檔案 PUT 到此網址。
+    upload_id: str | None = None # 大檔：S3 multipart upload ID，依序將各段 PUT 到 part_urls。
+    part_size_byte: int | None = None
+    part_urls: list[str] = []
+    deduplicated: bool = False # 內容已存在：不必上傳，complete 時直接引用既有內容。
+
+    model_config = ConfigDict(json_schema_extra={
+        'examples': [{
+            'filename': 'abc.fcs',
+            'key': '01K7PXGBTMV8R5M3TZTJ79PSMF/abc.fcs',
+            'upload_url': 'https://s3.ap-northeast-1.amazonaws.com/ahead-fcs-files/01K7PXGBTMV8R5M3TZTJ79PSMF/abc.fcs?X-Amz-Signature=...',
+            'upload_id': None,
+            'part_size_byte': None,
+            'part_urls': [],
+            'deduplicated': False,
+        }],
+    })
+
+
+
+class PresignedUploadBatch(BaseModel):
+    batch_idno: str
+    expires_in_second: int
+    files: list[PresignedUploadTarget]
+
+    model_config = ConfigDict(json_schema_extra={
+        'examples': [{
+            'batch_idno': '01K7PXGBTMV8R5M3TZTJ79PSMF',
+            'expires_in_second': 3600,
+            'files': [],
+        }],
+    })
+
+
+
+class PresignedUploadSessionFile(PresignedUploadFile):
+    key: str
+    upload_id: str | None = None
+    deduplicated: bool = False
+
+
+
+class PresignedUploadSession(BaseModel):
+    '''直傳 S3 期間暫存於 Redis 之批次資訊，待 complete 時再寫入資料庫。'''
+    user_id: int | None
+    files: list[PresignedUploadSessionFile]
+
+
+
+class PresignedUploadPart(BaseModel):
+    part_number: int = Field(ge=1, le=10000)
+    etag: str
+
+
+
+class PresignedUploadCompletion(BaseModel):
+    filename: str
+    parts: list[PresignedUploadPart] = []
+
+    model_config = ConfigDict(json_schema_extra={
+        'examples': [{
+            'filename': 'abc.fcs',
+            'parts': [{'part_number': 1, 'etag': '"4c884a90dcf6e100b3f6253963853dde"'}],
+        }],
+    })
+
+
+
+class ResumableUploadCreate(BaseModel):
+    filename: str
+    size_byte: int = Field(ge=0)
+    public: bool = True
+    chunk_size_byte: int | None = Field(None, ge=5 * 1024 * 1024, le=64 * 1024 * 1024) # 除最後一塊外每塊之大小，S3 multipart 規定至少 5MiB；每塊於 API 緩衝，上限 64MiB。
+
+    model_config = ConfigDict(json_schema_extra={
+        'examples': [{
+            'filename': 'abc.fcs',
+            'size_byte': 524288000,
+            'public': True,
+            'chunk_size_byte': 8388608,
+        }],
+    })
+
+
+
+class ResumableUploadSession(BaseModel):
+    '''續傳期間暫存於 Redis 之上傳資訊，各塊之接收狀態另存於 chunks hash。'''
+    user_id: int | None
+    batch_idno: str
+    filename: str
+    size_byte: int
     public: bool
-    upload_time: AwareDatetime
+    chunk_size_byte: int
+    key: str
+    s3_upload_id: str
+
+
+
+class ResumableUploadChunk(BaseModel):
+    chunk_number: int
+    offset: int
+    size_byte: int
+    etag: str
+    sha256: str
+
+
+
+class ResumableUpload(BaseModel):
+    upload_id: str
+    filename: str
+    size_byte: int
+    chunk_size_byte: int
+    chunk_count: int
+    received_byte: int
+    received_chunks: list[ResumableUploadChunk]
+    missing_chunk_numbers: list[int]
+
+    model_config = ConfigDict(json_schema_extra={
+        'examples': [{
+            'upload_id': '01K7Q22M2BEXAD9XZGT3JZV58V',
+            'filename': 'abc.fcs',
+            'size_byte': 20971520,
+            'chunk_size_byte': 8388608,
+            'chunk_count': 3,
+            'received_byte': 8388608,
+            'received_chunks': [{'chunk_number': 1, 'offset': 0, 'size_byte': 8388608, 'etag': '"4c884a90dcf6e100b3f6253963853dde"', 'sha256': 'n4bQgYhMfWWaL+qgxVrQFaO/TxsrC4Is0V1sFbDwCgg='}],
+            'missing_chunk_numbers': [2, 3],
+        }],
+    })
+
+
+
+# 列表端點只查這些欄位，查詢結果直接對應到 FileInfo，不建 ORM 物件。
+FILE_INFO_COLUMNS = (FcsFile.file_idno, FcsFile.file_name, FcsFile.file_size_byte, FcsFile.public, FcsFile.upload_time)
+
+
+
+class CachedFileInfo(FileInfo):
+    '''快取於 Redis 之檔案資訊，另含權限檢查與簽下載網址所需之欄位，不直接回給客戶端。'''
+    s3_key: str | None
+    storage_codec: StorageCodecEnum
+    user_id: int | None
+
+CACHED_FILE_INFO_COLUMNS = (*FILE_INFO_COLUMNS, FcsFile.s3_key, FcsFile.storage_codec, FcsFile.user_id)
+
+
+
+class FileSortEnum(StrEnum):
+    UPLOAD_TIME = 'upload_time'
+    SIZE = 'size'
+
+
+
+class FileInfoPage(BaseModel):
+    items: list[FileInfo]
+    next_cursor: str | None = None # 沒有下一頁時為 None
 
     model_config = ConfigDict(
         json_schema_extra={
             'examples': [{
-                "file_idno": "01K7Q22M2BEXAD9XZGT3JZV58V",
-                "file_name": "abc.fcs",
-                "file_size_byte": 12345,
-                'upload_time': "2025-10-16T18:00:00Z",
+                "items": [{
+                    "file_idno": "01K7Q22M2BEXAD9XZGT3JZV58V",
+                    "file_name": "abc.fcs",
+                    "file_size_byte": 12345,
+                    "public": False,
+                    'upload_time': "2025-10-16T18:00:00Z",
+                }],
+                "next_cursor": "WyJ1cGxvYWRfdGltZSIsZmFsc2UsIjIwMjUtMTAtMTYgMTg6MDA6MDArMDA6MDAiLDFd",
+            }],
+        }
+    )
+
+
+
+class FcsSegment(BaseModel):
+    begin: int # 起訖皆含端點，可直接當作 Range: bytes={begin}-{end}
+    end: int
+
+
+
+class FcsSegments(BaseModel):
+    fcs_version: str
+    header: FcsSegment
+    text: FcsSegment
+    data: FcsSegment
+    analysis: FcsSegment | None
+
+    model_config = ConfigDict(
+        json_schema_extra={
+            'examples': [{
+                'fcs_version': '3.0',
+                'header': {'begin': 0, 'end': 57},
+                'text': {'begin': 58, 'end': 3457},
+                'data': {'begin': 3458, 'end': 2578857},
+                'analysis': None,
+            }],
+        }
+    )
+
+
+
+class FileDownloadUrl(BaseModel):
+    file_idno: str
+    download_url: HttpUrl
+
+
+
+class FileDownloadUrlBatch(BaseModel):
+    expires_in_second: int
+    files: list[FileDownloadUrl]
+    failed_files: list[dict] = []
+
+    model_config = ConfigDict(
+        json_schema_extra={
+            'examples': [{
+                'expires_in_second': 60,
+                'files': [{'file_idno': '01K7Q22M2BEXAD9XZGT3JZV58V', 'download_url': 'https://s3.ap-northeast-1.amazonaws.com/ahead-fcs-files/01K7PXGBTMV8R5M3TZTJ79PSMF/abc.fcs?X-Amz-Algorithm=AWS4-HMAC-SHA256'}],
+                'failed_files': [{'file_idno': '01K7Q22M2BEXAD9XZGT3JZV58W', 'error': 'File not found'}],
             }],
         }
     )
@@ -106,6 +356,33 @@ class JobRead(BaseModel):
 
 
 
+JOB_READ_COLUMNS = tuple(getattr(Job, name) for name in JobRead.model_fields)
+
+
+
+class JobReadPage(BaseModel):
+    items: list[JobRead]
+    next_cursor: str | None = None # 沒有下一頁時為 None
+
+    model_config = ConfigDict(
+        json_schema_extra={
+            'examples': [{
+                "items": [{
+                    "queue_job_id": "43f62c95-8b3d-43ce-9151-04000deb09e9",
+                    "job_type": JobTypeEnum.FILES_STAT,
+                    "job_args": {'user_id': 1},
+                    "job_working_duration_second": 0.01,
+                    'status': JobStatusEnum.FINISHED,
+                    "result": {"files_count": 2, "files_size_byte_sum": 123},
+                    "user_id": 1,
+                }],
+                "next_cursor": "WyJpZCIsZmFsc2UsMV0",
+            }],
+        }
+    )
+
+
+
 class FilesStat(BaseModel):
     files_count: int
     files_size_byte_sum: int
@@ -121,6 +398,36 @@ class FilesStat(BaseModel):
 
 
 
+class FilesStatBreakdownEnum(StrEnum):
+    BATCH = 'batch'
+    VISIBILITY = 'visibility'
+
+
+
+class FilesStatGroup(FilesStat):
+    batch_idno: str | None = None # 依批次細分時才有
+    public: bool | None = None # 依公開與否細分時才有
+
+
+
+class FilesStatReport(FilesStat):
+    groups: list[FilesStatGroup] = []
+
+    model_config = ConfigDict(
+        json_schema_extra={
+            'examples': [{
+                "files_count": 3,
+                "files_size_byte_sum": 223,
+                "groups": [
+                    {"batch_idno": "01K7PXGBTMV8R5M3TZTJ79PSMF", "public": True, "files_count": 2, "files_size_byte_sum": 123},
+                    {"batch_idno": "01K7PXGBTMV8R5M3TZTJ79PSMF", "public": False, "files_count": 1, "files_size_byte_sum": 100},
+                ],
+            }],
+        }
+    )
+
+
+
 class FilesStatJobRead(JobRead):
     result: FilesStat | None
 
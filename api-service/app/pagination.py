@@ -0,0 +1,70 @@
+import base64
+import json
+from typing import Any, Sequence
+
+from fastapi import HTTPException, Response, status
+from pydantic import TypeAdapter, ValidationError
+from pydantic_core import to_json
+from sqlalchemy import ColumnElement, Select, tuple_
+
+
+
+PAGE_LIMIT_DEFAULT = 100
+PAGE_LIMIT_MAX = 1000
+
+
+
+def encode_cursor(sort: str, descending: bool, values: Sequence[Any]):
+    '''游標為排序方式與最後一列之排序鍵，以 base64url 包裝；客戶端不應解讀其內容。'''
+    data = json.dumps([sort, descending, *values], default=str, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+
+
+def decode_cursor(cursor: str, sort: str, descending: bool, columns: Sequence[ColumnElement]):
+    '''還原排序鍵並依欄位型別轉回 Python 值；游標損壞或與這次之排序方式不符時回 400。'''
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if data[:2] != [sort, descending] or len(data) != 2 + len(columns): raise ValueError(cursor)
+        return [TypeAdapter(column.type.python_type).validate_python(value) for column, value in zip(columns, data[2:])]
+    except (ValueError, TypeError, ValidationError) as e:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, 'Invalid cursor') from e
+
+
+
+def paginate(
+    statement: Select, sort: str, sort_columns: Sequence[ColumnElement], cursor: str | None, limit: int, descending: bool = False,
+):
+    '''
+    Keyset 分頁：以 (排序欄, ..., id) 之列值比較接續上一頁，搭配同順序之索引，第 N 頁與第一頁一樣只讀 limit 列。
+
+    sort_columns 最後一欄須唯一（通常是 id），順序才穩定。多取一列用來判斷是否還有下一頁。
+    '''
+    if cursor is not None:
+        values = decode_cursor(cursor=cursor, sort=sort, descending=descending, columns=sort_columns)
+        keys = tuple_(*sort_columns)
+        statement = statement.where(keys < tuple_(*values) if descending else keys > tuple_(*values))
+    order_by = [column.desc() for column in sort_columns] if descending else list(sort_columns)
+    return statement.add_columns(*sort_columns).order_by(*order_by).limit(limit + 1)
+
+
+
+def split_page(rows: Sequence[Any], sort: str, sort_column_count: int, limit: int, descending: bool = False):
+    '''將 paginate() 之結果切成這一頁與 next_cursor；排序鍵附在每列之最後幾欄。'''
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(sort=sort, descending=descending, values=rows[-1][-sort_column_count:])
+    return rows, next_cursor
+
+
+
+def page_response(rows: Sequence[Any], columns: Sequence[ColumnElement], next_cursor: str | None):
+    '''
+    將一頁查詢結果直接序列化為 JSON 回應（pydantic-core，與 model_dump_json 同一套編碼），不逐列建立 Pydantic 物件；
+    直接回傳 Response，FastAPI 也不會再依回傳型別驗證、序列化一次，OpenAPI 文件仍依路由標注之回傳型別。
+    欄位依 columns 之名稱對應，須與回傳型別之欄位一致；列尾附加之排序鍵不輸出。
+    '''
+    keys = [column.key for column in columns]
+    content = to_json({'items': [dict(zip(keys, row)) for row in rows], 'next_cursor': next_cursor})
+    return Response(content=content, media_type='application/json')
@@ -0,0 +1,106 @@
+from collections import OrderedDict
+from datetime import UTC, datetime
+import hashlib
+import hmac
+import time
+from urllib.parse import quote, urlsplit
+
+from app.s3 import S3_BUCKET_NAME
+from app.settings import get_settings
+
+
+
+_SETTINGS = get_settings()
+_SIGV4_ALGORITHM = 'AWS4-HMAC-SHA256'
+
+
+
+def _hmac_sha256(key: bytes, message: str): return hmac.new(key, message.encode(), hashlib.sha256).digest()
+
+
+
+class DownloadUrlSigner:
+    '''
+    於本機以 SigV4 query 簽章產生 S3 GetObject 預簽網址，不經 botocore client，只需幾次 HMAC。
+
+    簽章金鑰只與日期、區域有關，每天算一次；已發出之網址依 (s3_key, public) 快取，剩餘效期不到 1/4 前都重複使用，
+    同一檔案被大量請求時幾乎不必再簽。網址格式為 path-style，與 aiobotocore client 連自訂 endpoint 時相同。
+
+    快取只在本 worker 內，invalidate 不會通知其他 worker；但發網址前都先檢查讀取權限，快取鍵又含 public，
+    檔案轉為私有後，其他 worker 留著之舊網址也不會發給無權讀取者。已發出之網址無法收回，效期最長為 expires_second。
+    '''
+
+    def __init__(
+        self,
+        endpoint_url: str = str(_SETTINGS.AWS_S3_ENDPOINT_URL),
+        region: str = _SETTINGS.AWS_DEFAULT_REGION,
+        access_key_id: str = _SETTINGS.AWS_ACCESS_KEY_ID,
+        secret_access_key: str = _SETTINGS.AWS_SECRET_ACCESS_KEY.get_secret_value(),
+        expires_second: int = _SETTINGS.S3_PRESIGNED_DOWNLOAD_EXPIRES_SECOND,
+        cache_size: int = _SETTINGS.S3_PRESIGNED_DOWNLOAD_CACHE_SIZE,
+    ):
+        endpoint = urlsplit(endpoint_url)
+        self.scheme = endpoint.scheme
+        self.host = endpoint.netloc
+        self.base_path = endpoint.path.rstrip('/')
+        self.region = region
+        self.access_key_id = access_key_id
+        self.expires_second = expires_second
+        self.cache_size = cache_size
+        self._secret_key = f'AWS4{secret_access_key}'.encode()
+        self._signing_key: tuple[str, bytes] | None = None # （日期, 簽章金鑰）
+        self._cache: OrderedDict[tuple[str, bool], tuple[float, str]] = OrderedDict() # (s3_key, public) -> （過期時間, 網址）
+
+
+    def _get_signing_key(self, date: str):
+        if self._signing_key is None or self._signing_key[0] != date:
+            key = self._secret_key
+            for message in (date, self.region, 's3', 'aws4_request'): key = _hmac_sha256(key, message)
+            self._signing_key = (date, key)
+        return self._signing_key[1]
+
+
+    def sign(self, s3_key: str, expires_second: int | None = None, now: float | None = None):
+        '''產生新的預簽網址，不經快取。'''
+        expires_second = expires_second or self.expires_second
+        timestamp = datetime.fromtimestamp(time.time() if now is None else now, UTC)
+        amz_date = timestamp.strftime('%Y%m%dT%H%M%SZ')
+        date = amz_date[:8]
+        scope = f'{date}/{self.region}/s3/aws4_request'
+
+        path = quote(f'{self.base_path}/{S3_BUCKET_NAME}/{s3_key}', safe='/~')
+        query = '&'.join(f'{quote(k, safe="-_.~")}={quote(v, safe="-_.~")}' for k, v in sorted({
+            'X-Amz-Algorithm': _SIGV4_ALGORITHM,
+            'X-Amz-Credential': f'{self.access_key_id}/{scope}',
+            'X-Amz-Date': amz_date,
+            'X-Amz-Expires': str(expires_second),
+            'X-Amz-SignedHeaders': 'host',
+        }.items()))
+        canonical_request = '\n'.join(('GET', path, query, f'host:{self.host}', '', 'host', 'UNSIGNED-PAYLOAD'))
+        string_to_sign = '\n'.join((_SIGV4_ALGORITHM, amz_date, scope, hashlib.sha256(canonical_request.encode()).hexdigest()))
+        signature = hmac.new(self._get_signing_key(date), string_to_sign.encode(), hashlib.sha256).hexdigest()
+        return f'{self.scheme}://{self.host}{path}?{query}&X-Amz-Signature={signature}'
+
+
+    def get_url(self, s3_key: str, public: bool):
+        '''取得快取之網址，快取中沒有或剩餘效期不到 1/4 時重新簽發。'''
+        now = time.time()
+        cache_key = (s3_key, public)
+        cached = self._cache.get(cache_key)
+        if cached and cached[0] - now >= self.expires_second / 4:
+            self._cache.move_to_end(cache_key)
+            return cached[1]
+        url = self.sign(s3_key=s3_key, now=now)
+        self._cache[cache_key] = (now + self.expires_second, url)
+        self._cache.move_to_end(cache_key)
+        while len(self._cache) > self.cache_size: self._cache.popitem(last=False)
+        return url
+
+
+    def invalidate(self, s3_key: str):
+        '''檔案公開與否異動或刪除並 commit 後呼叫；只清本 worker 之快取，已發出之網址仍於效期內有效。'''
+        for public in (True, False): self._cache.pop((s3_key, public), None)
+
+
+
+download_url_signer = DownloadUrlSigner()
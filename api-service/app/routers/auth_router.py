@@ -3,13 +3,15 @@ from typing import Annotated, Literal
 from fastapi import APIRouter, Body, Cookie, Depends, HTTPException, Request, Response, Security, status
 from fastapi.security import OAuth2PasswordRequestForm
 from pydantic import EmailStr
-from sqlmodel import Session, select
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app.auth import authenticate_account, decode_token, generate_token, get_requestor_user, password_hash
 from app.db import User, get_db_session
 from app.logging import logger
 from app.models import Token
 from app.settings import Settings, get_settings
+from app.user_cache import user_cache
 
 
 
@@ -20,10 +22,10 @@ router = APIRouter(prefix='/auth', tags=['auth'])
 @router.post('/send-verification-mail', operation_id='send_verification_mail')
 async def send_verification_mail(
     email: EmailStr,
-    db_session: Session = Depends(get_db_session),
+    db_session: AsyncSession = Depends(get_db_session),
     settings: Settings = Depends(get_settings),
 ) -> bool:
-    user = db_session.exec(select(User).where(User.username == email)).one_or_none()
+    user = (await db_session.exec(select(User).where(User.username == email))).one_or_none()
     if not user: return False
 
     _verification_code = generate_token(key=settings.JWT_KEY.get_secret_value(), sub=email, exp_hours=24)
@@ -37,16 +39,16 @@ async def send_verification_mail(
 async def sign_up(
     email: EmailStr = Body(embed=True),
     password: str = Body(embed=True, min_length=8),
-    db_session: Session = Depends(get_db_session),
+    db_session: AsyncSession = Depends(get_db_session),
     settings: Settings = Depends(get_settings),
 ) -> Literal[True]:
-    _existed = db_session.exec(select(User).where(User.username == email)).one_or_none()
+    _existed = (await db_session.exec(select(User).where(User.username == email))).one_or_none()
     if _existed: raise HTTPException(status.HTTP_409_CONFLICT)
 
     _hashed_password = password_hash.hash(password)
     user = User(username=email, hashed_password=_hashed_password, email_verified=False)
     db_session.add(user)
-    db_session.commit()
+    await db_session.commit()
     await send_verification_mail(email=user.username, db_session=db_session, settings=settings)
     return True
 
@@ -56,10 +58,10 @@ async def sign_up(
 async def verify_email(
     email: EmailStr = Body(embed=True),
     verification_code: str = Body(embed=True),
-    db_session: Session = Depends(get_db_session),
+    db_session: AsyncSession = Depends(get_db_session),
     settings: Settings = Depends(get_settings),
 ) -> bool:
-    user = db_session.exec(select(User).where(User.username == email)).one_or_none()
+    user = (await db_session.exec(select(User).where(User.username == email))).one_or_none()
     if not user: return False
 
     # 目前寄不了信，先不真的驗證。
@@ -69,7 +71,8 @@ async def verify_email(
 
     user.email_verified = True
     db_session.add(user)
-    db_session.commit()
+    await db_session.commit()
+    await user_cache.invalidate(user.username)
     return True
 
 
@@ -78,10 +81,10 @@ async def verify_email(
 async def sign_in(
     response: Response,
     form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
-    db_session: Session = Depends(get_db_session),
+    db_session: AsyncSession = Depends(get_db_session),
     settings: Settings = Depends(get_settings),
 ) -> Token:
-    _user = authenticate_account(username=form_data.username, password=form_data.password, db_session=db_session)
+    _user = await authenticate_account(username=form_data.username, password=form_data.password, db_session=db_session)
 
     # if not _user.email_verified: raise HTTPException(status.HTTP_403_FORBIDDEN, {'email_verified': _user.email_verified})
 
@@ -0,0 +1,80 @@
+import functools
+import pathlib
+
+from aiobotocore.client import AioBaseClient
+from fastapi import APIRouter, Depends, HTTPException, Security, status
+from fastapi.responses import StreamingResponse
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.archive import ZipEntry, ZipStream
+from app.auth import get_requestor_user
+from app.db import FcsFile, UploadBatch, User, fcs_file_readable_by, get_db_session
+from app.logging import logger
+from app.s3 import get_object_range, get_s3_client
+
+
+
+router = APIRouter(prefix='/batches', tags=['batch'])
+
+
+
+def _unique_name(name: str, used_names: set[str]):
+    '''ZIP 內檔名須唯一；同一批次之檔名上傳時已不重複，此處處理不同批次之同名檔案併入同一個 ZIP 者，改為 abc (1).fcs 之形式。'''
+    path = pathlib.PurePath(name)
+    unique_name = name
+    n = 0
+    while unique_name in used_names:
+        n += 1
+        unique_name = f'{path.stem} ({n}){path.suffix}'
+    used_names.add(unique_name)
+    return unique_name
+
+
+
+@router.get(
+    '/{batch_idno}/archive',
+    operation_id='download_batch_archive',
+    response_class=StreamingResponse,
+    responses={status.HTTP_200_OK: {'content': {'application/zip': {'schema': {'type': 'string', 'format': 'binary'}}}}},
+)
+async def download_batch_archive(
+    batch_idno: str,
+    db_session: AsyncSession = Depends(get_db_session),
+    user: User | None = Security(get_requestor_user),
+    s3_client: AioBaseClient = Depends(get_s3_client),
+):
+    '''
+    將整個上傳批次打包成一個 ZIP 下載，邊從 S3 讀邊輸出，不落地暫存檔。
+    只包含請求者讀得到之檔案（公開檔案或自己的檔案），一個都讀不到時回 404。
+    '''
+    batch = (await db_session.exec(select(UploadBatch).where(UploadBatch.batch_idno == batch_idno))).one_or_none()
+    if not batch: raise HTTPException(status.HTTP_404_NOT_FOUND)
+    files = (await db_session.exec(
+        select(FcsFile).where(FcsFile.upload_batch_id == batch.id).where(fcs_file_readable_by(user)).order_by(FcsFile.id)
+    )).all()
+    if not files: raise HTTPException(status.HTTP_404_NOT_FOUND)
+
+    used_names: set[str] = set()
+    archive = ZipStream([
+        ZipEntry(
+            name=_unique_name(name=f.file_name, used_names=used_names),
+            size_byte=f.file_size_byte,
+            modified_time=batch.upload_time,
+            open=functools.partial(
+                get_object_range, s3_client=s3_client, key=f.s3_key, codec=f.storage_codec, stored_size_byte=f.stored_size_byte,
+                start=0, end=f.file_size_byte - 1,
+            ),
+        )
+        for f in files
+    ])
+    if user: logger.info({'title': 'User downloading batch archive', 'username': user.username, 'batch_idno': batch_idno, 'file_count': len(files)})
+    return StreamingResponse(
+        archive,
+        media_type='application/zip',
+        headers={
+            'Content-Disposition': f'attachment; filename="{batch_idno}.zip"',
+            'Content-Length': str(archive.size_byte),
+            'Content-Encoding': 'identity', # 不讓 GZipMiddleware 再壓縮，Content-Length 才正確
+        },
+    )
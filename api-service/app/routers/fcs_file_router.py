@@ -1,14 +1,18 @@
-from uuid import UUID
+from uuid import UUID, uuid4
 
-from fastapi import APIRouter, Depends, HTTPException, Security, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, Security, status
 import rq
-from sqlmodel import Session, select
+from sqlalchemy.orm import joinedload
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app.auth import get_requestor_user
 from app.db import FcsFile, Job, JobStatusEnum, JobTypeEnum, User, get_db_session
+from app.etag import CACHE_CONTROL_IMMUTABLE, CACHE_CONTROL_REVALIDATE, NOT_MODIFIED_RESPONSES, check_not_modified, make_etag
 from app.job import queue
 from app.logging import logger
-from app.models import FcsInfoJobRead, JobRead
+from app.models import JOB_READ_COLUMNS, FcsInfo, FcsInfoJobRead, JobReadPage
+from app.pagination import PAGE_LIMIT_DEFAULT, PAGE_LIMIT_MAX, page_response, paginate, split_page
 
 
 
@@ -19,14 +23,38 @@ router = APIRouter(prefix='/fcs-files', tags=['fcs_file'])
 @router.post('/fcs-info-jobs/create', status_code=status.HTTP_201_CREATED, operation_id='create_fcs_info_job')
 async def create_fcs_info_job(
     file_idno: str,
-    db_session: Session = Depends(get_db_session),
+    db_session: AsyncSession = Depends(get_db_session),
     user: User | None = Security(get_requestor_user),
 ) -> UUID:
     if not user: raise HTTPException(status.HTTP_401_UNAUTHORIZED)
 
-    file = db_session.exec(select(FcsFile).where(FcsFile.file_idno == file_idno).where(FcsFile.user_id == user.id)).one_or_none()
+    statement = (
+        select(FcsFile).where(FcsFile.file_idno == file_idno).where(FcsFile.user_id == user.id)
+        .options(joinedload(FcsFile.fcs_metadata))
+    )
+    file = (await db_session.exec(statement)).one_or_none()
     if not file: raise HTTPException(status.HTTP_400_BAD_REQUEST, f'File {file_idno} not found')
 
+    # 上傳時已解析出 metadata 者直接由資料庫作答，不必排進佇列讓 worker 重新下載整個檔案。
+    if file.fcs_metadata:
+        result = FcsInfo(
+            file_name=file.file_name, file_size_byte=file.file_size_byte, file_upload_time=file.upload_time,
+            fcs_version=file.fcs_metadata.fcs_version, fcs_pnn_labels=file.fcs_metadata.pnn_labels, fcs_event_count=file.fcs_metadata.event_count,
+        )
+        job = Job(
+            queue_job_id=uuid4(),
+            job_type=JobTypeEnum.FCS_INFO,
+            job_args={'user_id': user.id, 'file_idno': file_idno},
+            job_working_duration_second=0,
+            status=JobStatusEnum.FINISHED,
+            result=result.model_dump(mode='json'),
+            user_id=user.id,
+        )
+        logger.info(f'User {user.username} created a FCS info job answered from stored metadata, job ID: {job.queue_job_id}')
+        db_session.add(job)
+        await db_session.commit()
+        return job.queue_job_id
+
     job = Job(
         job_type=JobTypeEnum.FCS_INFO,
         job_args={'user_id': user.id, 'file_idno': file_idno},
@@ -39,33 +67,53 @@ async def create_fcs_info_job(
     logger.info(f'Job {job.queue_job_id} is pending')
 
     db_session.add(job)
-    db_session.commit()
+    await db_session.commit()
     return job.queue_job_id
 
 
 
 @router.get('/fcs-info-jobs', operation_id='get_user_fcs_info_jobs')
 async def get_user_fcs_info_jobs(
+    after: str | None = None,
+    limit: int = Query(PAGE_LIMIT_DEFAULT, ge=1, le=PAGE_LIMIT_MAX),
+    descending: bool = False,
     user: User | None = Security(get_requestor_user),
-    db_session: Session = Depends(get_db_session),
-) -> list[JobRead]:
+    db_session: AsyncSession = Depends(get_db_session),
+) -> JobReadPage:
+    '''依建立順序分頁列出；下一頁以回應之 next_cursor 作為 after。'''
     if not user: raise HTTPException(status.HTTP_401_UNAUTHORIZED)
     
-    statement = select(Job).where(Job.user_id == user.id).where(Job.job_type == JobTypeEnum.FCS_INFO)
-    jobs = db_session.exec(statement).all()
-    return [JobRead.model_validate(j, from_attributes=True) for j in jobs]
+    statement = paginate(
+        select(*JOB_READ_COLUMNS).where(Job.user_id == user.id).where(Job.job_type == JobTypeEnum.FCS_INFO),
+        sort='id', sort_columns=(Job.id,), cursor=after, limit=limit, descending=descending,
+    )
+    rows, next_cursor = split_page(rows=(await db_session.exec(statement)).all(), sort='id', sort_column_count=1, limit=limit, descending=descending)
+    return page_response(rows=rows, columns=JOB_READ_COLUMNS, next_cursor=next_cursor)
     
 
 
-@router.get('/fcs-info-jobs/{job_id}', operation_id='get_user_fcs_info_job')
+@router.get('/fcs-info-jobs/{job_id}', operation_id='get_user_fcs_info_job', responses=NOT_MODIFIED_RESPONSES)
 async def get_user_fcs_info_job(
     job_id: UUID,
+    response: Response,
+    if_none_match: str | None = Header(None, alias='If-None-Match'),
     user: User | None = Security(get_requestor_user),
-    db_session: Session = Depends(get_db_session),
+    db_session: AsyncSession = Depends(get_db_session),
 ) -> FcsInfoJobRead:
+    '''
+    回應附 ETag，輪詢時帶上 If-None-Match，狀態未變即回 304，不含本體。
+    ETag 只由 job ID 與狀態算出：結果與耗時只在狀態轉為 FINISHED 時寫入，之後不再變動，故 FINISHED 者標為 immutable。
+    先只查 ID 與狀態比對，未變更者不必取出結果；不符時才取 JOB_READ_COLUMNS。
+    '''
     if not user: raise HTTPException(status.HTTP_401_UNAUTHORIZED)
 
-    statement = select(Job).where(Job.queue_job_id == job_id).where(Job.user_id == user.id).where(Job.job_type == JobTypeEnum.FCS_INFO)
-    job = db_session.exec(statement).one_or_none()
+    where = (Job.queue_job_id == job_id, Job.user_id == user.id, Job.job_type == JobTypeEnum.FCS_INFO)
+    version = (await db_session.exec(select(Job.queue_job_id, Job.status).where(*where))).one_or_none()
+    if not version: raise HTTPException(status.HTTP_404_NOT_FOUND)
+    cache_control = CACHE_CONTROL_IMMUTABLE if version.status == JobStatusEnum.FINISHED else CACHE_CONTROL_REVALIDATE
+    not_modified = check_not_modified(response=response, if_none_match=if_none_match, etag=make_etag(version.queue_job_id, version.status), cache_control=cache_control)
+    if not_modified: return not_modified
+
+    job = (await db_session.exec(select(*JOB_READ_COLUMNS).where(*where))).one_or_none()
     if not job: raise HTTPException(status.HTTP_404_NOT_FOUND)
     return FcsInfoJobRead.model_validate(job, from_attributes=True)
\ No newline at end of file
@@ -1,155 +1,504 @@
-import asyncio
 from datetime import UTC, datetime
+import functools
 import json
-import pathlib
-from typing import BinaryIO, Literal
+import math
+import re
+from typing import Literal
 
-from aiobotocore.session import get_session
+from aiobotocore.client import AioBaseClient
 from botocore.exceptions import BotoCoreError, ClientError
-from fastapi import APIRouter, Depends, Form, HTTPException, Request, Security, UploadFile, status
-from pathvalidate import ValidationError as FileNameValidationError, validate_filename
-from pydantic import HttpUrl, ValidationError
-from sqlmodel import Session, select
+from fastapi import APIRouter, Body, Depends, Header, HTTPException, Query, Request, Response, Security, status
+from fastapi.responses import StreamingResponse
+from pydantic import AwareDatetime, HttpUrl, ValidationError
+from redis.exceptions import RedisError
+from sqlalchemy import Select, delete, update
+from sqlalchemy.orm import joinedload
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from ulid import ULID
 
 from app.auth import get_requestor_user
-from app.db import FcsFile, UploadBatch, User, get_db_session
+from app.db import FcsBlob, FcsFile, StorageCodecEnum, UploadBatch, User, fcs_file_readable_by, get_db_session
+from app.etag import NOT_MODIFIED_RESPONSES, check_not_modified, make_etag
+from app.fcs import FCS_HEADER_SIZE_BYTE, FcsMetadataParser, read_fcs_metadata
+from app.file_cache import file_info_cache
+from app.files_stat import FilesStatDelta, update_files_stat
+from app.kv import kv
 from app.logging import logger
-from app.models import FileInfo, UploadBatchResult, upload_file_setting_list_adapter
+from app.metrics import UploadMetrics, UploadPhaseEnum
+from app.models import (
+    CACHED_FILE_INFO_COLUMNS, FILE_INFO_COLUMNS, CachedFileInfo, FcsSegment, FcsSegments, FileDownloadUrl, FileDownloadUrlBatch, FileInfo,
+    FileInfoPage, FileSortEnum, PresignedUploadBatch, PresignedUploadCompletion, PresignedUploadFile, PresignedUploadSession,
+    PresignedUploadSessionFile, PresignedUploadTarget, UploadBatchResult, UploadFileSetting, upload_file_setting_list_adapter,
+)
+from app.pagination import PAGE_LIMIT_DEFAULT, PAGE_LIMIT_MAX, page_response, paginate, split_page
+from app.presign import download_url_signer
+from app.s3 import S3_BUCKET_NAME, S3ExistingObject, S3MultipartUpload, UploadScheduler, delete_objects, get_object_range, get_s3_client
 from app.settings import get_settings
+from app.upload import (
+    FCS_FILE_MAX_SIZE_BYTE, MultipartEventEnum, MultipartPart, find_blob, get_blobs_metadata, register_upload_batch, stream_multipart,
+    validate_upload_filename,
+)
 
 
 
 _SETTINGS = get_settings()
-_S3_BUCKET_NAME = 'ahead-fcs-files'
+_UPLOAD_FILE_SETTINGS_MAX_SIZE_BYTE = 1024 * 1024
+_DOWNLOAD_URLS_MAX_FILE_COUNT = 1000
+_RANGE_PATTERN = re.compile(r'bytes=(\d*)-(\d*)')
 
 
 
-async def upload(filename: str, size_byte: int, key: str, body: bytes | BinaryIO, public: bool = True):
-    s3_session = get_session()
-    async with s3_session.create_client(
-        service_name='s3',
-        region_name=_SETTINGS.AWS_DEFAULT_REGION,
-        endpoint_url=str(_SETTINGS.AWS_S3_ENDPOINT_URL),
-        aws_access_key_id=_SETTINGS.AWS_ACCESS_KEY_ID,
-        aws_secret_access_key=_SETTINGS.AWS_SECRET_ACCESS_KEY.get_secret_value(),
-    ) as s3_client:
-        try:
-            s3_response: dict = await s3_client.put_object(Bucket=_S3_BUCKET_NAME, Key=key, Body=body, ContentType='application/octet-stream')
-            # logger.debug(s3_response)
-            '''
-            {'ResponseMetadata': {'HTTPStatusCode': 200, 'HTTPHeaders': {'date': 'Thu, 16 Oct 2025 14:45:04 GMT', 'content-type': 'text/plain;charset=UTF-8', 'content-length': '0', 'connection': 'keep-alive', 'etag': '"4c884a90dcf6e100b3f6253963853dde"', 'x-amz-checksum-crc32': 'GCi94w==', 'x-amz-version-id': '7e661284cdd47d843f625da7b730f3c9', 'vary': 'Accept-Encoding', 'server': 'cloudflare', 'cf-ray': '98f85655ddf9a9c2-TPE'}, 'RetryAttempts': 0}, 'ETag': '"4c884a90dcf6e100b3f6253963853dde"', 'ChecksumCRC32': 'GCi94w==', 'VersionId': '7e661284cdd47d843f625da7b730f3c9'}            
-            '''
-            return {'filename': filename, 'size_byte': size_byte, 'key': key, 'success': True, 'public': public}
-        except BotoCoreError as boto_error:
-            logger.error(boto_error)
-            return {'filename': filename, 'size_byte': size_byte, 'key': key, 'success': False, 'error': boto_error}
-        except ClientError as client_error:
-            logger.error(client_error)
-            return {'filename': filename, 'size_byte': size_byte, 'key': key, 'success': False, 'error': client_error}
+router = APIRouter(prefix='/files', tags=['file'])
 
 
 
-router = APIRouter(prefix='/files', tags=['file'])
+# 請求本體改由路由自行串流解析，表單欄位需另外寫進 OpenAPI 文件，Swagger UI 才有上傳欄位可用。
+_UPLOAD_FORM_OPENAPI = {'requestBody': {'required': True, 'content': {'multipart/form-data': {'schema': {
+    'type': 'object',
+    'required': ['upload_files'],
+    'properties': {
+        'upload_files': {'type': 'array', 'items': {'type': 'string', 'format': 'binary'}},
+        'upload_file_settings': {
+            'type': 'string',
+            'description': '須放在 upload_files 之前，所附之 sha256 才能於收檔前比對既有內容。',
+            'example': json.dumps([{'filename': 'file1.fcs', 'public': True}, {'filename': 'file2.fcs', 'public': False}]),
+        },
+    },
+}}}}}
+
+
+
+async def _get_readable_file(db_session: AsyncSession, file_idno: str, user: User | None, options: tuple = ()):
+    '''取得請求者讀得到之檔案：公開檔案或自己的檔案，其餘一律 404，不透露私有檔案存在與否。需要之關聯以 options 明確載入。'''
+    file = (await db_session.exec(select(FcsFile).where(FcsFile.file_idno == file_idno).options(*options))).one_or_none()
+    if not file or not _is_readable(file=file, user=user): raise HTTPException(status.HTTP_404_NOT_FOUND)
+    return file
+
+
+
+async def _get_readable_file_info(db_session: AsyncSession, file_idno: str, user: User | None):
+    '''同 _get_readable_file，但只取 CachedFileInfo 之欄位並經 Redis 快取，熱門之公開檔案不必每次查資料庫。'''
+    async def load():
+        row = (await db_session.exec(select(*CACHED_FILE_INFO_COLUMNS).where(FcsFile.file_idno == file_idno))).one_or_none()
+        return CachedFileInfo.model_validate(row, from_attributes=True) if row else None
+
+    file = await file_info_cache.get(file_idno=file_idno, load=load)
+    if not file or not _is_readable(file=file, user=user): raise HTTPException(status.HTTP_404_NOT_FOUND)
+    return file
+
+
+
+def _is_readable(file: FcsFile | CachedFileInfo, user: User | None):
+    '''公開檔案或自己的檔案；同 db.fcs_file_readable_by，但用於已取出之檔案。'''
+    return file.public or (user is not None and file.user_id == user.id)
+
+
+
+def _download_url(request: Request, file_idno: str, s3_key: str, public: bool, storage_codec: StorageCodecEnum):
+    '''S3 預簽網址；以 zstd 壓縮存放者 S3 上為壓縮後內容，改回經 API 解壓之 /files/{file_idno}/content，私有檔案取用時須附 token。'''
+    if storage_codec == StorageCodecEnum.ZSTD: return str(request.url_for('get_file_content', file_idno=file_idno))
+    return download_url_signer.get_url(s3_key=s3_key, public=public)
+
+
+
+def _parse_range(range_header: str, size_byte: int):
+    '''解析單一範圍之 Range 標頭，回傳含端點之 (start, end)；多重範圍或無法滿足者回 416。'''
+    match = _RANGE_PATTERN.fullmatch(range_header.strip())
+    unsatisfiable = HTTPException(status.HTTP_416_RANGE_NOT_SATISFIABLE, headers={'Content-Range': f'bytes */{size_byte}'})
+    if not match or match.groups() == ('', ''): raise unsatisfiable
+    first, last = match.groups()
+    if first: start, end = int(first), min(int(last), size_byte - 1) if last else size_byte - 1
+    else: start, end = max(size_byte - int(last), 0), size_byte - 1
+    if start > end: raise unsatisfiable
+    return start, end
+
+
+
+def _escape_like(value: str):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
 
 
 
-@router.post('/upload', status_code=status.HTTP_201_CREATED, operation_id='uplaod_fcs_files')
+async def _get_user_files_page(
+    db_session: AsyncSession, statement: Select, after: str | None, limit: int, sort: FileSortEnum, descending: bool,
+):
+    '''以 FILE_INFO_COLUMNS 之查詢分頁，依上傳時間或大小排序，同值再依 id。'''
+    sort_columns = (FcsFile.upload_time if sort == FileSortEnum.UPLOAD_TIME else FcsFile.file_size_byte, FcsFile.id)
+    statement = paginate(statement, sort=sort, sort_columns=sort_columns, cursor=after, limit=limit, descending=descending)
+    rows, next_cursor = split_page(
+        rows=(await db_session.exec(statement)).all(), sort=sort, sort_column_count=len(sort_columns), limit=limit, descending=descending,
+    )
+    return page_response(rows=rows, columns=FILE_INFO_COLUMNS, next_cursor=next_cursor)
+
+
+
+def _upload_progress_kv_key(user: User | None, progress_token: str):
+    return f'upload-progress:{user.id if user else "anonymous"}:{progress_token}'
+
+
+
+@router.post('/upload', status_code=status.HTTP_201_CREATED, operation_id='uplaod_fcs_files', openapi_extra=_UPLOAD_FORM_OPENAPI)
 async def upload_fcs_files(
     request: Request,
-    upload_files: list[UploadFile],
-    db_session: Session = Depends(get_db_session),
+    progress_token: str | None = Query(None, max_length=64, description='自訂之進度代號，上傳期間可用 /files/upload/progress/{progress_token} 查詢各檔案已送出之位元組數'),
+    db_session: AsyncSession = Depends(get_db_session),
     user: User | None = Security(get_requestor_user),
-    upload_file_settings: str | None = Form(None, json_schema_extra={'example': json.dumps([{'filename': 'file1.fcs', 'public': True}, {'filename': 'file2.fcs', 'public': False}]) }),
+    s3_client: AioBaseClient = Depends(get_s3_client),
 ) -> UploadBatchResult:
-    for f in upload_files:
-        if pathlib.Path(f.filename).suffix != '.fcs':
-            raise HTTPException(status.HTTP_403_FORBIDDEN, f"File '{f.filename}' is not a .fcs file")
-        if f.size > 1000 * 1024 * 1024:
-            raise HTTPException(status.HTTP_413_CONTENT_TOO_LARGE, f"File '{f.filename}' exceeds 1000MB")
-        try: validate_filename(f.filename)
-        except FileNameValidationError as e:
-            logger.warning({'title': 'Invalid uploading filename', 'error': e, 'filename': f.filename})
-            raise HTTPException(status.HTTP_403_FORBIDDEN, f"File name '{f.filename}' is invalid") from e
-    
-    if user:
-        if not upload_file_settings: raise HTTPException(status.HTTP_422_UNPROCESSABLE_CONTENT, 'For signed-in users, upload_file_settings is required.')
-        try: upload_file_setting_list = upload_file_setting_list_adapter.validate_json(upload_file_settings)
-        except ValidationError as e: raise HTTPException(status.HTTP_422_UNPROCESSABLE_CONTENT, {'title': 'Upload file settings validation error', 'detail': e.errors()})
-
-        for f in upload_files:
-            file_setting = next((setting for setting in upload_file_setting_list if setting.filename == f.filename), None)
-            if not file_setting: raise HTTPException(status.HTTP_422_UNPROCESSABLE_CONTENT, f'File {f.filename} setting is required')
-        logger.info({'title': 'User uploading files', 'files': [f.filename for f in upload_files]})
+    '''
+    邊收邊傳：multipart 表單之檔案資料一邊從客戶端讀入，一邊以 S3 multipart upload 分段送出，
+    每個請求持有之緩衝區數量受 UploadScheduler 限制，記憶體用量與檔案大小無關。
+
+    收檔同時解析 FCS HEADER 與 TEXT 段存為 metadata，並計算 SHA-256，內容已存在者共用既有 S3 物件；設定中附上 sha256 且內容已存在者，收檔時即不寫入 S3，收完再驗證雜湊。
+    '''
+    async def on_progress(name: str, sent_byte: int):
+        _kv_key = _upload_progress_kv_key(user=user, progress_token=progress_token)
+        try:
+            await kv.hset(_kv_key, name, sent_byte)
+            await kv.expire(_kv_key, 3600)
+        except RedisError as error: logger.warning({'title': 'Record upload progress failed', 'error': error})
+    scheduler = UploadScheduler(on_progress=on_progress if progress_token else None)
 
     batch = UploadBatch(batch_idno=str(ULID()), upload_time=datetime.now(UTC).replace(microsecond=0))
-    tasks = []
+    results: list[dict] = []
+    uploaded_keys: list[str] = []
+    metrics = UploadMetrics(route='/files/upload')
+    part: MultipartPart | None = None
+    file_result: dict | None = None
+    file_upload: S3MultipartUpload | S3ExistingObject | None = None
+    fcs_metadata_parser: FcsMetadataParser | None = None
+    upload_file_settings = bytearray()
+    upload_file_setting_list: list[UploadFileSetting] | None = None
+    try:
+        async for event, payload in metrics.receive(stream_multipart(request)):
+            if event == MultipartEventEnum.PART_BEGIN:
+                part = payload
+                if part.name != 'upload_files': continue
+                validate_upload_filename(part.filename)
+                # 同一批次之 key 以檔名區分，重複者在寫入 S3 前即拒絕，已傳完之檔案由下方清除。
+                if any(result['filename'] == part.filename for result in results):
+                    raise HTTPException(status.HTTP_422_UNPROCESSABLE_CONTENT, 'Duplicated filenames in one batch')
+                file_result = {'filename': part.filename, 'size_byte': 0, 'key': f'{batch.batch_idno}/{part.filename}', 'success': True}
+                file_setting = next((setting for setting in upload_file_setting_list or [] if setting.filename == part.filename), None)
+                blob = await find_blob(db_session=db_session, sha256=file_setting.sha256) if file_setting and file_setting.sha256 else None
+                if blob:
+                    file_result.update(key=blob.s3_key, deduplicated=True)
+                    file_upload = S3ExistingObject(key=blob.s3_key, codec=blob.storage_codec, stored_size_byte=blob.stored_size_byte)
+                else: file_upload = S3MultipartUpload(s3_client=s3_client, key=file_result['key'], scheduler=scheduler, name=part.filename)
+                fcs_metadata_parser = FcsMetadataParser()
+                results.append(file_result)
+
+            elif event == MultipartEventEnum.PART_DATA:
+                if part.name == 'upload_file_settings':
+                    upload_file_settings += payload
+                    if len(upload_file_settings) > _UPLOAD_FILE_SETTINGS_MAX_SIZE_BYTE:
+                        raise HTTPException(status.HTTP_413_CONTENT_TOO_LARGE, 'upload_file_settings is too large')
+                elif part.name == 'upload_files' and file_upload:
+                    if file_upload.size_byte + len(payload) > FCS_FILE_MAX_SIZE_BYTE:
+                        raise HTTPException(status.HTTP_413_CONTENT_TOO_LARGE, f"File '{part.filename}' exceeds 1000MB")
+                    fcs_metadata_parser.feed(payload)
+                    try:
+                        with metrics.phase(UploadPhaseEnum.S3): await file_upload.write(payload)
+                    except (BotoCoreError, ClientError) as error:
+                        logger.error(error)
+                        await file_upload.abort()
+                        file_upload = None
+                        file_result.update(success=False, error=error)
+
+            elif event == MultipartEventEnum.PART_END:
+                if part.name == 'upload_file_settings':
+                    try: upload_file_setting_list = upload_file_setting_list_adapter.validate_json(upload_file_settings)
+                    except ValidationError as e: raise HTTPException(status.HTTP_422_UNPROCESSABLE_CONTENT, {'title': 'Upload file settings validation error', 'detail': e.errors()})
+                elif part.name == 'upload_files' and file_upload:
+                    try:
+                        with metrics.phase(UploadPhaseEnum.S3): await file_upload.complete()
+                        fcs_metadata_parser.finish()
+                        file_result.update(
+                            size_byte=file_upload.size_byte, sha256=file_upload.sha256.hexdigest(), fcs_metadata=fcs_metadata_parser.metadata,
+                            storage_codec=file_upload.codec, stored_size_byte=file_upload.stored_size_byte,
+                        )
+                        if fcs_metadata_parser.error: logger.info({'title': 'FCS metadata not parsed', 'filename': part.filename, 'error': fcs_metadata_parser.error})
+                        if not file_result.get('deduplicated'): uploaded_keys.append(file_upload.key)
+                    except (BotoCoreError, ClientError) as error:
+                        logger.error(error)
+                        await file_upload.abort()
+                        file_result.update(success=False, error=error)
+                    file_upload = None
+                part = None
+
+        if not results: raise HTTPException(status.HTTP_422_UNPROCESSABLE_CONTENT, 'upload_files is required')
+
+        for result in results:
+            file_setting = next((setting for setting in upload_file_setting_list or [] if setting.filename == result['filename']), None)
+            if result['success'] and file_setting and file_setting.sha256 and file_setting.sha256 != result['sha256']:
+                # 宣告之雜湊與實際內容不符：去重複者未寫入任何東西，其餘之物件刪掉。
+                if not result.get('deduplicated'):
+                    await delete_objects(s3_client=s3_client, keys=[result['key']])
+                    uploaded_keys.remove(result['key'])
+                result.update(success=False, error='SHA-256 mismatch')
+
+        if user:
+            if upload_file_setting_list is None: raise HTTPException(status.HTTP_422_UNPROCESSABLE_CONTENT, 'For signed-in users, upload_file_settings is required.')
+
+            for result in results:
+                file_setting = next((setting for setting in upload_file_setting_list if setting.filename == result['filename']), None)
+                if not file_setting: raise HTTPException(status.HTTP_422_UNPROCESSABLE_CONTENT, f'File {result["filename"]} setting is required')
+                result['public'] = file_setting.public
+            logger.info({'title': 'User uploading files', 'files': [r['filename'] for r in results]})
+        else:
+            for result in results: result['public'] = True
+    except Exception:
+        # 驗證失敗或客戶端中斷時，清掉已送上 S3 之物件與未完成之分段。
+        if file_upload: await file_upload.abort()
+        await delete_objects(s3_client=s3_client, keys=uploaded_keys)
+        raise
+
+    metrics.size_byte = sum(r['size_byte'] for r in results)
+    response = await register_upload_batch(db_session=db_session, s3_client=s3_client, batch=batch, results=results, user=user, metrics=metrics)
+    return metrics.serialize(response, status_code=status.HTTP_201_CREATED)
+
+
+
+@router.post('/upload/presign', status_code=status.HTTP_201_CREATED, operation_id='presign_fcs_files_upload')
+async def presign_fcs_files_upload(
+    upload_files: list[PresignedUploadFile],
+    db_session: AsyncSession = Depends(get_db_session),
+    user: User | None = Security(get_requestor_user),
+    s3_client: AioBaseClient = Depends(get_s3_client),
+) -> PresignedUploadBatch:
+    '''
+    直傳模式第一步：發給每個檔案預簽之 PUT 網址（大檔則為 multipart 各段網址），檔案本體由客戶端直接送到 S3，不經過 API。
+    全部傳完後呼叫 /files/upload/{batch_idno}/complete 登記入庫。
+
+    附上 sha256 且內容已存在於請求者讀得到之檔案者標為 deduplicated，不發網址，complete 時直接引用既有內容。
+    '''
+    if not upload_files: raise HTTPException(status.HTTP_422_UNPROCESSABLE_CONTENT, 'upload_files is required')
     for f in upload_files:
-        if user: file_setting = next((setting for setting in upload_file_setting_list if setting.filename == f.filename))
-        key = f'{batch.batch_idno}/{f.filename}'
-        task = asyncio.create_task(upload(
-            filename=f.filename,
-            size_byte=f.size,
-            key=key,
-            body=f.file,
-            public=file_setting.public if user else True,
+        validate_upload_filename(f.filename)
+        if f.size_byte > FCS_FILE_MAX_SIZE_BYTE:
+            raise HTTPException(status.HTTP_413_CONTENT_TOO_LARGE, f"File '{f.filename}' exceeds 1000MB")
+    if len({f.filename for f in upload_files}) != len(upload_files):
+        raise HTTPException(status.HTTP_422_UNPROCESSABLE_CONTENT, 'Duplicated filenames in one batch')
+
+    batch_idno = str(ULID())
+    expires = _SETTINGS.S3_PRESIGNED_UPLOAD_EXPIRES_SECOND
+    part_size_byte = _SETTINGS.S3_MULTIPART_PART_SIZE_BYTE
+    targets: list[PresignedUploadTarget] = []
+    session_files: list[PresignedUploadSessionFile] = []
+    for f in upload_files:
+        key = f'{batch_idno}/{f.filename}'
+        blob = await find_blob(db_session=db_session, sha256=f.sha256, user=user, readable_only=True) if f.sha256 else None
+        if blob and blob.size_byte == f.size_byte:
+            targets.append(PresignedUploadTarget(filename=f.filename, key=blob.s3_key, deduplicated=True))
+            session_files.append(PresignedUploadSessionFile(
+                filename=f.filename, size_byte=f.size_byte, public=f.public if user else True, sha256=f.sha256, key=blob.s3_key, deduplicated=True,
+            ))
+            continue
+        if f.size_byte <= part_size_byte:
+            upload_url = await s3_client.generate_presigned_url('put_object', {'Bucket': S3_BUCKET_NAME, 'Key': key}, expires)
+            targets.append(PresignedUploadTarget(filename=f.filename, key=key, upload_url=upload_url))
+            upload_id = None
+        else:
+            response = await s3_client.create_multipart_upload(Bucket=S3_BUCKET_NAME, Key=key, ContentType='application/octet-stream')
+            upload_id: str = response['UploadId']
+            part_urls = [
+                await s3_client.generate_presigned_url(
+                    'upload_part', {'Bucket': S3_BUCKET_NAME, 'Key': key, 'UploadId': upload_id, 'PartNumber': n}, expires,
+                )
+                for n in range(1, math.ceil(f.size_byte / part_size_byte) + 1)
+            ]
+            targets.append(PresignedUploadTarget(filename=f.filename, key=key, upload_id=upload_id, part_size_byte=part_size_byte, part_urls=part_urls))
+        session_files.append(PresignedUploadSessionFile(
+            filename=f.filename, size_byte=f.size_byte, public=f.public if user else True, key=key, upload_id=upload_id,
         ))
-        tasks.append(task)
 
-    results: list[dict[str, str | bool]] = await asyncio.gather(*tasks)
-    failed_files: list[dict] = []
-    for result in results:
-        if not result['success']: failed_files.append({'filename': result['filename'], 'error': result['error']})
-        else:
-            fcs = FcsFile(
-                file_idno=str(ULID()),
-                file_name=result['filename'],
-                file_size_byte=result['size_byte'],
-                s3_key=result['key'],
-                public=result['public'],
-                user_id=user.id if user else None,
-                upload_batch_id=batch.id,
-            )
-            batch.files.append(fcs)
-    
-    db_session.add(batch)
-    db_session.commit()
-    db_session.refresh(batch)
+    upload_session = PresignedUploadSession(user_id=user.id if user else None, files=session_files)
+    await kv.set(f'presigned-upload:{batch_idno}', upload_session.model_dump_json(), ex=expires)
+    logger.info({'title': 'Presigned files upload', 'batch_idno': batch_idno, 'files': [f.filename for f in upload_files]})
+    return PresignedUploadBatch(batch_idno=batch_idno, expires_in_second=expires, files=targets)
 
-    response = UploadBatchResult.model_validate(batch, from_attributes=True)
-    response.files = batch.files
-    response.failed_files = failed_files
-    return response
+
+
+@router.post('/upload/{batch_idno}/complete', status_code=status.HTTP_201_CREATED, operation_id='complete_fcs_files_upload')
+async def complete_fcs_files_upload(
+    batch_idno: str,
+    completions: list[PresignedUploadCompletion] = Body([]),
+    db_session: AsyncSession = Depends(get_db_session),
+    user: User | None = Security(get_requestor_user),
+    s3_client: AioBaseClient = Depends(get_s3_client),
+) -> UploadBatchResult:
+    '''
+    直傳模式第二步：以 HEAD 確認各物件存在且大小相符、以 Range 讀取開頭解析 FCS metadata 後，建立 UploadBatch 與 FcsFile 紀錄。
+    引用既有內容者不讀 S3，直接複製既有檔案之 metadata。
+    '''
+    _kv_key = f'presigned-upload:{batch_idno}'
+    upload_session_json: str | None = await kv.get(_kv_key)
+    if not upload_session_json: raise HTTPException(status.HTTP_404_NOT_FOUND)
+    upload_session = PresignedUploadSession.model_validate_json(upload_session_json)
+    if upload_session.user_id != (user.id if user else None): raise HTTPException(status.HTTP_404_NOT_FOUND)
+
+    completion_dict = {c.filename: c for c in completions}
+    for f in upload_session.files:
+        if f.upload_id and not (f.filename in completion_dict and completion_dict[f.filename].parts):
+            raise HTTPException(status.HTTP_422_UNPROCESSABLE_CONTENT, f'Parts of file {f.filename} are required')
+
+    # 刪除成功者才繼續，避免同一批次被重複登記。
+    if not await kv.delete(_kv_key): raise HTTPException(status.HTTP_409_CONFLICT, f'Batch {batch_idno} is completing')
+
+    # 引用既有內容者複製既有之 metadata；session 不能並行使用，於排程前一次查完。
+    blobs_metadata = await get_blobs_metadata(db_session=db_session, sha256s={f.sha256 for f in upload_session.files if f.deduplicated})
+
+    async def finalize(f: PresignedUploadSessionFile):
+        if f.deduplicated:
+            blob, fcs_metadata = blobs_metadata.get(f.sha256, (None, None))
+            if fcs_metadata or not blob: return f.size_byte, fcs_metadata
+            return f.size_byte, await read_fcs_metadata(
+                s3_client=s3_client, key=blob.s3_key, size_byte=blob.size_byte, codec=blob.storage_codec, stored_size_byte=blob.stored_size_byte,
+            )
+        if f.upload_id:
+            parts = sorted(completion_dict[f.filename].parts, key=lambda p: p.part_number)
+            await s3_client.complete_multipart_upload(
+                Bucket=S3_BUCKET_NAME, Key=f.key, UploadId=f.upload_id,
+                MultipartUpload={'Parts': [{'PartNumber': p.part_number, 'ETag': p.etag} for p in parts]},
+            )
+        head: dict = await s3_client.head_object(Bucket=S3_BUCKET_NAME, Key=f.key)
+        return head['ContentLength'], await read_fcs_metadata(s3_client=s3_client, key=f.key, size_byte=head['ContentLength'])
+
+    metrics = UploadMetrics(route='/files/upload/{batch_idno}/complete')
+    metrics.size_byte = sum(f.size_byte for f in upload_session.files)
+    scheduler = UploadScheduler()
+    session_files = sorted(upload_session.files, key=lambda f: f.size_byte, reverse=True) # 大檔先做
+    futures = [await scheduler.submit(name=f.filename, size_byte=f.size_byte, work=functools.partial(finalize, f)) for f in session_files]
+
+    batch = UploadBatch(batch_idno=batch_idno, upload_time=datetime.now(UTC).replace(microsecond=0))
+    results: list[dict] = []
+    for f, future in zip(session_files, futures):
+        result = {'filename': f.filename, 'size_byte': f.size_byte, 'key': f.key, 'public': f.public, 'success': True}
+        # 伺服器沒看過直傳之內容，只有引用既有內容者才以雜湊登記，未驗證之雜湊不進 blob 表。
+        if f.deduplicated: result.update(sha256=f.sha256, deduplicated=True)
+        results.append(result)
+        try:
+            with metrics.phase(UploadPhaseEnum.S3): content_length, fcs_metadata = await future
+        except (BotoCoreError, ClientError) as error:
+            logger.error(error)
+            if f.upload_id:
+                try: await s3_client.abort_multipart_upload(Bucket=S3_BUCKET_NAME, Key=f.key, UploadId=f.upload_id)
+                except (BotoCoreError, ClientError) as abort_error: logger.error(abort_error)
+            result.update(success=False, error=error)
+            continue
+        if content_length != f.size_byte:
+            await delete_objects(s3_client=s3_client, keys=[f.key])
+            result.update(success=False, error=f'Size mismatch, expected {f.size_byte} bytes but got {content_length} bytes')
+        else: result['fcs_metadata'] = fcs_metadata
+
+    response = await register_upload_batch(db_session=db_session, s3_client=s3_client, batch=batch, results=results, user=user, metrics=metrics)
+    return metrics.serialize(response, status_code=status.HTTP_201_CREATED)
+
+
+
+@router.get('/upload/progress/{progress_token}', operation_id='get_upload_progress')
+async def get_upload_progress(
+    progress_token: str,
+    user: User | None = Security(get_requestor_user),
+) -> dict[str, int]:
+    '''串流上傳期間各檔案已送出至 S3 之位元組數。'''
+    progress: dict[str, str] = await kv.hgetall(_upload_progress_kv_key(user=user, progress_token=progress_token))
+    if not progress: raise HTTPException(status.HTTP_404_NOT_FOUND)
+    return {name: int(sent_byte) for name, sent_byte in progress.items()}
 
 
 
 @router.get('/mine', operation_id='get_user_files_info')
 async def get_user_files_info(
+    after: str | None = None,
+    limit: int = Query(PAGE_LIMIT_DEFAULT, ge=1, le=PAGE_LIMIT_MAX),
+    sort: FileSortEnum = FileSortEnum.UPLOAD_TIME,
+    descending: bool = False,
+    user: User | None = Security(get_requestor_user),
+    db_session: AsyncSession = Depends(get_db_session),
+) -> FileInfoPage:
+    '''分頁列出自己的檔案；下一頁以回應之 next_cursor 作為 after，排序方式須與取得游標時相同。'''
+    if not user: raise HTTPException(status.HTTP_401_UNAUTHORIZED)
+
+    return await _get_user_files_page(
+        db_session=db_session, statement=select(*FILE_INFO_COLUMNS).where(FcsFile.user_id == user.id),
+        after=after, limit=limit, sort=sort, descending=descending,
+    )
+
+
+
+@router.get('/search', operation_id='search_user_files')
+async def search_user_files(
+    name: str | None = Query(None, min_length=1, max_length=255, description='檔名包含此字串，不分大小寫'),
+    name_prefix: str | None = Query(None, min_length=1, max_length=255, description='檔名以此字串開頭，不分大小寫'),
+    min_size_byte: int | None = Query(None, ge=0),
+    max_size_byte: int | None = Query(None, ge=0),
+    uploaded_after: AwareDatetime | None = Query(None, description='含此時間'),
+    uploaded_before: AwareDatetime | None = Query(None, description='不含此時間'),
+    public: bool | None = None,
+    batch_idno: str | None = None,
+    after: str | None = None,
+    limit: int = Query(PAGE_LIMIT_DEFAULT, ge=1, le=PAGE_LIMIT_MAX),
+    sort: FileSortEnum = FileSortEnum.UPLOAD_TIME,
+    descending: bool = False,
     user: User | None = Security(get_requestor_user),
-    db_session: Session = Depends(get_db_session),
-) -> list[FileInfo]:
+    db_session: AsyncSession = Depends(get_db_session),
+) -> FileInfoPage:
+    '''
+    於自己的檔案中依條件搜尋，條件皆為選填且同時成立；分頁方式同 /files/mine。
+    檔名以 pg_trgm 之 GIN 索引比對（至少三個字元才用得上），大小與上傳時間走 (user_id, 排序欄, id) 之索引。
+    '''
     if not user: raise HTTPException(status.HTTP_401_UNAUTHORIZED)
 
-    files = db_session.exec(select(FcsFile).where(FcsFile.user_id == user.id)).all()
-    return [FileInfo(file_idno=f.file_idno, file_name=f.file_name, file_size_byte=f.file_size_byte, public=f.public, upload_time=f.upload_batch.upload_time) for f in files]
+    statement = select(*FILE_INFO_COLUMNS).where(FcsFile.user_id == user.id)
+    if name: statement = statement.where(FcsFile.file_name.ilike(f'%{_escape_like(name)}%', escape='\\'))
+    if name_prefix: statement = statement.where(FcsFile.file_name.ilike(f'{_escape_like(name_prefix)}%', escape='\\'))
+    if min_size_byte is not None: statement = statement.where(FcsFile.file_size_byte >= min_size_byte)
+    if max_size_byte is not None: statement = statement.where(FcsFile.file_size_byte <= max_size_byte)
+    if uploaded_after: statement = statement.where(FcsFile.upload_time >= uploaded_after)
+    if uploaded_before: statement = statement.where(FcsFile.upload_time < uploaded_before)
+    if public is not None: statement = statement.where(FcsFile.public == public)
+    if batch_idno: statement = statement.where(FcsFile.upload_batch_id == select(UploadBatch.id).where(UploadBatch.batch_idno == batch_idno).scalar_subquery())
+    return await _get_user_files_page(db_session=db_session, statement=statement, after=after, limit=limit, sort=sort, descending=descending)
+
+
+
+async def _set_user_file_public(db_session: AsyncSession, file_idno: str, user: User, public: bool):
+    '''
+    以 UPDATE ... RETURNING 改變公開與否，並於同一交易內把計數自原狀態移到新狀態。
+    條件含原狀態，並行之相同請求只有一個改得到，計數不會重複移動；已是該狀態者不變，仍回傳檔名。
+    '''
+    statement = (
+        update(FcsFile).where(FcsFile.file_idno == file_idno).where(FcsFile.user_id == user.id).where(FcsFile.public != public)
+        .values(public=public).returning(FcsFile.file_name, FcsFile.file_size_byte, FcsFile.upload_batch_id, FcsFile.s3_key)
+    )
+    file = (await db_session.exec(statement)).one_or_none()
+    if file:
+        await update_files_stat(db_session=db_session, deltas=[
+            FilesStatDelta(user.id, file.upload_batch_id, not public, -1, -file.file_size_byte),
+            FilesStatDelta(user.id, file.upload_batch_id, public, 1, file.file_size_byte),
+        ])
+        await db_session.commit()
+        await file_info_cache.invalidate(file_idno)
+        if file.s3_key: download_url_signer.invalidate(file.s3_key) # 本 worker 已簽之網址不再發出
+        return file.file_name
+    file_name = (await db_session.exec(select(FcsFile.file_name).where(FcsFile.file_idno == file_idno).where(FcsFile.user_id == user.id))).one_or_none()
+    if not file_name: raise HTTPException(status.HTTP_404_NOT_FOUND)
+    return file_name
 
 
 
 @router.post('/mine/{file_idno}/make-public', operation_id='make_user_file_public')
 async def make_user_file_public(
     file_idno: str,
-    db_session: Session = Depends(get_db_session),
+    db_session: AsyncSession = Depends(get_db_session),
     user: User | None = Security(get_requestor_user),
 ) -> Literal[True]:
     if not user: raise HTTPException(status.HTTP_401_UNAUTHORIZED)
     
-    file = db_session.exec(select(FcsFile).where(FcsFile.file_idno == file_idno).where(FcsFile.user_id == user.id)).one_or_none()
-    if not file: raise HTTPException(status.HTTP_404_NOT_FOUND)
-    
-    file.public = True
-    db_session.add(file)
-    db_session.commit()
-    logger.info(f'User {user.username} is making file {file.file_name} public')
+    file_name = await _set_user_file_public(db_session=db_session, file_idno=file_idno, user=user, public=True)
+    logger.info(f'User {user.username} is making file {file_name} public')
     return True
 
 
@@ -157,64 +506,185 @@ async def make_user_file_public(
 @router.post('/mine/{file_idno}/make-private', operation_id='make_user_file_private')
 async def make_user_file_private(
     file_idno: str,
-    db_session: Session = Depends(get_db_session),
+    db_session: AsyncSession = Depends(get_db_session),
     user: User | None = Security(get_requestor_user),
 ) -> Literal[True]:
     if not user: raise HTTPException(status.HTTP_401_UNAUTHORIZED)
     
-    file = db_session.exec(select(FcsFile).where(FcsFile.file_idno == file_idno).where(FcsFile.user_id == user.id)).one_or_none()
-    if not file: raise HTTPException(status.HTTP_404_NOT_FOUND)
-    
-    file.public = False
-    db_session.add(file)
-    db_session.commit()
-    logger.info(f'User {user.username} is making file {file.file_name} private')
+    file_name = await _set_user_file_public(db_session=db_session, file_idno=file_idno, user=user, public=False)
+    logger.info(f'User {user.username} is making file {file_name} private')
     return True
 
 
 
-@router.get('/{file_idno}', operation_id='get_file_info')
-async def get_file_info(
+@router.delete('/mine/{file_idno}', operation_id='delete_user_file')
+async def delete_user_file(
     file_idno: str,
-    db_session: Session = Depends(get_db_session),
+    db_session: AsyncSession = Depends(get_db_session),
+    s3_client: AioBaseClient = Depends(get_s3_client),
     user: User | None = Security(get_requestor_user),
-) -> FileInfo:
-    file = db_session.exec(select(FcsFile).where(FcsFile.file_idno == file_idno)).one_or_none()
+) -> Literal[True]:
+    '''
+    刪除自己的檔案，metadata 一併刪除，計數於同一交易內扣除。
+    內容共用 blob 者遞減 ref_count，歸零才刪除 blob 與 S3 物件；S3 物件於 commit 後才刪，刪除失敗只記 log，不影響回應。
+    '''
+    if not user: raise HTTPException(status.HTTP_401_UNAUTHORIZED)
+
+    statement = (
+        delete(FcsFile).where(FcsFile.file_idno == file_idno).where(FcsFile.user_id == user.id)
+        .returning(FcsFile.file_name, FcsFile.file_size_byte, FcsFile.public, FcsFile.upload_batch_id, FcsFile.s3_key, FcsFile.blob_id)
+    )
+    file = (await db_session.exec(statement)).one_or_none()
     if not file: raise HTTPException(status.HTTP_404_NOT_FOUND)
+    await update_files_stat(db_session=db_session, deltas=[FilesStatDelta(user.id, file.upload_batch_id, file.public, -1, -file.file_size_byte)])
+
+    unreferenced_keys = [file.s3_key] if file.s3_key and file.blob_id is None else []
+    if file.blob_id is not None:
+        blob = (await db_session.exec(
+            update(FcsBlob).where(FcsBlob.id == file.blob_id).values(ref_count=FcsBlob.ref_count - 1).returning(FcsBlob.ref_count, FcsBlob.s3_key)
+        )).one()
+        # 歸零與刪除在同一交易且持有列鎖。登記時以 ON CONFLICT 加引用或以 FOR SHARE 鎖住引用之 blob，
+        # 本交易 commit 前之登記會等待，之後之登記查不到此 blob，S3 物件於 commit 後刪除不會影響任何引用。
+        if blob.ref_count <= 0:
+            await db_session.exec(delete(FcsBlob).where(FcsBlob.id == file.blob_id))
+            unreferenced_keys.append(blob.s3_key)
+    await db_session.commit()
+    await file_info_cache.invalidate(file_idno)
+    if file.s3_key: download_url_signer.invalidate(file.s3_key)
+    logger.info(f'User {user.username} deleted file {file.file_name}')
+
+    await delete_objects(s3_client=s3_client, keys=unreferenced_keys)
+    return True
+
 
-    # Check if the file is private
-    if not file.public:
-        if not user: raise HTTPException(status.HTTP_404_NOT_FOUND)
-        if file.user_id != user.id: raise HTTPException(status.HTTP_404_NOT_FOUND)
 
-    batch = file.upload_batch
-    return FileInfo(file_idno=file.file_idno, file_name=file.file_name, file_size_byte=file.file_size_byte, public=file.public, upload_time=batch.upload_time)
+@router.get('/{file_idno}', operation_id='get_file_info', responses=NOT_MODIFIED_RESPONSES)
+async def get_file_info(
+    file_idno: str,
+    response: Response,
+    if_none_match: str | None = Header(None, alias='If-None-Match'),
+    db_session: AsyncSession = Depends(get_db_session),
+    user: User | None = Security(get_requestor_user),
+) -> FileInfo:
+    '''回應附 ETag；檔案資訊中只有公開與否會變，ETag 由 file_idno 與公開與否算出，帶 If-None-Match 且相符時回 304。'''
+    file = await _get_readable_file_info(db_session=db_session, file_idno=file_idno, user=user)
+    not_modified = check_not_modified(response=response, if_none_match=if_none_match, etag=make_etag(file.file_idno, file.public))
+    if not_modified: return not_modified
+    return FileInfo.model_validate(file, from_attributes=True)
 
 
 
 @router.get('/{file_idno}/generate-download-url', status_code=status.HTTP_201_CREATED, operation_id='generate_download_url')
 async def generate_download_url(
     file_idno: str,
-    db_session: Session = Depends(get_db_session),
+    request: Request,
+    db_session: AsyncSession = Depends(get_db_session),
     user: User | None = Security(get_requestor_user),
 ) -> HttpUrl:
-    file = db_session.exec(select(FcsFile).where(FcsFile.file_idno == file_idno)).one_or_none()
-    if not file: raise HTTPException(status.HTTP_404_NOT_FOUND)
-
-    # Check if the file is private
-    if not file.public:
-        if not user: raise HTTPException(status.HTTP_404_NOT_FOUND)
-        if file.user_id != user.id: raise HTTPException(status.HTTP_404_NOT_FOUND)
+    '''
+    網址於本機簽發，依檔案與公開與否快取，效期由 S3_PRESIGNED_DOWNLOAD_EXPIRES_SECOND 設定；檔案資訊亦經快取，熱門連結不查資料庫。
+    以 zstd 壓縮存放之檔案回傳 /files/{file_idno}/content，由 API 解壓後提供。
+    '''
+    file = await _get_readable_file_info(db_session=db_session, file_idno=file_idno, user=user)
 
     if user: logger.info(f'User {user.username} is downloading file {file.s3_key}')
 
-    s3_session = get_session()
-    async with s3_session.create_client(
-        service_name='s3',
-        region_name=_SETTINGS.AWS_DEFAULT_REGION,
-        endpoint_url=str(_SETTINGS.AWS_S3_ENDPOINT_URL),
-        aws_access_key_id=_SETTINGS.AWS_ACCESS_KEY_ID,
-        aws_secret_access_key=_SETTINGS.AWS_SECRET_ACCESS_KEY.get_secret_value(),
-    ) as s3_client:
-        return await s3_client.generate_presigned_url('get_object', {'Bucket': _S3_BUCKET_NAME, 'Key': file.s3_key}, 60) # 一分鐘過期
-    
+    return _download_url(request=request, file_idno=file.file_idno, s3_key=file.s3_key, public=file.public, storage_codec=file.storage_codec)
+
+
+
+
+@router.post('/download-urls', status_code=status.HTTP_201_CREATED, operation_id='generate_download_urls')
+async def generate_download_urls(
+    request: Request,
+    file_idnos: list[str] = Body(min_length=1, max_length=_DOWNLOAD_URLS_MAX_FILE_COUNT),
+    db_session: AsyncSession = Depends(get_db_session),
+    user: User | None = Security(get_requestor_user),
+) -> FileDownloadUrlBatch:
+    '''
+    一次取得多個檔案之下載網址：以一個 IN 查詢同時取出所有檔案並檢查權限，網址於本機一次簽完；zstd 壓縮存放者同單檔，回傳 /content。
+    不存在或無權讀取之檔案列於 failed_files，不影響其他檔案。
+    '''
+    file_idnos = list(dict.fromkeys(file_idnos))
+    rows = (await db_session.exec(
+        select(FcsFile.file_idno, FcsFile.s3_key, FcsFile.public, FcsFile.storage_codec).where(FcsFile.file_idno.in_(file_idnos)).where(fcs_file_readable_by(user))
+    )).all()
+    row_dict = {row.file_idno: row for row in rows}
+
+    files: list[FileDownloadUrl] = []
+    failed_files: list[dict] = []
+    for file_idno in file_idnos:
+        if row := row_dict.get(file_idno): files.append(FileDownloadUrl(file_idno=file_idno, download_url=_download_url(
+            request=request, file_idno=file_idno, s3_key=row.s3_key, public=row.public, storage_codec=row.storage_codec,
+        )))
+        else: failed_files.append({'file_idno': file_idno, 'error': 'File not found'})
+    if user: logger.info({'title': 'User downloading files', 'username': user.username, 'file_count': len(files)})
+    return FileDownloadUrlBatch(expires_in_second=download_url_signer.expires_second, files=files, failed_files=failed_files)
+
+
+
+@router.get(
+    '/{file_idno}/content',
+    operation_id='get_file_content',
+    response_class=StreamingResponse,
+    responses={
+        status.HTTP_200_OK: {'content': {'application/octet-stream': {'schema': {'type': 'string', 'format': 'binary'}}}},
+        status.HTTP_206_PARTIAL_CONTENT: {'content': {'application/octet-stream': {'schema': {'type': 'string', 'format': 'binary'}}}},
+    },
+)
+async def get_file_content(
+    file_idno: str,
+    range_header: str | None = Header(None, alias='Range', description='單一範圍，例如 `bytes=0-57` 或 `bytes=-1024`'),
+    db_session: AsyncSession = Depends(get_db_session),
+    user: User | None = Security(get_requestor_user),
+    s3_client: AioBaseClient = Depends(get_s3_client),
+):
+    '''
+    經 API 讀取檔案內容，支援 HTTP Range，邊從 S3 讀邊回傳，不在伺服器緩衝整個範圍。
+    只需要 TEXT 段或部分 DATA 段者，可先以 /files/{file_idno}/content/segments 取得各段位置再指定 Range。
+    '''
+    file = await _get_readable_file(db_session=db_session, file_idno=file_idno, user=user)
+    # 標明 identity，GZipMiddleware 便不會再壓縮，Content-Length 與 Content-Range 才對得上實際位元組。
+    headers = {'Accept-Ranges': 'bytes', 'Content-Encoding': 'identity'}
+    if file.file_size_byte == 0:
+        if range_header: raise HTTPException(status.HTTP_416_RANGE_NOT_SATISFIABLE, headers={'Content-Range': 'bytes */0'})
+        return Response(headers=headers, media_type='application/octet-stream')
+
+    start, end = _parse_range(range_header=range_header, size_byte=file.file_size_byte) if range_header else (0, file.file_size_byte - 1)
+    try:
+        content = await get_object_range(
+            s3_client=s3_client, key=file.s3_key, codec=file.storage_codec, stored_size_byte=file.stored_size_byte, start=start, end=end,
+        )
+    except (BotoCoreError, ClientError, ValueError) as error:
+        logger.error({'title': 'Read file content failed', 'key': file.s3_key, 'error': error})
+        raise HTTPException(status.HTTP_502_BAD_GATEWAY, f'File {file_idno} content is not available') from error
+
+    headers['Content-Length'] = str(end - start + 1)
+    if range_header: headers['Content-Range'] = f'bytes {start}-{end}/{file.file_size_byte}'
+    return StreamingResponse(
+        content, status_code=status.HTTP_206_PARTIAL_CONTENT if range_header else status.HTTP_200_OK,
+        headers=headers, media_type='application/octet-stream',
+    )
+
+
+
+@router.get('/{file_idno}/content/segments', operation_id='get_file_content_segments')
+async def get_file_content_segments(
+    file_idno: str,
+    db_session: AsyncSession = Depends(get_db_session),
+    user: User | None = Security(get_requestor_user),
+    s3_client: AioBaseClient = Depends(get_s3_client),
+) -> FcsSegments:
+    '''FCS 各段之位元組位置（含端點），供 /files/{file_idno}/content 指定 Range。上傳時未解析出 metadata 者，改以 Range 讀取開頭當場解析。'''
+    file = await _get_readable_file(db_session=db_session, file_idno=file_idno, user=user, options=(joinedload(FcsFile.fcs_metadata),))
+    fcs_metadata = file.fcs_metadata or await read_fcs_metadata(
+        s3_client=s3_client, key=file.s3_key, size_byte=file.file_size_byte, codec=file.storage_codec, stored_size_byte=file.stored_size_byte,
+    )
+    if not fcs_metadata: raise HTTPException(status.HTTP_422_UNPROCESSABLE_CONTENT, f'File {file_idno} is not a valid FCS file')
+    return FcsSegments(
+        fcs_version=fcs_metadata.fcs_version,
+        header=FcsSegment(begin=0, end=FCS_HEADER_SIZE_BYTE - 1),
+        text=FcsSegment(begin=fcs_metadata.text_begin, end=fcs_metadata.text_end),
+        data=FcsSegment(begin=fcs_metadata.data_begin, end=fcs_metadata.data_end),
+        analysis=FcsSegment(begin=fcs_metadata.analysis_begin, end=fcs_metadata.analysis_end) if fcs_metadata.analysis_end else None,
+    )
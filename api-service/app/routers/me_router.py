@@ -1,14 +1,16 @@
 from uuid import UUID, uuid4
 
-from fastapi import APIRouter, Depends, HTTPException, Security, status
-import rq
-from sqlmodel import Session, select
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, Security, status
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app.auth import get_requestor_user
 from app.db import Job, JobStatusEnum, JobTypeEnum, User, get_db_session
-from app.job import queue
+from app.etag import CACHE_CONTROL_IMMUTABLE, CACHE_CONTROL_REVALIDATE, NOT_MODIFIED_RESPONSES, check_not_modified, make_etag
+from app.files_stat import get_files_stat
 from app.logging import logger
-from app.models import FilesStatJobRead, JobRead
+from app.models import JOB_READ_COLUMNS, FilesStat, FilesStatBreakdownEnum, FilesStatJobRead, FilesStatReport, JobReadPage
+from app.pagination import PAGE_LIMIT_DEFAULT, PAGE_LIMIT_MAX, page_response, paginate, split_page
 
 
 
@@ -16,54 +18,89 @@ router = APIRouter(prefix='/me', tags=['me'])
 
 
 
+@router.get('/files/stat', operation_id='get_user_files_stat')
+async def get_user_files_stat(
+    breakdown: list[FilesStatBreakdownEnum] = Query([]),
+    user: User | None = Security(get_requestor_user),
+    db_session: AsyncSession = Depends(get_db_session),
+) -> FilesStatReport:
+    '''
+    即時回傳自己的檔案數與總大小，由上傳、公開與否異動與刪除時累加之計數作答，不經 job queue，耗時不隨檔案數增加。
+    breakdown 可指定 batch 與 visibility（可同時），依上傳批次或公開與否細分於 groups。
+    '''
+    if not user: raise HTTPException(status.HTTP_401_UNAUTHORIZED)
+    return await get_files_stat(db_session=db_session, user_id=user.id, breakdown=breakdown)
+
+
+
 @router.post('/files/stat-jobs/create', status_code=status.HTTP_201_CREATED, operation_id='create_state_job')
 async def create_state_job(
-    db_session: Session = Depends(get_db_session),
+    db_session: AsyncSession = Depends(get_db_session),
     user: User | None = Security(get_requestor_user),
 ) -> UUID:
+    '''保留給既有之客戶端：由計數直接作答，建立時即為 FINISHED，不排進佇列；新客戶端請改用 GET /me/files/stat。'''
     if not user: raise HTTPException(status.HTTP_401_UNAUTHORIZED)
 
+    result = await get_files_stat(db_session=db_session, user_id=user.id)
     job = Job(
+        queue_job_id=uuid4(),
         job_type=JobTypeEnum.FILES_STAT,
         job_args={'user_id': user.id},
-        status=JobStatusEnum.PENDING,
+        job_working_duration_second=0,
+        status=JobStatusEnum.FINISHED,
+        result=FilesStat.model_validate(result, from_attributes=True).model_dump(),
         user_id=user.id,
     )
-    queue_job: rq.job.Job = queue.enqueue(f='jobs.main.do_files_stat', **job.job_args) # Enqueue the job and get a UUID from job queue
-    job.queue_job_id = queue_job.id
-    logger.info(f'User {user.username} created a files stat job, queue job ID: {job.queue_job_id}')
-    logger.info(f'Job {job.queue_job_id} is pending')
-
+    logger.info(f'User {user.username} created a files stat job answered from stored counters, job ID: {job.queue_job_id}')
     db_session.add(job)
-    db_session.commit()
+    await db_session.commit()
     return job.queue_job_id
-    
 
 
 
 @router.get('/files/stat-jobs', operation_id='get_user_files_stat_jobs')
 async def get_user_files_stat_jobs(
+    after: str | None = None,
+    limit: int = Query(PAGE_LIMIT_DEFAULT, ge=1, le=PAGE_LIMIT_MAX),
+    descending: bool = False,
     user: User | None = Security(get_requestor_user),
-    db_session: Session = Depends(get_db_session),
-) -> list[JobRead]:
+    db_session: AsyncSession = Depends(get_db_session),
+) -> JobReadPage:
+    '''依建立順序分頁列出；下一頁以回應之 next_cursor 作為 after。'''
     if not user: raise HTTPException(status.HTTP_401_UNAUTHORIZED)
     
-    statement = select(Job).where(Job.user_id == user.id).where(Job.job_type == JobTypeEnum.FILES_STAT)
-    jobs = db_session.exec(statement).all()
-    return [JobRead.model_validate(j, from_attributes=True) for j in jobs]
+    statement = paginate(
+        select(*JOB_READ_COLUMNS).where(Job.user_id == user.id).where(Job.job_type == JobTypeEnum.FILES_STAT),
+        sort='id', sort_columns=(Job.id,), cursor=after, limit=limit, descending=descending,
+    )
+    rows, next_cursor = split_page(rows=(await db_session.exec(statement)).all(), sort='id', sort_column_count=1, limit=limit, descending=descending)
+    return page_response(rows=rows, columns=JOB_READ_COLUMNS, next_cursor=next_cursor)
     
 
 
 
-@router.get('/files/stat-jobs/{job_id}', operation_id='get_user_files_stat_job')
+@router.get('/files/stat-jobs/{job_id}', operation_id='get_user_files_stat_job', responses=NOT_MODIFIED_RESPONSES)
 async def get_user_files_stat_job(
     job_id: UUID,
+    response: Response,
+    if_none_match: str | None = Header(None, alias='If-None-Match'),
     user: User | None = Security(get_requestor_user),
-    db_session: Session = Depends(get_db_session),
+    db_session: AsyncSession = Depends(get_db_session),
 ) -> FilesStatJobRead:
+    '''
+    回應附 ETag，輪詢時帶上 If-None-Match，狀態未變即回 304，不含本體。
+    ETag 只由 job ID 與狀態算出：結果與耗時只在狀態轉為 FINISHED 時寫入，之後不再變動，故 FINISHED 者標為 immutable。
+    先只查 ID 與狀態比對，未變更者不必取出結果；不符時才取 JOB_READ_COLUMNS。
+    '''
     if not user: raise HTTPException(status.HTTP_401_UNAUTHORIZED)
 
-    statement = select(Job).where(Job.queue_job_id == job_id).where(Job.user_id == user.id).where(Job.job_type == JobTypeEnum.FILES_STAT)
-    job = db_session.exec(statement).one_or_none()
+    where = (Job.queue_job_id == job_id, Job.user_id == user.id, Job.job_type == JobTypeEnum.FILES_STAT)
+    version = (await db_session.exec(select(Job.queue_job_id, Job.status).where(*where))).one_or_none()
+    if not version: raise HTTPException(status.HTTP_404_NOT_FOUND)
+    cache_control = CACHE_CONTROL_IMMUTABLE if version.status == JobStatusEnum.FINISHED else CACHE_CONTROL_REVALIDATE
+    not_modified = check_not_modified(response=response, if_none_match=if_none_match, etag=make_etag(version.queue_job_id, version.status), cache_control=cache_control)
+    if not_modified: return not_modified
+
+    job = (await db_session.exec(select(*JOB_READ_COLUMNS).where(*where))).one_or_none()
     if not job: raise HTTPException(status.HTTP_404_NOT_FOUND)
     return FilesStatJobRead.model_validate(job, from_attributes=True)
@@ -0,0 +1,230 @@
+import base64
+from datetime import UTC, datetime
+import hashlib
+import math
+
+from aiobotocore.client import AioBaseClient
+from botocore.exceptions import BotoCoreError, ClientError
+from fastapi import APIRouter, Depends, Header, HTTPException, Path, Request, Security, status
+from sqlmodel.ext.asyncio.session import AsyncSession
+from ulid import ULID
+
+from app.auth import get_requestor_user
+from app.db import UploadBatch, User, get_db_session
+from app.fcs import read_fcs_metadata
+from app.kv import kv
+from app.logging import logger
+from app.metrics import UploadMetrics, UploadPhaseEnum
+from app.models import ResumableUpload, ResumableUploadChunk, ResumableUploadCreate, ResumableUploadSession, UploadBatchResult
+from app.s3 import S3_BUCKET_NAME, UploadScheduler, delete_objects, get_s3_client
+from app.settings import get_settings
+from app.upload import FCS_FILE_MAX_SIZE_BYTE, register_upload_batch, validate_upload_filename
+
+
+
+_SETTINGS = get_settings()
+
+
+
+def _session_kv_key(upload_id: str): return f'resumable-upload:{upload_id}'
+def _chunks_kv_key(upload_id: str): return f'resumable-upload:{upload_id}:chunks'
+
+
+
+async def _get_upload_session(upload_id: str, user: User | None):
+    upload_session_json: str | None = await kv.get(_session_kv_key(upload_id))
+    if not upload_session_json: raise HTTPException(status.HTTP_404_NOT_FOUND)
+    upload_session = ResumableUploadSession.model_validate_json(upload_session_json)
+    if upload_session.user_id != (user.id if user else None): raise HTTPException(status.HTTP_404_NOT_FOUND)
+    return upload_session
+
+
+
+async def _get_upload_status(upload_id: str, upload_session: ResumableUploadSession):
+    chunk_json_dict: dict[str, str] = await kv.hgetall(_chunks_kv_key(upload_id))
+    chunks = sorted((ResumableUploadChunk.model_validate_json(c) for c in chunk_json_dict.values()), key=lambda c: c.chunk_number)
+    chunk_count = max(1, math.ceil(upload_session.size_byte / upload_session.chunk_size_byte))
+    received_numbers = {c.chunk_number for c in chunks}
+    return ResumableUpload(
+        upload_id=upload_id,
+        filename=upload_session.filename,
+        size_byte=upload_session.size_byte,
+        chunk_size_byte=upload_session.chunk_size_byte,
+        chunk_count=chunk_count,
+        received_byte=sum(c.size_byte for c in chunks),
+        received_chunks=chunks,
+        missing_chunk_numbers=[n for n in range(1, chunk_count + 1) if n not in received_numbers],
+    )
+
+
+
+router = APIRouter(prefix='/files/resumable-uploads', tags=['file'])
+
+
+
+@router.post('', status_code=status.HTTP_201_CREATED, operation_id='create_resumable_upload')
+async def create_resumable_upload(
+    upload_file: ResumableUploadCreate,
+    user: User | None = Security(get_requestor_user),
+    s3_client: AioBaseClient = Depends(get_s3_client),
+) -> ResumableUpload:
+    '''
+    可續傳上傳：先建立上傳 session，再逐塊 PATCH，斷線後以 GET 查詢缺哪幾塊，只補傳缺的部分，最後 complete 登記入庫。
+    各塊直接成為 S3 multipart upload 之一段，接收狀態存於 Redis。
+    '''
+    validate_upload_filename(upload_file.filename)
+    if upload_file.size_byte > FCS_FILE_MAX_SIZE_BYTE:
+        raise HTTPException(status.HTTP_413_CONTENT_TOO_LARGE, f"File '{upload_file.filename}' exceeds 1000MB")
+
+    upload_id = str(ULID())
+    batch_idno = str(ULID())
+    key = f'{batch_idno}/{upload_file.filename}'
+    response = await s3_client.create_multipart_upload(Bucket=S3_BUCKET_NAME, Key=key, ContentType='application/octet-stream')
+    upload_session = ResumableUploadSession(
+        user_id=user.id if user else None,
+        batch_idno=batch_idno,
+        filename=upload_file.filename,
+        size_byte=upload_file.size_byte,
+        public=upload_file.public if user else True,
+        chunk_size_byte=upload_file.chunk_size_byte or _SETTINGS.S3_MULTIPART_PART_SIZE_BYTE,
+        key=key,
+        s3_upload_id=response['UploadId'],
+    )
+    await kv.set(_session_kv_key(upload_id), upload_session.model_dump_json(), ex=_SETTINGS.RESUMABLE_UPLOAD_EXPIRES_SECOND)
+    logger.info({'title': 'Resumable upload created', 'upload_id': upload_id, 'filename': upload_file.filename})
+    return await _get_upload_status(upload_id=upload_id, upload_session=upload_session)
+
+
+
+@router.get('/{upload_id}', operation_id='get_resumable_upload')
+async def get_resumable_upload(
+    upload_id: str,
+    user: User | None = Security(get_requestor_user),
+) -> ResumableUpload:
+    upload_session = await _get_upload_session(upload_id=upload_id, user=user)
+    return await _get_upload_status(upload_id=upload_id, upload_session=upload_session)
+
+
+
+@router.patch(
+    '/{upload_id}/chunks/{chunk_number}',
+    operation_id='upload_resumable_upload_chunk',
+    openapi_extra={'requestBody': {'required': True, 'content': {'application/octet-stream': {'schema': {'type': 'string', 'format': 'binary'}}}}},
+)
+async def upload_resumable_upload_chunk(
+    request: Request,
+    upload_id: str,
+    chunk_number: int = Path(ge=1, le=10000),
+    upload_checksum: str = Header(description='本塊之 SHA-256，格式同 tus checksum 擴充：`sha256 <base64>`'),
+    user: User | None = Security(get_requestor_user),
+    s3_client: AioBaseClient = Depends(get_s3_client),
+) -> ResumableUpload:
+    upload_session = await _get_upload_session(upload_id=upload_id, user=user)
+
+    chunk_count = max(1, math.ceil(upload_session.size_byte / upload_session.chunk_size_byte))
+    if chunk_number > chunk_count: raise HTTPException(status.HTTP_422_UNPROCESSABLE_CONTENT, f'Chunk number must be less than or equal to {chunk_count}')
+    offset = (chunk_number - 1) * upload_session.chunk_size_byte
+    expected_size_byte = min(upload_session.chunk_size_byte, upload_session.size_byte - offset)
+
+    algorithm, _, expected_digest = upload_checksum.partition(' ')
+    if algorithm.lower() != 'sha256': raise HTTPException(status.HTTP_400_BAD_REQUEST, 'Only sha256 checksum is supported')
+
+    # 本塊整個緩衝後才送 S3，宣告之長度已超過者不讀 body，讀取中超過者亦立即中止。
+    content_length = request.headers.get('Content-Length', '')
+    if content_length.isdigit() and int(content_length) > expected_size_byte:
+        raise HTTPException(status.HTTP_413_CONTENT_TOO_LARGE, f'Chunk {chunk_number} must be {expected_size_byte} bytes')
+    metrics = UploadMetrics(route='/files/resumable-uploads/{upload_id}/chunks/{chunk_number}')
+    metrics.size_byte = expected_size_byte
+    body = bytearray()
+    sha256 = hashlib.sha256()
+    async for data in metrics.receive(request.stream()):
+        body += data
+        sha256.update(data)
+        if len(body) > expected_size_byte: raise HTTPException(status.HTTP_413_CONTENT_TOO_LARGE, f'Chunk {chunk_number} must be {expected_size_byte} bytes')
+    if len(body) != expected_size_byte: raise HTTPException(status.HTTP_422_UNPROCESSABLE_CONTENT, f'Chunk {chunk_number} must be {expected_size_byte} bytes')
+    digest = base64.b64encode(sha256.digest()).decode()
+    if digest != expected_digest: raise HTTPException(status.HTTP_400_BAD_REQUEST, f'Chunk {chunk_number} checksum mismatch')
+
+    async def upload_part():
+        return await s3_client.upload_part(
+            Bucket=S3_BUCKET_NAME, Key=upload_session.key, PartNumber=chunk_number, UploadId=upload_session.s3_upload_id, Body=bytes(body),
+        )
+    try:
+        with metrics.phase(UploadPhaseEnum.S3): response = await (await UploadScheduler().submit(name=upload_session.filename, size_byte=len(body), work=upload_part))
+    except (BotoCoreError, ClientError) as error:
+        logger.error(error)
+        raise HTTPException(status.HTTP_502_BAD_GATEWAY, f'Chunk {chunk_number} upload failed') from error
+
+    chunk = ResumableUploadChunk(chunk_number=chunk_number, offset=offset, size_byte=len(body), etag=response['ETag'], sha256=digest)
+    await kv.hset(_chunks_kv_key(upload_id), str(chunk_number), chunk.model_dump_json())
+    await kv.expire(_chunks_kv_key(upload_id), _SETTINGS.RESUMABLE_UPLOAD_EXPIRES_SECOND)
+    await kv.expire(_session_kv_key(upload_id), _SETTINGS.RESUMABLE_UPLOAD_EXPIRES_SECOND)
+    return metrics.serialize(await _get_upload_status(upload_id=upload_id, upload_session=upload_session))
+
+
+
+@router.post('/{upload_id}/complete', status_code=status.HTTP_201_CREATED, operation_id='complete_resumable_upload')
+async def complete_resumable_upload(
+    upload_id: str,
+    db_session: AsyncSession = Depends(get_db_session),
+    user: User | None = Security(get_requestor_user),
+    s3_client: AioBaseClient = Depends(get_s3_client),
+) -> UploadBatchResult:
+    upload_session = await _get_upload_session(upload_id=upload_id, user=user)
+    upload_status = await _get_upload_status(upload_id=upload_id, upload_session=upload_session)
+    if upload_status.missing_chunk_numbers:
+        raise HTTPException(status.HTTP_409_CONFLICT, {'message': 'Chunks are missing', 'missing_chunk_numbers': upload_status.missing_chunk_numbers})
+
+    # 刪除成功者才繼續，避免同一上傳被重複登記。
+    if not await kv.delete(_session_kv_key(upload_id)): raise HTTPException(status.HTTP_409_CONFLICT, f'Upload {upload_id} is completing')
+    metrics = UploadMetrics(route='/files/resumable-uploads/{upload_id}/complete')
+    metrics.size_byte = upload_session.size_byte
+    try:
+        with metrics.phase(UploadPhaseEnum.S3): await s3_client.complete_multipart_upload(
+            Bucket=S3_BUCKET_NAME, Key=upload_session.key, UploadId=upload_session.s3_upload_id,
+            MultipartUpload={'Parts': [{'PartNumber': c.chunk_number, 'ETag': c.etag} for c in upload_status.received_chunks]},
+        )
+    except (BotoCoreError, ClientError) as error:
+        logger.error(error)
+        # 放回 session，讓客戶端可以重試 complete。
+        await kv.set(_session_kv_key(upload_id), upload_session.model_dump_json(), ex=_SETTINGS.RESUMABLE_UPLOAD_EXPIRES_SECOND)
+        raise HTTPException(status.HTTP_502_BAD_GATEWAY, f'Upload {upload_id} complete failed') from error
+    await kv.delete(_chunks_kv_key(upload_id))
+
+    batch = UploadBatch(batch_idno=upload_session.batch_idno, upload_time=datetime.now(UTC).replace(microsecond=0))
+    with metrics.phase(UploadPhaseEnum.S3): fcs_metadata = await read_fcs_metadata(s3_client=s3_client, key=upload_session.key, size_byte=upload_session.size_byte)
+    result = {
+        'filename': upload_session.filename, 'size_byte': upload_session.size_byte, 'key': upload_session.key,
+        'public': upload_session.public, 'success': True, 'fcs_metadata': fcs_metadata,
+    }
+    logger.info({'title': 'Resumable upload completed', 'upload_id': upload_id, 'filename': upload_session.filename})
+    try: response = await register_upload_batch(db_session=db_session, s3_client=s3_client, batch=batch, results=[result], user=user, metrics=metrics)
+    except Exception:
+        # session 已刪除，登記失敗時無從重試，刪掉已組好之物件以免無人引用。
+        await delete_objects(s3_client=s3_client, keys=[upload_session.key])
+        raise
+    return metrics.serialize(response, status_code=status.HTTP_201_CREATED)
+
+
+
+@router.delete('/{upload_id}', status_code=status.HTTP_204_NO_CONTENT, operation_id='abort_resumable_upload')
+async def abort_resumable_upload(
+    upload_id: str,
+    user: User | None = Security(get_requestor_user),
+    s3_client: AioBaseClient = Depends(get_s3_client),
+):
+    '''
+    放棄上傳，中止 S3 multipart upload 並釋放已傳之各塊。
+    客戶端沒有呼叫本端點而 session 過期者，各塊留在 S3，由 bucket 之 AbortIncompleteMultipartUpload 生命週期規則清除。
+    '''
+    upload_session = await _get_upload_session(upload_id=upload_id, user=user)
+    # 刪除成功者才繼續，避免與 complete 同時進行。
+    if not await kv.delete(_session_kv_key(upload_id)): raise HTTPException(status.HTTP_409_CONFLICT, f'Upload {upload_id} is completing')
+    try: await s3_client.abort_multipart_upload(Bucket=S3_BUCKET_NAME, Key=upload_session.key, UploadId=upload_session.s3_upload_id)
+    except (BotoCoreError, ClientError) as error:
+        logger.error(error)
+        # 放回 session，讓客戶端可以重試。
+        await kv.set(_session_kv_key(upload_id), upload_session.model_dump_json(), ex=_SETTINGS.RESUMABLE_UPLOAD_EXPIRES_SECOND)
+        raise HTTPException(status.HTTP_502_BAD_GATEWAY, f'Upload {upload_id} abort failed') from error
+    await kv.delete(_chunks_kv_key(upload_id))
+    logger.info({'title': 'Resumable upload aborted', 'upload_id': upload_id, 'filename': upload_session.filename})
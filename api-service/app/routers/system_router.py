@@ -1,4 +1,5 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 
 
 
@@ -7,4 +8,11 @@ router = APIRouter(prefix='/system', tags=['system'])
 
 
 @router.get('/health', operation_id='get_health_status')
-async def get_health_status() -> bool: return True
\ No newline at end of file
+async def get_health_status() -> bool: return True
+
+
+
+@router.get('/metrics', operation_id='get_metrics', response_class=Response)
+async def get_metrics():
+    '''Prometheus 格式之指標，包含上傳各階段（receive、s3、db_commit、serialize）耗時之 histogram 與資料庫連線池狀態。'''
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
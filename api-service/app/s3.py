@@ -0,0 +1,326 @@
+import asyncio
+from contextlib import AsyncExitStack
+import hashlib
+import heapq
+import itertools
+import random
+from typing import AsyncIterator, Awaitable, Callable, ClassVar, TypeVar
+
+from aiobotocore.client import AioBaseClient
+from aiobotocore.config import AioConfig
+from aiobotocore.session import get_session
+from botocore.exceptions import BotoCoreError, ClientError
+import zstandard
+
+from app.codec import (
+    ZSTD_SEEK_TABLE_FOOTER_SIZE_BYTE, create_encoder, locate_zstd_frames, parse_zstd_seek_table, zstd_seek_table_size,
+)
+from app.db import StorageCodecEnum
+from app.logging import logger
+from app.settings import get_settings
+
+
+
+_SETTINGS = get_settings()
+S3_BUCKET_NAME = 'ahead-fcs-files'
+T = TypeVar('T')
+_STREAM_CHUNK_SIZE_BYTE = 64 * 1024
+
+
+
+def create_s3_client():
+    s3_session = get_session()
+    return s3_session.create_client(
+        service_name='s3',
+        region_name=_SETTINGS.AWS_DEFAULT_REGION,
+        endpoint_url=str(_SETTINGS.AWS_S3_ENDPOINT_URL),
+        aws_access_key_id=_SETTINGS.AWS_ACCESS_KEY_ID,
+        aws_secret_access_key=_SETTINGS.AWS_SECRET_ACCESS_KEY.get_secret_value(),
+        config=AioConfig(
+            max_pool_connections=_SETTINGS.S3_MAX_POOL_CONNECTIONS,
+            connect_timeout=_SETTINGS.S3_CONNECT_TIMEOUT_SECOND,
+            read_timeout=_SETTINGS.S3_READ_TIMEOUT_SECOND,
+            tcp_keepalive=True,
+            connector_args={'keepalive_timeout': _SETTINGS.S3_KEEPALIVE_TIMEOUT_SECOND},
+        ),
+    )
+
+
+
+# 全程式共用一個長駐 client，由 lifespan 開關；連線池、憑證與 endpoint 設定只做一次，TLS 連線也能重複使用。
+_s3_client: AioBaseClient | None = None
+_s3_client_exit_stack: AsyncExitStack | None = None
+_s3_client_lock = asyncio.Lock()
+
+
+
+async def open_s3_client():
+    global _s3_client, _s3_client_exit_stack
+    async with _s3_client_lock:
+        if _s3_client is None:
+            _s3_client_exit_stack = AsyncExitStack()
+            _s3_client = await _s3_client_exit_stack.enter_async_context(create_s3_client())
+            logger.info('S3 client opened')
+    return _s3_client
+
+
+
+async def close_s3_client():
+    global _s3_client, _s3_client_exit_stack
+    async with _s3_client_lock:
+        if _s3_client_exit_stack: await _s3_client_exit_stack.aclose()
+        _s3_client = None
+        _s3_client_exit_stack = None
+
+
+
+async def get_s3_client():
+    '''共用 S3 client；沒經過 lifespan（例如測試之 ASGITransport）時於第一次使用時開啟。'''
+    return _s3_client or await open_s3_client()
+
+
+
+class UploadScheduler:
+    '''
+    S3 上傳排程。全程式共用一個併發上限，每個請求另有自己的上限，單一大批次不會佔滿 S3 連線而餓死同一 worker 上之其他請求。
+
+    等待中之工作依大小排序，大的先送；個別工作失敗時以指數退避重試。
+    排隊中加執行中之工作數有上限，submit 會等到有空位才返回，持有之緩衝區因此有界。
+    '''
+
+    _global_semaphore: ClassVar[asyncio.Semaphore] = asyncio.Semaphore(_SETTINGS.UPLOAD_GLOBAL_CONCURRENCY)
+
+    def __init__(
+        self,
+        concurrency: int = _SETTINGS.UPLOAD_REQUEST_CONCURRENCY,
+        max_attempts: int = _SETTINGS.UPLOAD_MAX_ATTEMPTS,
+        on_progress: Callable[[str, int], Awaitable[None]] | None = None,
+    ):
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.on_progress = on_progress
+        self.progress: dict[str, int] = {} # 各檔案已送出之位元組數
+        self._queue: list[tuple[int, int, str, int, Callable[[], Awaitable], asyncio.Future]] = []
+        self._counter = itertools.count()
+        self._running = 0
+        self._slots = asyncio.Semaphore(concurrency * 2)
+        self._tasks: set[asyncio.Task] = set()
+
+
+    async def submit(self, name: str, size_byte: int, work: Callable[[], Awaitable[T]]) -> asyncio.Future[T]:
+        await self._slots.acquire()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (-size_byte, next(self._counter), name, size_byte, work, future))
+        self._pump()
+        return future
+
+
+    def _pump(self):
+        while self._queue and self._running < self.concurrency:
+            _, _, name, size_byte, work, future = heapq.heappop(self._queue)
+            self._running += 1
+            task = asyncio.create_task(self._run(name=name, size_byte=size_byte, work=work, future=future))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+
+    async def _run(self, name: str, size_byte: int, work: Callable[[], Awaitable], future: asyncio.Future):
+        try:
+            for attempt in range(1, self.max_attempts + 1):
+                try:
+                    async with UploadScheduler._global_semaphore: result = await work()
+                    break
+                except (BotoCoreError, ClientError) as error:
+                    if attempt == self.max_attempts: raise
+                    delay = _SETTINGS.UPLOAD_RETRY_BACKOFF_SECOND * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+                    logger.warning({'title': 'Upload retrying', 'name': name, 'attempt': attempt, 'delay': delay, 'error': error})
+                    await asyncio.sleep(delay)
+            self.progress[name] = self.progress.get(name, 0) + size_byte
+            if self.on_progress: await self.on_progress(name, self.progress[name])
+            if not future.done(): future.set_result(result)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            if not future.done(): future.set_exception(e)
+        finally:
+            self._running -= 1
+            self._slots.release()
+            self._pump()
+
+
+
+class S3MultipartUpload:
+    '''
+    以固定大小之緩衝區將串流資料分段上傳至 S3，記憶體用量只與 part_size_byte 與排程之併發數有關，與檔案大小無關。
+
+    各段交給 UploadScheduler 送出並重試，讀取下一段與上傳前一段可同時進行；
+    資料未滿一段即結束之小檔，改以單次 put_object 上傳，省去 multipart 之三次往返。
+    指定 codec 時邊收邊壓縮，size_byte 與 sha256 皆以原始內容計算，stored_size_byte 為實際寫入 S3 之大小。
+    壓縮後之物件不設 Content-Encoding（一般 HTTP 客戶端不認得 zstd），只經 API 解壓後提供。
+    '''
+
+    def __init__(
+        self, s3_client: AioBaseClient, key: str, scheduler: UploadScheduler,
+        name: str | None = None, part_size_byte: int = _SETTINGS.S3_MULTIPART_PART_SIZE_BYTE,
+        codec: StorageCodecEnum = StorageCodecEnum(_SETTINGS.S3_STORAGE_CODEC),
+    ):
+        self.s3_client = s3_client
+        self.key = key
+        self.scheduler = scheduler
+        self.name = name or key
+        self.part_size_byte = part_size_byte
+        self.codec = codec
+        self.size_byte = 0
+        self.stored_size_byte = 0
+        self.sha256 = hashlib.sha256() # 邊收邊算內容雜湊，供內容定址去重複
+        self.upload_id: str | None = None
+        self._encoder = create_encoder(codec)
+        self._object_args = {'ContentType': 'application/octet-stream'}
+        self._part_futures: list[asyncio.Future[dict]] = []
+        self._buffer = bytearray()
+
+
+    async def write(self, data: bytes):
+        self._raise_failed_part()
+        self.size_byte += len(data)
+        self.sha256.update(data)
+        await self._buffer_stored(self._encoder.encode(data) if self._encoder else data)
+
+
+    async def _buffer_stored(self, data: bytes):
+        self.stored_size_byte += len(data)
+        self._buffer += data
+        while len(self._buffer) >= self.part_size_byte:
+            part = bytes(self._buffer[:self.part_size_byte])
+            del self._buffer[:self.part_size_byte]
+            await self._submit_part(part)
+
+
+    def _raise_failed_part(self):
+        '''有一段已重試到放棄時提早中止，不必等整個檔案收完才發現。'''
+        for future in self._part_futures:
+            if future.done() and not future.cancelled() and future.exception(): raise future.exception()
+
+
+    async def _submit_part(self, body: bytes):
+        if self.upload_id is None:
+            response = await self.s3_client.create_multipart_upload(Bucket=S3_BUCKET_NAME, Key=self.key, **self._object_args)
+            self.upload_id = response['UploadId']
+        part_number = len(self._part_futures) + 1
+
+        async def upload_part():
+            response = await self.s3_client.upload_part(Bucket=S3_BUCKET_NAME, Key=self.key, PartNumber=part_number, UploadId=self.upload_id, Body=body)
+            return {'PartNumber': part_number, 'ETag': response['ETag']}
+        self._part_futures.append(await self.scheduler.submit(name=self.name, size_byte=len(body), work=upload_part))
+
+
+    async def complete(self):
+        if self._encoder: await self._buffer_stored(self._encoder.finish())
+        if self.upload_id is None:
+            body = bytes(self._buffer)
+            async def put_object(): await self.s3_client.put_object(Bucket=S3_BUCKET_NAME, Key=self.key, Body=body, **self._object_args)
+            await (await self.scheduler.submit(name=self.name, size_byte=len(body), work=put_object))
+        else:
+            if self._buffer: await self._submit_part(bytes(self._buffer))
+            parts = await asyncio.gather(*self._part_futures)
+            await self.s3_client.complete_multipart_upload(
+                Bucket=S3_BUCKET_NAME, Key=self.key, UploadId=self.upload_id, MultipartUpload={'Parts': parts},
+            )
+        self._buffer.clear()
+
+
+    async def abort(self):
+        self._buffer.clear()
+        await asyncio.gather(*self._part_futures, return_exceptions=True) # 等進行中之分段結束，abort 後才不會留下孤兒分段。
+        if self.upload_id is None: return
+        try: await self.s3_client.abort_multipart_upload(Bucket=S3_BUCKET_NAME, Key=self.key, UploadId=self.upload_id)
+        except (BotoCoreError, ClientError) as error: logger.error({'title': 'Abort multipart upload failed', 'key': self.key, 'error': error})
+
+
+
+class S3ExistingObject:
+    '''
+    內容已存在於 S3 時代替 S3MultipartUpload 接收資料：照樣計算大小與雜湊以驗證內容，但不寫入 S3。
+    '''
+
+    def __init__(self, key: str, codec: StorageCodecEnum, stored_size_byte: int | None):
+        self.key = key
+        self.codec = codec
+        self.stored_size_byte = stored_size_byte
+        self.size_byte = 0
+        self.sha256 = hashlib.sha256()
+        self.upload_id: str | None = None
+
+
+    async def write(self, data: bytes):
+        self.size_byte += len(data)
+        self.sha256.update(data)
+
+
+    async def complete(self): pass
+
+
+    async def abort(self): pass
+
+
+
+async def delete_objects(s3_client: AioBaseClient, keys: list[str]):
+    if not keys: return
+    try: await s3_client.delete_objects(Bucket=S3_BUCKET_NAME, Delete={'Objects': [{'Key': k} for k in keys], 'Quiet': True})
+    except (BotoCoreError, ClientError) as error: logger.error({'title': 'Delete S3 objects failed', 'keys': keys, 'error': error})
+
+
+
+async def _iter_body(body) -> AsyncIterator[bytes]:
+    async with body as stream:
+        async for chunk in stream.iter_chunks(_STREAM_CHUNK_SIZE_BYTE): yield chunk
+
+
+
+async def _iter_zstd_frames(body, frames: list[tuple[int, int]], skip_byte: int, size_byte: int) -> AsyncIterator[bytes]:
+    '''逐個 frame 解壓，同時只持有一個 frame，並裁掉頭尾不在範圍內之內容。'''
+    buffer = bytearray()
+    frame_index = 0
+    async for chunk in _iter_body(body):
+        buffer += chunk
+        while frame_index < len(frames) and len(buffer) >= frames[frame_index][0]:
+            compressed_size = frames[frame_index][0]
+            data = zstandard.ZstdDecompressor().decompress(bytes(buffer[:compressed_size]))
+            del buffer[:compressed_size]
+            frame_index += 1
+            data = data[skip_byte:skip_byte + size_byte]
+            skip_byte = 0
+            size_byte -= len(data)
+            if data: yield data
+
+
+
+async def read_zstd_seek_table(s3_client: AioBaseClient, key: str, stored_size_byte: int):
+    # 先讀結尾 64KiB，一般檔案之 seek table 都在其中，不夠時再讀一次。
+    tail_size_byte = min(stored_size_byte, _STREAM_CHUNK_SIZE_BYTE)
+    response = await s3_client.get_object(Bucket=S3_BUCKET_NAME, Key=key, Range=f'bytes=-{tail_size_byte}')
+    async with response['Body'] as stream: tail = await stream.read()
+    table_size_byte = zstd_seek_table_size(tail[-ZSTD_SEEK_TABLE_FOOTER_SIZE_BYTE:])
+    if table_size_byte > len(tail):
+        response = await s3_client.get_object(Bucket=S3_BUCKET_NAME, Key=key, Range=f'bytes=-{table_size_byte}')
+        async with response['Body'] as stream: tail = await stream.read()
+    return parse_zstd_seek_table(tail)
+
+
+
+async def get_object_range(
+    s3_client: AioBaseClient, key: str, codec: StorageCodecEnum, stored_size_byte: int, start: int, end: int,
+) -> AsyncIterator[bytes]:
+    '''
+    讀取物件原始內容之 [start, end] 位元組（含端點）。先發出 GetObject 再回傳逐段讀取之 async iterator，S3 錯誤在開始回應前即拋出。
+
+    zstd 物件依 seek table 只抓涵蓋範圍之 frame 解壓，不必下載整個物件。
+    '''
+    if codec == StorageCodecEnum.ZSTD:
+        frames = await read_zstd_seek_table(s3_client=s3_client, key=key, stored_size_byte=stored_size_byte)
+        first, last, compressed_begin, compressed_end, decompressed_begin = locate_zstd_frames(frames=frames, start=start, end=end)
+        response = await s3_client.get_object(Bucket=S3_BUCKET_NAME, Key=key, Range=f'bytes={compressed_begin}-{compressed_end}')
+        return _iter_zstd_frames(body=response['Body'], frames=frames[first:last + 1], skip_byte=start - decompressed_begin, size_byte=end - start + 1)
+    response = await s3_client.get_object(Bucket=S3_BUCKET_NAME, Key=key, Range=f'bytes={start}-{end}')
+    return _iter_body(response['Body'])
@@ -17,6 +17,15 @@ class Settings(BaseSettings):
     ALLOW_ORIGINS: list[str]
 
     DATABASE_URL: str
+    DB_POOL_SIZE: int = Field(5, ge=1) # 每個 worker 常駐之連線數
+    DB_MAX_OVERFLOW: int = Field(10, ge=0) # 尖峰時可多開之連線數，歸還後即關閉
+    DB_POOL_TIMEOUT_SECOND: float = 30 # 等不到連線多久後放棄
+    DB_POOL_RECYCLE_SECOND: int = -1 # 連線建立超過此秒數後於下次取用時重開，-1 為不重開
+    DB_POOL_PRE_PING: bool = False # 取用連線前先確認連線仍可用，每次取用多一次往返
+    DB_STATEMENT_TIMEOUT_MS: int = Field(0, ge=0) # 0 為不限制
+    DB_PREPARE_THRESHOLD: int | None = 5 # 同一語句執行幾次後改用 prepared statement，None 為不使用
+    DB_PREPARED_MAX: int = Field(100, ge=1) # 每條連線快取之 prepared statement 數
+    DB_PGBOUNCER_TRANSACTION_MODE: bool = False # 經 PgBouncer transaction 模式連線時，不使用 prepared statement 與連線層級之設定
     REDIS_URL: RedisDsn
 
     ADMIN_EMAIL: EmailStr
@@ -28,6 +37,26 @@ class Settings(BaseSettings):
     AWS_SECRET_ACCESS_KEY: SecretStr
     AWS_DEFAULT_REGION: str
     AWS_S3_ENDPOINT_URL: HttpUrl
+    S3_MULTIPART_PART_SIZE_BYTE: int = Field(8 * 1024 * 1024, ge=5 * 1024 * 1024) # S3 規定 multipart 每段至少 5MiB（最後一段除外）
+    S3_PRESIGNED_UPLOAD_EXPIRES_SECOND: int = 3600
+    S3_PRESIGNED_DOWNLOAD_EXPIRES_SECOND: int = Field(60, ge=1, le=7 * 24 * 60 * 60) # SigV4 預簽網址最長七天
+    S3_PRESIGNED_DOWNLOAD_CACHE_SIZE: int = 10000 # 每個 worker 快取之下載網址數上限
+    FILE_INFO_CACHE_TTL_SECOND: int = Field(300, ge=1) # 檔案資訊於 Redis 之快取時間，公開與否異動時會主動清除
+    USER_CACHE_SIZE: int = Field(10000, ge=1) # 每個 worker 快取之登入用戶數上限
+    USER_CACHE_TTL_SECOND: int = Field(60, ge=0) # 登入用戶之快取時間，0 為不快取
+    USER_CACHE_REDIS_VERSION: bool = False # 用戶資料之版本號存於 Redis，異動時各副本立即一致；關閉時其他 worker 最多晚 TTL 才看到
+    S3_MAX_POOL_CONNECTIONS: int = 50
+    S3_CONNECT_TIMEOUT_SECOND: float = 5
+    S3_READ_TIMEOUT_SECOND: float = 60
+    S3_KEEPALIVE_TIMEOUT_SECOND: float = 30
+    UPLOAD_GLOBAL_CONCURRENCY: int = 32 # 每個 worker 同時送往 S3 之上傳工作上限
+    UPLOAD_REQUEST_CONCURRENCY: int = 4 # 每個請求同時送往 S3 之上傳工作上限
+    UPLOAD_MAX_ATTEMPTS: int = 3
+    UPLOAD_RETRY_BACKOFF_SECOND: float = 0.5
+    RESUMABLE_UPLOAD_EXPIRES_SECOND: int = 24 * 60 * 60
+    S3_STORAGE_CODEC: Literal['IDENTITY', 'ZSTD'] = 'IDENTITY' # 串流上傳存入 S3 時之壓縮方式
+    S3_ZSTD_LEVEL: int = Field(3, ge=1, le=22)
+    S3_ZSTD_FRAME_SIZE_BYTE: int = Field(1024 * 1024, ge=64 * 1024) # 每個 zstd frame 之原始資料大小，也是隨機讀取之最小單位
 
     _example: ClassVar[dict] = {
         'ENVIRONMENT_MODE': 'DEVELOPMENT',
@@ -36,6 +65,15 @@ class Settings(BaseSettings):
         'ALLOW_ORIGINS' : ['http://localhost:5173'],
 
         'DATABASE_URL': 'sqlite:///database.db',
+        'DB_POOL_SIZE': 5,
+        'DB_MAX_OVERFLOW': 10,
+        'DB_POOL_TIMEOUT_SECOND': 30,
+        'DB_POOL_RECYCLE_SECOND': 1800,
+        'DB_POOL_PRE_PING': True,
+        'DB_STATEMENT_TIMEOUT_MS': 30000,
+        'DB_PREPARE_THRESHOLD': 5,
+        'DB_PREPARED_MAX': 100,
+        'DB_PGBOUNCER_TRANSACTION_MODE': False,
         'REDIS_URL': 'redis://redis-15500.c290.ap-northeast-1-2.ec2.redns.redis-cloud.com:15500',
 
         'ADMIN_USERNAME': 'admin',
@@ -47,6 +85,26 @@ class Settings(BaseSettings):
         'AWS_SECRET_ACCESS_KEY': 'AWSSECRET',
         'AWS_DEFAULT_REGION': 'ap-northeast-1',
         "AWS_S3_ENDPOINT_URL": 'https://s3.ap-northeast-1.amazonaws.com',
+        'S3_MULTIPART_PART_SIZE_BYTE': 8388608,
+        'S3_PRESIGNED_UPLOAD_EXPIRES_SECOND': 3600,
+        'S3_PRESIGNED_DOWNLOAD_EXPIRES_SECOND': 60,
+        'S3_PRESIGNED_DOWNLOAD_CACHE_SIZE': 10000,
+        'FILE_INFO_CACHE_TTL_SECOND': 300,
+        'USER_CACHE_SIZE': 10000,
+        'USER_CACHE_TTL_SECOND': 60,
+        'USER_CACHE_REDIS_VERSION': True,
+        'S3_MAX_POOL_CONNECTIONS': 50,
+        'S3_CONNECT_TIMEOUT_SECOND': 5,
+        'S3_READ_TIMEOUT_SECOND': 60,
+        'S3_KEEPALIVE_TIMEOUT_SECOND': 30,
+        'UPLOAD_GLOBAL_CONCURRENCY': 32,
+        'UPLOAD_REQUEST_CONCURRENCY': 4,
+        'UPLOAD_MAX_ATTEMPTS': 3,
+        'UPLOAD_RETRY_BACKOFF_SECOND': 0.5,
+        'RESUMABLE_UPLOAD_EXPIRES_SECOND': 86400,
+        'S3_STORAGE_CODEC': 'ZSTD',
+        'S3_ZSTD_LEVEL': 3,
+        'S3_ZSTD_FRAME_SIZE_BYTE': 1048576,
     }
     model_config = SettingsConfigDict(
         json_schema_extra={'examples': [_example]},
@@ -15,4 +15,11 @@ class TestSystem:
     @pytest.mark.asyncio
     async def test_get_system_health(self, async_client: AsyncClient):
         response = await async_client.get('/system/health')
-        assert response.status_code == HTTPStatus.OK
\ No newline at end of file
+        assert response.status_code == HTTPStatus.OK
+
+    @pytest.mark.asyncio
+    async def test_get_system_metrics(self, async_client: AsyncClient):
+        response = await async_client.get('/system/metrics')
+        assert response.status_code == HTTPStatus.OK
+        assert response.headers['content-type'].startswith('text/plain')
+        assert 'db_pool_connections{engine="async",state="in_use"}' in response.text
@@ -1,4 +1,9 @@
+import hashlib
 from http import HTTPStatus
+import io
+import json
+import os
+import zipfile
 
 from aiobotocore.session import get_session
 from botocore.exceptions import ClientError
@@ -7,10 +12,11 @@ import httpx
 import mimesis
 import pytest
 from sqlmodel import Session, select
+from ulid import ULID
 
-from app.db import UploadBatch
+from app.db import FcsFile, UploadBatch
 from app.logging import logger
-from app.models import UploadBatchResult
+from app.models import FileDownloadUrlBatch, UploadBatchResult, UploadFileSetting
 from app.settings import get_settings
 
 
@@ -27,6 +33,8 @@ mimesis_file = mimesis.File()
 
 class TestFile:
     upload_batch_idno: str
+    dedup_upload_batch_idno: str
+    fcs_file: bytes
 
     fcs_file1_idno: str
     fcs_file2_idno: str
@@ -36,8 +44,9 @@ class TestFile:
 
 
     @pytest.mark.asyncio
-    async def test_upload_fcs_files(self, async_client: AsyncClient):
+    async def test_upload_fcs_files(self, async_client: AsyncClient, db_session: Session):
         fcs_file = mimesis_binary_file.compressed()
+        TestFile.fcs_file = fcs_file
         fcs_file_1_name = mimesis_file.file_name() + '.fcs'
         fcs_file_2_name = mimesis_file.file_name() + '.fcs'
 
@@ -63,11 +72,38 @@ class TestFile:
         TestFile.fcs_file1_idno = result.files[0].file_idno
         TestFile.fcs_file2_idno = result.files[1].file_idno
 
-        assert result.files[0].s3_key
-        assert result.files[1].s3_key
-        TestFile.fcs_file1_s3_key = result.files[0].s3_key
-        TestFile.fcs_file2_s3_key = result.files[1].s3_key
-        
+        assert 's3_key' not in response.json()['files'][0] # S3 key 不對外
+        db_file1, db_file2 = (db_session.exec(select(FcsFile).where(FcsFile.file_idno == f.file_idno)).one() for f in result.files)
+        TestFile.fcs_file1_s3_key = db_file1.s3_key
+        TestFile.fcs_file2_s3_key = db_file2.s3_key
+        assert db_file1.s3_key == db_file2.s3_key # 內容相同，共用同一個 S3 物件
+        assert db_file1.blob_id == db_file2.blob_id
+
+
+    @pytest.mark.asyncio
+    async def test_upload_duplicate_fcs_file_with_sha256(self, async_client: AsyncClient, db_session: Session):
+        fcs_file_name = mimesis_file.file_name() + '.fcs'
+        mismatched_file_name = mimesis_file.file_name() + '.fcs'
+        upload_file_settings = [
+            UploadFileSetting(filename=fcs_file_name, public=True, sha256=hashlib.sha256(TestFile.fcs_file).hexdigest()),
+            UploadFileSetting(filename=mismatched_file_name, public=True, sha256=hashlib.sha256(b'other').hexdigest()),
+        ]
+        response = await async_client.post(
+            '/files/upload',
+            data={'upload_file_settings': json.dumps([s.model_dump() for s in upload_file_settings])},
+            files=[
+                ('upload_files', (fcs_file_name, TestFile.fcs_file)),
+                ('upload_files', (mismatched_file_name, TestFile.fcs_file)),
+            ],
+        )
+        assert response.status_code == HTTPStatus.CREATED
+        result = UploadBatchResult.model_validate(response.json())
+        TestFile.dedup_upload_batch_idno = result.batch_idno
+        assert len(result.files) == 1
+        db_file = db_session.exec(select(FcsFile).where(FcsFile.file_idno == result.files[0].file_idno)).one()
+        assert db_file.s3_key == TestFile.fcs_file1_s3_key
+        assert result.failed_files[0]['filename'] == mismatched_file_name
+
 
     @pytest.mark.asyncio
     async def test_get_file_info(self, async_client: AsyncClient):
@@ -96,6 +132,56 @@ class TestFile:
         assert httpx.get(response1.json())
         assert httpx.get(response2.json())
 
+        # 效期內重複請求取得同一個快取之網址
+        response3 = await async_client.get(f'/files/{TestFile.fcs_file1_idno}/generate-download-url')
+        assert response3.json() == response1.json()
+
+
+    @pytest.mark.asyncio
+    async def test_get_file_content(self, async_client: AsyncClient):
+        response = await async_client.get(f'/files/{TestFile.fcs_file1_idno}/content')
+        assert response.status_code == HTTPStatus.OK
+        assert response.content == TestFile.fcs_file
+
+        range_response = await async_client.get(f'/files/{TestFile.fcs_file1_idno}/content', headers={'Range': 'bytes=10-99'})
+        assert range_response.status_code == HTTPStatus.PARTIAL_CONTENT
+        assert range_response.headers['content-range'] == f'bytes 10-99/{len(TestFile.fcs_file)}'
+        assert range_response.content == TestFile.fcs_file[10:100]
+
+        suffix_response = await async_client.get(f'/files/{TestFile.fcs_file1_idno}/content', headers={'Range': 'bytes=-16'})
+        assert suffix_response.status_code == HTTPStatus.PARTIAL_CONTENT
+        assert suffix_response.content == TestFile.fcs_file[-16:]
+
+        unsatisfiable_response = await async_client.get(f'/files/{TestFile.fcs_file1_idno}/content', headers={'Range': f'bytes={len(TestFile.fcs_file)}-'})
+        assert unsatisfiable_response.status_code == HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE
+
+
+    @pytest.mark.asyncio
+    async def test_download_batch_archive(self, async_client: AsyncClient):
+        response = await async_client.get(f'/batches/{TestFile.upload_batch_idno}/archive')
+        assert response.status_code == HTTPStatus.OK
+        assert int(response.headers['content-length']) == len(response.content)
+
+        with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+            assert archive.testzip() is None
+            assert len(archive.namelist()) == 2
+            assert all(archive.read(name) == TestFile.fcs_file for name in archive.namelist())
+
+        response = await async_client.get('/batches/nonexistent-batch-idno/archive')
+        assert response.status_code == HTTPStatus.NOT_FOUND
+
+
+    @pytest.mark.asyncio
+    async def test_generate_download_urls(self, async_client: AsyncClient):
+        invalid_file_idno = "nonexistent-file-idno"
+        response = await async_client.post('/files/download-urls', json=[TestFile.fcs_file1_idno, TestFile.fcs_file2_idno, invalid_file_idno])
+        assert response.status_code == HTTPStatus.CREATED
+
+        result = FileDownloadUrlBatch.model_validate(response.json())
+        assert [f.file_idno for f in result.files] == [TestFile.fcs_file1_idno, TestFile.fcs_file2_idno]
+        assert result.failed_files == [{'file_idno': invalid_file_idno, 'error': 'File not found'}]
+        assert httpx.get(str(result.files[0].download_url)).content == TestFile.fcs_file
+
 
     @pytest.mark.asyncio
     async def test_generate_download_url_invalid_file_idno(self, async_client: AsyncClient):
@@ -132,12 +218,82 @@ class TestFile:
             try: response2_after_delete = await s3_client.head_object(Bucket=_S3_BUCKET_NAME, Key=TestFile.fcs_file2_s3_key)
             except ClientError as e2: assert e2
 
+        dedup_batch = db_session.exec(select(UploadBatch).where(UploadBatch.batch_idno == TestFile.dedup_upload_batch_idno)).one()
+        for f in dedup_batch.files: db_session.delete(f)
+        db_session.delete(dedup_batch)
+        db_session.commit()
+
         statement = select(UploadBatch).where(UploadBatch.batch_idno == TestFile.upload_batch_idno)
         batch = db_session.exec(statement).one_or_none()
         assert batch
         
+        for blob in {f.blob_id: f.blob for f in batch.files if f.blob}.values(): db_session.delete(blob)
         for f in batch.files: db_session.delete(f)
         db_session.delete(batch)
         db_session.commit()
         batch = db_session.exec(statement).one_or_none()
         assert not batch
+
+
+
+class TestLargeFile:
+    upload_batch_idno: str
+    fcs_file_s3_key: str
+    fcs_file_size_byte: int = _SETTINGS.S3_MULTIPART_PART_SIZE_BYTE * 2 + 123 # 超過一段緩衝區，才會走 S3 multipart upload。
+
+
+    @pytest.mark.asyncio
+    async def test_upload_large_fcs_file(self, async_client: AsyncClient):
+        fcs_file = os.urandom(TestLargeFile.fcs_file_size_byte)
+        fcs_file_name = mimesis_file.file_name() + '.fcs'
+
+        progress_token = str(ULID())
+        response = await async_client.post(
+            '/files/upload',
+            params={'progress_token': progress_token},
+            files=[('upload_files', (fcs_file_name, fcs_file))],
+        )
+        assert response.status_code == HTTPStatus.CREATED
+
+        result = UploadBatchResult.model_validate(response.json())
+        assert result.files[0].file_size_byte == TestLargeFile.fcs_file_size_byte
+
+        progress_response = await async_client.get(f'/files/upload/progress/{progress_token}')
+        assert progress_response.status_code == HTTPStatus.OK
+        assert progress_response.json() == {fcs_file_name: TestLargeFile.fcs_file_size_byte}
+        TestLargeFile.upload_batch_idno = result.batch_idno
+        TestLargeFile.fcs_file_s3_key = f'{result.batch_idno}/{fcs_file_name}'
+
+
+    @pytest.mark.asyncio
+    async def test_upload_non_fcs_file(self, async_client: AsyncClient):
+        response = await async_client.post('/files/upload', files=[('upload_files', ('abc.txt', b'abc'))])
+        assert response.status_code == HTTPStatus.FORBIDDEN
+
+
+    @pytest.mark.asyncio
+    async def test_upload_duplicated_filenames(self, async_client: AsyncClient):
+        response = await async_client.post('/files/upload', files=[('upload_files', ('abc.fcs', b'abc')), ('upload_files', ('abc.fcs', b'def'))])
+        assert response.status_code == HTTPStatus.UNPROCESSABLE_CONTENT
+
+
+    @pytest.mark.asyncio
+    async def test_teardown(self, db_session: Session):
+        s3_session = get_session()
+        async with s3_session.create_client(
+            service_name='s3',
+            region_name=_SETTINGS.AWS_DEFAULT_REGION,
+            endpoint_url=str(_SETTINGS.AWS_S3_ENDPOINT_URL),
+            aws_access_key_id=_SETTINGS.AWS_ACCESS_KEY_ID,
+            aws_secret_access_key=_SETTINGS.AWS_SECRET_ACCESS_KEY.get_secret_value(),
+        ) as s3_client:
+            response_before_delete = await s3_client.head_object(Bucket=_S3_BUCKET_NAME, Key=TestLargeFile.fcs_file_s3_key)
+            assert response_before_delete['ContentLength'] == TestLargeFile.fcs_file_size_byte
+            await s3_client.delete_object(Bucket=_S3_BUCKET_NAME, Key=TestLargeFile.fcs_file_s3_key)
+
+        statement = select(UploadBatch).where(UploadBatch.batch_idno == TestLargeFile.upload_batch_idno)
+        batch = db_session.exec(statement).one_or_none()
+        for blob in {f.blob_id: f.blob for f in batch.files if f.blob}.values(): db_session.delete(blob)
+        for f in batch.files: db_session.delete(f)
+        db_session.delete(batch)
+        db_session.commit()
@@ -11,7 +11,7 @@ from sqlmodel import Session, select
 
 from app.db import UploadBatch, User
 from app.logging import logger
-from app.models import FileInfo, Token, UploadBatchResult, UploadFileSetting
+from app.models import FileInfoPage, Token, UploadBatchResult, UploadFileSetting
 from app.settings import get_settings
 
 
@@ -58,7 +58,7 @@ class TestUserPublicFile:
         result = UploadBatchResult.model_validate(upload_response.json())
         TestUserPublicFile.file_upload_batch_idno = result.batch_idno
         TestUserPublicFile.file_idno = result.files[0].file_idno
-        TestUserPublicFile.file_s3_key = result.files[0].s3_key
+        TestUserPublicFile.file_s3_key = f'{result.batch_idno}/{result.files[0].file_name}'
         
         # Chcck DB
         db_session.refresh(TestUserPublicFile.user)
@@ -70,8 +70,7 @@ class TestUserPublicFile:
         user_files_response = await async_client.get('/files/mine')
         assert user_files_response.status_code == HTTPStatus.OK
         
-        file_info_dict_list: list[dict] = user_files_response.json()
-        file_info_list = [FileInfo.model_validate(item) for item in file_info_dict_list]
+        file_info_list = FileInfoPage.model_validate(user_files_response.json()).items
         assert file_info_list
         assert len(file_info_list) == 1
         assert file_info_list[0]
@@ -141,6 +140,7 @@ class TestUserPublicFile:
         statement = select(UploadBatch).where(UploadBatch.batch_idno == TestUserPublicFile.file_upload_batch_idno)
         batch = db_session.exec(statement).one_or_none()
         
+        for blob in {f.blob_id: f.blob for f in batch.files if f.blob}.values(): db_session.delete(blob)
         for f in batch.files: db_session.delete(f)
         db_session.delete(batch)
         db_session.commit()
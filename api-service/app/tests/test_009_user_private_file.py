@@ -11,7 +11,7 @@ from sqlmodel import Session, select
 
 from app.db import UploadBatch, User
 from app.logging import logger
-from app.models import FileInfo, Token, UploadBatchResult, UploadFileSetting
+from app.models import FileInfoPage, Token, UploadBatchResult, UploadFileSetting
 from app.settings import get_settings
 
 
@@ -57,7 +57,7 @@ class TestUserPrivateFile:
         result = UploadBatchResult.model_validate(upload_response.json())
         TestUserPrivateFile.file_upload_batch_idno = result.batch_idno
         TestUserPrivateFile.file_idno = result.files[0].file_idno
-        TestUserPrivateFile.file_s3_key = result.files[0].s3_key
+        TestUserPrivateFile.file_s3_key = f'{result.batch_idno}/{result.files[0].file_name}'
         
         # Chcck DB
         db_session.refresh(TestUserPrivateFile.user)
@@ -69,8 +69,7 @@ class TestUserPrivateFile:
         user_files_response = await async_client.get('/files/mine')
         assert user_files_response.status_code == HTTPStatus.OK
         
-        file_info_dict_list: list[dict] = user_files_response.json()
-        file_info_list = [FileInfo.model_validate(item) for item in file_info_dict_list]
+        file_info_list = FileInfoPage.model_validate(user_files_response.json()).items
         assert file_info_list
         assert len(file_info_list) == 1
         assert file_info_list[0]
@@ -96,6 +95,11 @@ class TestUserPrivateFile:
         assert download_url_response.status_code == HTTPStatus.CREATED
         assert httpx.get(download_url_response.json())
 
+        # Download batch archive
+        archive_response = await async_client.get(f'/batches/{TestUserPrivateFile.file_upload_batch_idno}/archive')
+        assert archive_response.status_code == HTTPStatus.OK
+        assert archive_response.headers['content-type'] == 'application/zip'
+
 
     @pytest.mark.asyncio
     async def test_download_private_files(
@@ -110,6 +114,13 @@ class TestUserPrivateFile:
         download_url_response = await async_client.get(f'/files/{TestUserPrivateFile.file_idno}/generate-download-url')
         assert download_url_response.status_code == HTTPStatus.NOT_FOUND
 
+        archive_response = await async_client.get(f'/batches/{TestUserPrivateFile.file_upload_batch_idno}/archive')
+        assert archive_response.status_code == HTTPStatus.NOT_FOUND
+
+        download_urls_response = await async_client.post('/files/download-urls', json=[TestUserPrivateFile.file_idno])
+        assert download_urls_response.status_code == HTTPStatus.CREATED
+        assert not download_urls_response.json()['files']
+
 
     @pytest.mark.asyncio
     async def test_make_user_file_public(
@@ -138,6 +149,11 @@ class TestUserPrivateFile:
         assert download_url_response.status_code == HTTPStatus.CREATED
         assert httpx.get(download_url_response.json())
 
+        # Download batch archive
+        archive_response = await async_client.get(f'/batches/{TestUserPrivateFile.file_upload_batch_idno}/archive')
+        assert archive_response.status_code == HTTPStatus.OK
+        assert archive_response.headers['content-type'] == 'application/zip'
+
 
     @pytest.mark.asyncio
     async def test_teardown(self, db_session: Session):
@@ -160,6 +176,7 @@ class TestUserPrivateFile:
         statement = select(UploadBatch).where(UploadBatch.batch_idno == TestUserPrivateFile.file_upload_batch_idno)
         batch = db_session.exec(statement).one_or_none()
         
+        for blob in {f.blob_id: f.blob for f in batch.files if f.blob}.values(): db_session.delete(blob)
         for f in batch.files: db_session.delete(f)
         db_session.delete(batch)
         db_session.commit()
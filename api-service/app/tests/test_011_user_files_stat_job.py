@@ -10,7 +10,7 @@ import pytest
 from sqlmodel import Session, select
 
 from app.db import JobStatusEnum, JobTypeEnum, UploadBatch, User
-from app.models import FilesStatJobRead, JobRead, Token, UploadBatchResult, UploadFileSetting
+from app.models import FilesStat, FilesStatJobRead, JobReadPage, Token, UploadBatchResult, UploadFileSetting
 from app.settings import get_settings
 
 
@@ -33,6 +33,7 @@ class TestUserFilesStatJob:
     file_upload_batch_idno: str
     file_idno: str
     file_s3_key: str
+    file_size_byte: int
 
     job_id: int
     queue_job_id: UUID
@@ -62,10 +63,11 @@ class TestUserFilesStatJob:
         result = UploadBatchResult.model_validate(upload_response.json())
         TestUserFilesStatJob.file_upload_batch_idno = result.batch_idno
         TestUserFilesStatJob.file_idno = result.files[0].file_idno
-        TestUserFilesStatJob.file_s3_key = result.files[0].s3_key
+        TestUserFilesStatJob.file_s3_key = f'{result.batch_idno}/{result.files[0].file_name}'
 
         # Create job
-        # 這裡建立 job 後，下面 teardown 會立馬清除 DB 的 fcs_file 紀錄，所以在 worker 那邊，檔案計數和大小合計都會是 0。
+        # 由計數直接作答，建立時即已完成，不經 worker。
+        TestUserFilesStatJob.file_size_byte = len(file)
         create_job_response = await TestUserFilesStatJob.async_client.post(f'/me/files/stat-jobs/create')
         assert create_job_response.status_code == HTTPStatus.CREATED
         TestUserFilesStatJob.queue_job_id = UUID(create_job_response.json())
@@ -78,7 +80,8 @@ class TestUserFilesStatJob:
         job_read = FilesStatJobRead.model_validate(response.json())
         assert job_read.queue_job_id == TestUserFilesStatJob.queue_job_id
         assert job_read.job_type == JobTypeEnum.FILES_STAT
-        assert job_read.status == JobStatusEnum.PENDING # 如果 worker 正在跑，會變成 RUNNING，就會報錯。
+        assert job_read.status == JobStatusEnum.FINISHED
+        assert job_read.result == FilesStat(files_count=1, files_size_byte_sum=TestUserFilesStatJob.file_size_byte)
         assert job_read.user_id == TestUserFilesStatJob.user.id
 
 
@@ -86,8 +89,7 @@ class TestUserFilesStatJob:
     async def test_get_jobs(self):
         response = await TestUserFilesStatJob.async_client.get(f'/me/files/stat-jobs')
         assert response.status_code == HTTPStatus.OK
-        job_read_dict_list: list[dict] = response.json()
-        job_read_list = [JobRead.model_validate(j) for j in job_read_dict_list]
+        job_read_list = JobReadPage.model_validate(response.json()).items
         job_read = next((j for j in job_read_list if j.queue_job_id == TestUserFilesStatJob.queue_job_id), None)
         assert job_read
 
@@ -113,6 +115,7 @@ class TestUserFilesStatJob:
         statement = select(UploadBatch).where(UploadBatch.batch_idno == TestUserFilesStatJob.file_upload_batch_idno)
         batch = db_session.exec(statement).one_or_none()
         
+        for blob in {f.blob_id: f.blob for f in batch.files if f.blob}.values(): db_session.delete(blob)
         for f in batch.files: db_session.delete(f)
         db_session.delete(batch)
         db_session.commit()
\ No newline at end of file
@@ -12,7 +12,7 @@ from sqlmodel import Session, select
 
 from app.db import Job, JobStatusEnum, JobTypeEnum, UploadBatch, User
 from app.job import queue
-from app.models import FcsInfoJobRead, FilesStatJobRead, JobRead, Token, UploadBatchResult, UploadFileSetting
+from app.models import FcsInfoJobRead, FcsSegments, FilesStatJobRead, JobReadPage, Token, UploadBatchResult, UploadFileSetting
 from app.settings import get_settings
 
 
@@ -67,10 +67,10 @@ class TestUserFcsInfoJob:
         result = UploadBatchResult.model_validate(upload_response.json())
         TestUserFcsInfoJob.file_upload_batch_idno = result.batch_idno
         TestUserFcsInfoJob.file_idno = result.files[0].file_idno
-        TestUserFcsInfoJob.file_s3_key = result.files[0].s3_key
+        TestUserFcsInfoJob.file_s3_key = f'{result.batch_idno}/{result.files[0].file_name}'
 
         # Create job
-        # 這裡建立 job 後，下面 teardown 會立馬清除 DB 的 fcs_file 紀錄，所以在 worker 那邊會報找不到 DB 紀錄的錯誤。
+        # 上傳時已解析出 FCS metadata，job 直接由資料庫作答，不會排進佇列。
         create_job_response = await TestUserFcsInfoJob.async_client.post(f'/fcs-files/fcs-info-jobs/create', params={'file_idno': TestUserFcsInfoJob.file_idno})
         assert create_job_response.status_code == HTTPStatus.CREATED
         TestUserFcsInfoJob.queue_job_id = UUID(create_job_response.json())
@@ -83,20 +83,39 @@ class TestUserFcsInfoJob:
         job_read = FcsInfoJobRead.model_validate(response.json())
         assert job_read.queue_job_id == TestUserFcsInfoJob.queue_job_id
         assert job_read.job_type == JobTypeEnum.FCS_INFO
-        assert job_read.status == JobStatusEnum.PENDING # 如果 worker 正在跑，會變成 RUNNING，就會報錯。
+        assert job_read.status == JobStatusEnum.FINISHED
         assert job_read.user_id == TestUserFcsInfoJob.user.id
+        assert job_read.result.fcs_version == '3.0'
+        assert job_read.result.fcs_event_count == 24745
+        assert len(job_read.result.fcs_pnn_labels) == 26
 
 
     @pytest.mark.asyncio
     async def test_get_jobs(self):
         response = await TestUserFcsInfoJob.async_client.get(f'/fcs-files/fcs-info-jobs')
         assert response.status_code == HTTPStatus.OK
-        job_read_dict_list: list[dict] = response.json()
-        job_read_list = [JobRead.model_validate(j) for j in job_read_dict_list]
+        job_read_list = JobReadPage.model_validate(response.json()).items
         job_read = next((j for j in job_read_list if j.queue_job_id == TestUserFcsInfoJob.queue_job_id), None)
         assert job_read
 
 
+    @pytest.mark.asyncio
+    async def test_get_file_content_segments(self):
+        response = await TestUserFcsInfoJob.async_client.get(f'/files/{TestUserFcsInfoJob.file_idno}/content/segments')
+        assert response.status_code == HTTPStatus.OK
+        segments = FcsSegments.model_validate(response.json())
+        assert segments.fcs_version == '3.0'
+        assert (segments.text.begin, segments.text.end) == (256, 10733)
+
+        # 只讀 TEXT 段
+        content_response = await TestUserFcsInfoJob.async_client.get(
+            f'/files/{TestUserFcsInfoJob.file_idno}/content', headers={'Range': f'bytes={segments.text.begin}-{segments.text.end}'},
+        )
+        assert content_response.status_code == HTTPStatus.PARTIAL_CONTENT
+        assert len(content_response.content) == segments.text.end - segments.text.begin + 1
+        assert b'$TOT' in content_response.content
+
+
     @pytest.mark.asyncio
     async def test_teardown(self, db_session: Session):
         # Delete S3 files
@@ -118,6 +137,7 @@ class TestUserFcsInfoJob:
         statement = select(UploadBatch).where(UploadBatch.batch_idno == TestUserFcsInfoJob.file_upload_batch_idno)
         batch = db_session.exec(statement).one_or_none()
         
+        for blob in {f.blob_id: f.blob for f in batch.files if f.blob}.values(): db_session.delete(blob)
         for f in batch.files: db_session.delete(f)
         db_session.delete(batch)
         db_session.commit()
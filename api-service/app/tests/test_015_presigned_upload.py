@@ -0,0 +1,109 @@
+from http import HTTPStatus
+import os
+
+from aiobotocore.session import get_session
+from httpx import AsyncClient
+import httpx
+import mimesis
+import pytest
+from sqlmodel import Session, select
+
+from app.db import UploadBatch
+from app.models import PresignedUploadBatch, PresignedUploadFile, UploadBatchResult
+from app.settings import get_settings
+
+
+
+_SETTINGS = get_settings()
+_S3_BUCKET_NAME = 'ahead-fcs-files'
+
+
+
+mimesis_binary_file = mimesis.BinaryFile()
+mimesis_file = mimesis.File()
+
+
+
+class TestPresignedUpload:
+    presigned_batch: PresignedUploadBatch
+
+    small_file: bytes
+    large_file: bytes
+
+    upload_batch_idno: str
+    fcs_file_s3_keys: list[str]
+
+
+    @pytest.mark.asyncio
+    async def test_presign_upload(self, async_client: AsyncClient):
+        TestPresignedUpload.small_file = mimesis_binary_file.compressed()
+        TestPresignedUpload.large_file = os.urandom(_SETTINGS.S3_MULTIPART_PART_SIZE_BYTE + 123) # 超過一段，會拿到 multipart 各段網址。
+        upload_files = [
+            PresignedUploadFile(filename=mimesis_file.file_name() + '.fcs', size_byte=len(TestPresignedUpload.small_file)),
+            PresignedUploadFile(filename=mimesis_file.file_name() + '.fcs', size_byte=len(TestPresignedUpload.large_file)),
+        ]
+        response = await async_client.post('/files/upload/presign', json=[f.model_dump() for f in upload_files])
+        assert response.status_code == HTTPStatus.CREATED
+
+        presigned_batch = PresignedUploadBatch.model_validate(response.json())
+        assert presigned_batch.files[0].upload_url
+        assert presigned_batch.files[1].upload_id
+        assert len(presigned_batch.files[1].part_urls) == 2
+        TestPresignedUpload.presigned_batch = presigned_batch
+
+
+    @pytest.mark.asyncio
+    async def test_complete_before_upload(self, async_client: AsyncClient):
+        response = await async_client.post(f'/files/upload/{TestPresignedUpload.presigned_batch.batch_idno}/complete', json=[])
+        assert response.status_code == HTTPStatus.UNPROCESSABLE_CONTENT # 大檔缺 parts
+
+
+    @pytest.mark.asyncio
+    async def test_upload_and_complete(self, async_client: AsyncClient):
+        small_target, large_target = TestPresignedUpload.presigned_batch.files
+        async with httpx.AsyncClient() as s3_http_client:
+            response = await s3_http_client.put(small_target.upload_url, content=TestPresignedUpload.small_file)
+            assert response.status_code == HTTPStatus.OK
+
+            parts = []
+            for i, part_url in enumerate(large_target.part_urls):
+                chunk = TestPresignedUpload.large_file[i * large_target.part_size_byte:(i + 1) * large_target.part_size_byte]
+                response = await s3_http_client.put(part_url, content=chunk)
+                assert response.status_code == HTTPStatus.OK
+                parts.append({'part_number': i + 1, 'etag': response.headers['etag']})
+
+        response = await async_client.post(
+            f'/files/upload/{TestPresignedUpload.presigned_batch.batch_idno}/complete',
+            json=[{'filename': large_target.filename, 'parts': parts}],
+        )
+        assert response.status_code == HTTPStatus.CREATED
+
+        result = UploadBatchResult.model_validate(response.json())
+        assert not result.failed_files
+        assert len(result.files) == 2
+        TestPresignedUpload.upload_batch_idno = result.batch_idno
+        TestPresignedUpload.fcs_file_s3_keys = [f.key for f in TestPresignedUpload.presigned_batch.files]
+
+        # 同一批次不能重複登記
+        response = await async_client.post(f'/files/upload/{TestPresignedUpload.presigned_batch.batch_idno}/complete', json=[])
+        assert response.status_code == HTTPStatus.NOT_FOUND
+
+
+    @pytest.mark.asyncio
+    async def test_teardown(self, db_session: Session):
+        s3_session = get_session()
+        async with s3_session.create_client(
+            service_name='s3',
+            region_name=_SETTINGS.AWS_DEFAULT_REGION,
+            endpoint_url=str(_SETTINGS.AWS_S3_ENDPOINT_URL),
+            aws_access_key_id=_SETTINGS.AWS_ACCESS_KEY_ID,
+            aws_secret_access_key=_SETTINGS.AWS_SECRET_ACCESS_KEY.get_secret_value(),
+        ) as s3_client:
+            for key in TestPresignedUpload.fcs_file_s3_keys: await s3_client.delete_object(Bucket=_S3_BUCKET_NAME, Key=key)
+
+        statement = select(UploadBatch).where(UploadBatch.batch_idno == TestPresignedUpload.upload_batch_idno)
+        batch = db_session.exec(statement).one_or_none()
+        assert batch
+        for f in batch.files: db_session.delete(f)
+        db_session.delete(batch)
+        db_session.commit()
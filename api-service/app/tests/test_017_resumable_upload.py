@@ -0,0 +1,159 @@
+import base64
+import hashlib
+from http import HTTPStatus
+import os
+
+from aiobotocore.session import get_session
+from httpx import AsyncClient
+import mimesis
+import pytest
+from sqlmodel import Session, select
+
+from app.db import UploadBatch
+from app.models import ResumableUpload, UploadBatchResult
+from app.settings import get_settings
+
+
+
+_SETTINGS = get_settings()
+_S3_BUCKET_NAME = 'ahead-fcs-files'
+
+
+
+mimesis_file = mimesis.File()
+
+
+
+def _checksum(chunk: bytes): return f'sha256 {base64.b64encode(hashlib.sha256(chunk).digest()).decode()}'
+
+
+
+class TestResumableUpload:
+    file: bytes
+    chunk_size_byte: int = 5 * 1024 * 1024
+
+    upload_id: str
+    upload_batch_idno: str
+    fcs_file_s3_key: str
+
+
+    def _chunk(self, chunk_number: int):
+        return TestResumableUpload.file[(chunk_number - 1) * TestResumableUpload.chunk_size_byte:chunk_number * TestResumableUpload.chunk_size_byte]
+
+
+    @pytest.mark.asyncio
+    async def test_create_upload(self, async_client: AsyncClient):
+        TestResumableUpload.file = os.urandom(TestResumableUpload.chunk_size_byte * 2 + 123)
+        response = await async_client.post('/files/resumable-uploads', json={
+            'filename': mimesis_file.file_name() + '.fcs',
+            'size_byte': len(TestResumableUpload.file),
+            'chunk_size_byte': TestResumableUpload.chunk_size_byte,
+        })
+        assert response.status_code == HTTPStatus.CREATED
+        upload = ResumableUpload.model_validate(response.json())
+        assert upload.chunk_count == 3
+        assert upload.missing_chunk_numbers == [1, 2, 3]
+        TestResumableUpload.upload_id = upload.upload_id
+
+
+    @pytest.mark.asyncio
+    async def test_upload_chunk_with_bad_checksum(self, async_client: AsyncClient):
+        response = await async_client.patch(
+            f'/files/resumable-uploads/{TestResumableUpload.upload_id}/chunks/1',
+            content=self._chunk(1),
+            headers={'Upload-Checksum': _checksum(b'not this chunk')},
+        )
+        assert response.status_code == HTTPStatus.BAD_REQUEST
+
+
+    @pytest.mark.asyncio
+    async def test_chunk_size_limit(self, async_client: AsyncClient):
+        response = await async_client.post('/files/resumable-uploads', json={
+            'filename': mimesis_file.file_name() + '.fcs', 'size_byte': 500 * 1024 * 1024, 'chunk_size_byte': 128 * 1024 * 1024,
+        })
+        assert response.status_code == HTTPStatus.UNPROCESSABLE_CONTENT
+
+        # 最後一塊只有 123 bytes，送整塊者拒收。
+        response = await async_client.patch(
+            f'/files/resumable-uploads/{TestResumableUpload.upload_id}/chunks/3',
+            content=self._chunk(1),
+            headers={'Upload-Checksum': _checksum(self._chunk(1))},
+        )
+        assert response.status_code == HTTPStatus.CONTENT_TOO_LARGE
+
+
+    @pytest.mark.asyncio
+    async def test_abort_upload(self, async_client: AsyncClient):
+        response = await async_client.post('/files/resumable-uploads', json={
+            'filename': mimesis_file.file_name() + '.fcs', 'size_byte': len(TestResumableUpload.file), 'chunk_size_byte': TestResumableUpload.chunk_size_byte,
+        })
+        upload_id = ResumableUpload.model_validate(response.json()).upload_id
+        response = await async_client.patch(
+            f'/files/resumable-uploads/{upload_id}/chunks/1', content=self._chunk(1), headers={'Upload-Checksum': _checksum(self._chunk(1))},
+        )
+        assert response.status_code == HTTPStatus.OK
+
+        response = await async_client.delete(f'/files/resumable-uploads/{upload_id}')
+        assert response.status_code == HTTPStatus.NO_CONTENT
+        response = await async_client.get(f'/files/resumable-uploads/{upload_id}')
+        assert response.status_code == HTTPStatus.NOT_FOUND
+
+
+    @pytest.mark.asyncio
+    async def test_upload_chunks_out_of_order(self, async_client: AsyncClient):
+        for chunk_number in [3, 1]:
+            response = await async_client.patch(
+                f'/files/resumable-uploads/{TestResumableUpload.upload_id}/chunks/{chunk_number}',
+                content=self._chunk(chunk_number),
+                headers={'Upload-Checksum': _checksum(self._chunk(chunk_number))},
+            )
+            assert response.status_code == HTTPStatus.OK
+
+        # 模擬斷線後查詢進度，只缺第 2 塊。
+        response = await async_client.get(f'/files/resumable-uploads/{TestResumableUpload.upload_id}')
+        upload = ResumableUpload.model_validate(response.json())
+        assert upload.missing_chunk_numbers == [2]
+        assert upload.received_byte == len(TestResumableUpload.file) - TestResumableUpload.chunk_size_byte
+
+        response = await async_client.post(f'/files/resumable-uploads/{TestResumableUpload.upload_id}/complete')
+        assert response.status_code == HTTPStatus.CONFLICT
+
+
+    @pytest.mark.asyncio
+    async def test_resume_and_complete(self, async_client: AsyncClient):
+        response = await async_client.patch(
+            f'/files/resumable-uploads/{TestResumableUpload.upload_id}/chunks/2',
+            content=self._chunk(2),
+            headers={'Upload-Checksum': _checksum(self._chunk(2))},
+        )
+        assert response.status_code == HTTPStatus.OK
+        assert not ResumableUpload.model_validate(response.json()).missing_chunk_numbers
+
+        response = await async_client.post(f'/files/resumable-uploads/{TestResumableUpload.upload_id}/complete')
+        assert response.status_code == HTTPStatus.CREATED
+        result = UploadBatchResult.model_validate(response.json())
+        assert result.files[0].file_size_byte == len(TestResumableUpload.file)
+        TestResumableUpload.upload_batch_idno = result.batch_idno
+        TestResumableUpload.fcs_file_s3_key = f'{result.batch_idno}/{result.files[0].file_name}'
+
+
+    @pytest.mark.asyncio
+    async def test_teardown(self, db_session: Session):
+        s3_session = get_session()
+        async with s3_session.create_client(
+            service_name='s3',
+            region_name=_SETTINGS.AWS_DEFAULT_REGION,
+            endpoint_url=str(_SETTINGS.AWS_S3_ENDPOINT_URL),
+            aws_access_key_id=_SETTINGS.AWS_ACCESS_KEY_ID,
+            aws_secret_access_key=_SETTINGS.AWS_SECRET_ACCESS_KEY.get_secret_value(),
+        ) as s3_client:
+            response_before_delete = await s3_client.head_object(Bucket=_S3_BUCKET_NAME, Key=TestResumableUpload.fcs_file_s3_key)
+            assert response_before_delete['ContentLength'] == len(TestResumableUpload.file)
+            await s3_client.delete_object(Bucket=_S3_BUCKET_NAME, Key=TestResumableUpload.fcs_file_s3_key)
+
+        statement = select(UploadBatch).where(UploadBatch.batch_idno == TestResumableUpload.upload_batch_idno)
+        batch = db_session.exec(statement).one_or_none()
+        assert batch
+        for f in batch.files: db_session.delete(f)
+        db_session.delete(batch)
+        db_session.commit()
@@ -0,0 +1,241 @@
+from typing import Any
+
+import pytest
+from sqlalchemy import Connection, delete, text, update
+from sqlalchemy.orm import joinedload
+from sqlmodel import select
+
+from app.db import FcsBlob, FcsFile, Job, JobTypeEnum, UploadBatch, User, _engine, fcs_file_readable_by
+from app.files_stat import files_stat_statement
+from app.models import FILE_INFO_COLUMNS, JOB_READ_COLUMNS, FilesStatBreakdownEnum
+from app.pagination import PAGE_LIMIT_DEFAULT, encode_cursor, paginate
+
+
+
+_USER_COUNT = 2000
+_BATCH_COUNT = 100000
+_FILE_COUNT = 200000
+_BLOB_COUNT = 50000
+_JOB_COUNT = 200000
+_LARGE_TABLE_ROW_COUNT = 1000 # 列數超過此值之表不得出現 Seq Scan
+_TABLES = ['users', 'upload_batches', 'fcs_blobs', 'fcs_files', 'fcs_metadata', 'user_files_stats', 'user_files_totals', 'jobs']
+_SCHEMA = 'query_plan'
+
+
+
+def _explain(connection: Connection, statement) -> dict[str, Any]:
+    sql = statement.compile(dialect=connection.dialect, compile_kwargs={'literal_binds': True})
+    return connection.execute(text(f'EXPLAIN (FORMAT JSON) {sql}')).scalar_one()[0]['Plan']
+
+
+
+def _node_types(plan: dict[str, Any]) -> list[tuple[str, str | None]]:
+    nodes = [(plan['Node Type'], plan.get('Relation Name'))]
+    for subplan in plan.get('Plans', []): nodes += _node_types(subplan)
+    return nodes
+
+
+
+class TestQueryPlan:
+    '''
+    灌入接近正式環境規模之資料後，對各路由與 job 之查詢跑 EXPLAIN，大表出現 Seq Scan 即失敗。
+
+    資料全在同一個交易內灌入與 ANALYZE，test_teardown 時 rollback，不會留在資料庫。
+    灌入的是另建之 schema 中照正式表欄位與索引建立之空表（不含外鍵），查詢經 search_path 落在這些表上；
+    rollback 時整個表一併捨棄，正式表不會累積 dead tuple 與膨脹之索引，重複執行之查詢計畫才會一致。
+    '''
+    connection: Connection
+    large_tables: set[str]
+
+    user: User
+    file: FcsFile
+    batch: UploadBatch
+    blob: FcsBlob
+    job: Job
+
+
+    def _assert_no_seq_scan(self, statement, index_ordered: bool = False):
+        '''index_ordered：分頁查詢須由索引提供順序，不得排序，第 N 頁才會與第一頁一樣只讀 limit 列。'''
+        plan = _explain(connection=TestQueryPlan.connection, statement=statement)
+        nodes = _node_types(plan)
+        assert not {table for node_type, table in nodes if node_type == 'Seq Scan'} & TestQueryPlan.large_tables, plan
+        if index_ordered: assert not {node_type for node_type, _ in nodes} & {'Sort', 'Incremental Sort'}, plan
+
+
+    @pytest.mark.asyncio
+    async def test_seed(self):
+        TestQueryPlan.connection = connection = _engine.connect()
+        connection.begin()
+        connection.execute(text(f'CREATE SCHEMA {_SCHEMA}'))
+        for table in _TABLES: connection.execute(text(f'CREATE TABLE {_SCHEMA}.{table} (LIKE public.{table} INCLUDING ALL)'))
+        connection.execute(text(f'SET LOCAL search_path = {_SCHEMA}, public'))
+        connection.execute(text('''
+            INSERT INTO users (username, hashed_password, email_verified)
+            SELECT 'query-plan-' || i || '@example.com', '', false FROM generate_series(1, :user_count) AS i
+        '''), {'user_count': _USER_COUNT})
+        connection.execute(text('''
+            INSERT INTO upload_batches (batch_idno, upload_time)
+            SELECT 'query-plan-' || i, now() - i * interval '1 minute' FROM generate_series(1, :batch_count) AS i
+        '''), {'batch_count': _BATCH_COUNT})
+        connection.execute(text('''
+            INSERT INTO fcs_blobs (sha256, s3_key, size_byte, storage_codec, stored_size_byte, ref_count)
+            SELECT md5('query-plan-' || i) || md5('query-plan-' || i), 'query-plan/blob-' || i, 1000 + i, 'IDENTITY', 1000 + i, 1
+            FROM generate_series(1, :blob_count) AS i
+        '''), {'blob_count': _BLOB_COUNT})
+        # 重度用戶持有一成檔案，每 1000 個連號為一段，如同整批上傳，實體位置也聚在一起。
+        connection.execute(text('''
+            INSERT INTO fcs_files (file_idno, file_name, file_size_byte, s3_key, storage_codec, stored_size_byte, public, upload_time, blob_id, user_id, upload_batch_id)
+            SELECT
+                'query-plan-' || i, i || '.fcs', 1000 + i, 'query-plan/' || i || '.fcs', 'IDENTITY', 1000 + i, i % 10 = 0, now() - i / 2 * interval '1 minute',
+                CASE WHEN i % 4 = 0 THEN blobs.ids[1 + i % array_length(blobs.ids, 1)] END,
+                CASE WHEN i / 1000 % 10 = 0 THEN users.first_id ELSE users.ids[1 + i % array_length(users.ids, 1)] END,
+                batches.ids[1 + i / 2 % array_length(batches.ids, 1)]
+            FROM
+                generate_series(1, :file_count) AS i,
+                (SELECT array_agg(id) AS ids, min(id) AS first_id FROM users WHERE username LIKE 'query-plan-%') AS users,
+                (SELECT array_agg(id) AS ids FROM upload_batches WHERE batch_idno LIKE 'query-plan-%') AS batches,
+                (SELECT array_agg(id) AS ids FROM fcs_blobs WHERE s3_key LIKE 'query-plan/%') AS blobs
+        '''), {'file_count': _FILE_COUNT})
+        connection.execute(text('''
+            INSERT INTO fcs_metadata (fcs_version, pnn_labels, event_count, text_begin, text_end, data_begin, data_end, analysis_begin, analysis_end, keywords, fcs_file_id)
+            SELECT '3.1', '[]', 1000, 58, 2047, 2048, 10000, 0, 0, '{}', id FROM fcs_files WHERE file_idno LIKE 'query-plan-%' AND id % 2 = 0
+        '''))
+        connection.execute(text('''
+            INSERT INTO user_files_stats (user_id, upload_batch_id, public, files_count, files_size_byte_sum)
+            SELECT user_id, upload_batch_id, public, count(*), sum(file_size_byte) FROM fcs_files GROUP BY user_id, upload_batch_id, public
+        '''))
+        connection.execute(text('''
+            INSERT INTO user_files_totals (user_id, public, files_count, files_size_byte_sum)
+            SELECT user_id, public, count(*), sum(file_size_byte) FROM fcs_files GROUP BY user_id, public
+        '''))
+        connection.execute(text('''
+            INSERT INTO jobs (queue_job_id, job_type, job_args, status, result, user_id)
+            SELECT
+                gen_random_uuid(), CASE WHEN i % 2 = 0 THEN 'FILES_STAT' ELSE 'FCS_INFO' END, '{}', 'FINISHED', '{}',
+                CASE WHEN i % 10 < 2 THEN users.first_id ELSE users.ids[1 + i % array_length(users.ids, 1)] END
+            FROM generate_series(1, :job_count) AS i, (SELECT array_agg(id) AS ids, min(id) AS first_id FROM users WHERE username LIKE 'query-plan-%') AS users
+        '''), {'job_count': _JOB_COUNT})
+        for table in _TABLES: connection.execute(text(f'ANALYZE {table}'))
+
+        TestQueryPlan.large_tables = set(connection.execute(text(
+            "SELECT relname FROM pg_class WHERE relkind = 'r' AND relnamespace = CAST(:schema AS regnamespace) AND reltuples > :row_count"
+        ), {'schema': _SCHEMA, 'row_count': _LARGE_TABLE_ROW_COUNT}).scalars())
+        assert set(_TABLES) <= TestQueryPlan.large_tables
+
+        # 第 20 個檔案有 blob，擁有者是持有一成檔案與 job 之重度用戶。
+        TestQueryPlan.file = FcsFile.model_validate(connection.execute(select(FcsFile).where(FcsFile.file_idno == 'query-plan-20')).one()._mapping)
+        TestQueryPlan.user = User.model_validate(connection.execute(select(User).where(User.id == TestQueryPlan.file.user_id)).one()._mapping)
+        TestQueryPlan.batch = UploadBatch.model_validate(connection.execute(select(UploadBatch).where(UploadBatch.id == TestQueryPlan.file.upload_batch_id)).one()._mapping)
+        TestQueryPlan.blob = FcsBlob.model_validate(connection.execute(select(FcsBlob).where(FcsBlob.id == TestQueryPlan.file.blob_id)).one()._mapping)
+        TestQueryPlan.job = Job.model_validate(connection.execute( # 重度用戶 job 之中段，分頁游標前後都還有上萬列
+            select(Job).where(Job.user_id == TestQueryPlan.user.id).order_by(Job.id).offset(_JOB_COUNT // 10).limit(1)
+        ).one()._mapping)
+
+
+    @pytest.mark.asyncio
+    async def test_user_by_username(self):
+        self._assert_no_seq_scan(select(User).where(User.username == TestQueryPlan.user.username))
+
+
+    @pytest.mark.asyncio
+    async def test_file_by_idno(self):
+        self._assert_no_seq_scan(select(FcsFile).where(FcsFile.file_idno == TestQueryPlan.file.file_idno).options(joinedload(FcsFile.upload_batch)))
+        self._assert_no_seq_scan(select(FcsFile).where(FcsFile.file_idno == TestQueryPlan.file.file_idno).where(FcsFile.user_id == TestQueryPlan.user.id))
+        self._assert_no_seq_scan(
+            select(FcsFile).where(FcsFile.file_idno == TestQueryPlan.file.file_idno).where(FcsFile.user_id == TestQueryPlan.user.id)
+            .options(joinedload(FcsFile.fcs_metadata), joinedload(FcsFile.upload_batch))
+        )
+
+
+    @pytest.mark.asyncio
+    async def test_user_files(self):
+        # 游標取重度用戶資料之中段，前後都還有上萬列；游標若在尾端，剩沒幾列時排序本來就比較便宜。
+        middle = FcsFile.model_validate(TestQueryPlan.connection.execute(select(FcsFile).where(FcsFile.file_idno == 'query-plan-100000')).one()._mapping)
+        assert middle.user_id == TestQueryPlan.user.id
+        for sort_column, cursor_value in [(FcsFile.upload_time, middle.upload_time), (FcsFile.file_size_byte, middle.file_size_byte)]:
+            for descending in [False, True]:
+                for cursor in [None, encode_cursor(sort='sort', descending=descending, values=[cursor_value, middle.id])]:
+                    self._assert_no_seq_scan(paginate(
+                        select(*FILE_INFO_COLUMNS).where(FcsFile.user_id == TestQueryPlan.user.id),
+                        sort='sort', sort_columns=(sort_column, FcsFile.id), cursor=cursor, limit=PAGE_LIMIT_DEFAULT, descending=descending,
+                    ), index_ordered=True)
+
+
+    @pytest.mark.asyncio
+    async def test_search_files(self):
+        for condition in [
+            FcsFile.file_name.ilike('%1000%'),
+            FcsFile.file_name.ilike('1000%'),
+            FcsFile.file_size_byte.between(100000, 110000),
+            FcsFile.upload_time >= TestQueryPlan.file.upload_time,
+            FcsFile.upload_batch_id == TestQueryPlan.batch.id,
+        ]:
+            self._assert_no_seq_scan(paginate(
+                select(*FILE_INFO_COLUMNS).where(FcsFile.user_id == TestQueryPlan.user.id).where(condition),
+                sort='sort', sort_columns=(FcsFile.upload_time, FcsFile.id), cursor=None, limit=PAGE_LIMIT_DEFAULT,
+            ))
+
+
+    @pytest.mark.asyncio
+    async def test_download_urls(self):
+        file_idnos = [TestQueryPlan.file.file_idno] + [f'query-plan-{i}' for i in range(1, 1000)]
+        self._assert_no_seq_scan(
+            select(FcsFile.file_idno, FcsFile.s3_key, FcsFile.public)
+            .where(FcsFile.file_idno.in_(file_idnos)).where(fcs_file_readable_by(TestQueryPlan.user))
+        )
+
+
+    @pytest.mark.asyncio
+    async def test_batch_files(self):
+        self._assert_no_seq_scan(select(UploadBatch).where(UploadBatch.batch_idno == TestQueryPlan.batch.batch_idno))
+        self._assert_no_seq_scan(
+            select(FcsFile).where(FcsFile.upload_batch_id == TestQueryPlan.batch.id).where(fcs_file_readable_by(TestQueryPlan.user)).order_by(FcsFile.id)
+        )
+
+
+    @pytest.mark.asyncio
+    async def test_find_blob(self):
+        self._assert_no_seq_scan(
+            select(FcsBlob).where(FcsBlob.sha256 == TestQueryPlan.blob.sha256).where(FcsBlob.files.any(fcs_file_readable_by(TestQueryPlan.user)))
+        )
+
+
+    @pytest.mark.asyncio
+    async def test_user_jobs(self):
+        for job_type in JobTypeEnum:
+            for cursor in [None, encode_cursor(sort='id', descending=False, values=[TestQueryPlan.job.id])]:
+                self._assert_no_seq_scan(paginate(
+                    select(*JOB_READ_COLUMNS).where(Job.user_id == TestQueryPlan.user.id).where(Job.job_type == job_type),
+                    sort='id', sort_columns=(Job.id,), cursor=cursor, limit=PAGE_LIMIT_DEFAULT,
+                ), index_ordered=True)
+            self._assert_no_seq_scan(
+                select(Job).where(Job.queue_job_id == TestQueryPlan.job.queue_job_id).where(Job.user_id == TestQueryPlan.user.id).where(Job.job_type == job_type)
+            )
+
+
+    @pytest.mark.asyncio
+    async def test_files_stat(self):
+        '''
+        檔案統計讀 user_files_totals，依批次細分者讀 user_files_stats；job-service 之 do_files_stat 亦讀 user_files_totals。
+        依批次細分時要取回該用戶每個批次，列數與批次數成正比，join upload_batches 走 Seq Scan 亦屬合理，不在此檢查。
+        '''
+        for breakdown in [set(), {FilesStatBreakdownEnum.VISIBILITY}]:
+            _, statement = files_stat_statement(user_id=TestQueryPlan.user.id, breakdown=breakdown)
+            self._assert_no_seq_scan(statement)
+
+
+    @pytest.mark.asyncio
+    async def test_user_file_writes(self):
+        '''公開與否異動與刪除之 UPDATE、DELETE 與 blob 引用數之遞減。'''
+        self._assert_no_seq_scan(
+            update(FcsFile).where(FcsFile.file_idno == TestQueryPlan.file.file_idno).where(FcsFile.user_id == TestQueryPlan.user.id)
+            .where(FcsFile.public != True).values(public=True)
+        )
+        self._assert_no_seq_scan(delete(FcsFile).where(FcsFile.file_idno == TestQueryPlan.file.file_idno).where(FcsFile.user_id == TestQueryPlan.user.id))
+        self._assert_no_seq_scan(update(FcsBlob).where(FcsBlob.id == TestQueryPlan.blob.id).values(ref_count=FcsBlob.ref_count - 1))
+
+
+    @pytest.mark.asyncio
+    async def test_teardown(self):
+        TestQueryPlan.connection.rollback()
+        TestQueryPlan.connection.close()
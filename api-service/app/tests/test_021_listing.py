@@ -0,0 +1,143 @@
+from datetime import UTC, datetime, timedelta
+from http import HTTPStatus
+from uuid import uuid4
+
+from httpx import AsyncClient
+import pytest
+from sqlalchemy import event
+from sqlmodel import Session, delete, select
+from ulid import ULID
+
+from app.db import FcsFile, Job, JobStatusEnum, JobTypeEnum, UploadBatch, User, _async_engine
+from app.models import FileInfoPage, JobReadPage, Token
+
+
+
+class TestListing:
+    '''
+    列表端點之查詢數不隨列數增加，分頁走完剛好涵蓋所有資料且順序正確。
+
+    資料直接寫入資料庫，不經上傳，故不需要 S3。
+    '''
+    async_client: AsyncClient
+    user_id: int
+    file_count = 0
+    statement_count = 0
+
+
+    @staticmethod
+    def _count_statement(*args):
+        TestListing.statement_count += 1
+
+
+    @staticmethod
+    def _seed(db_session: Session, count: int):
+        # 上傳時間與大小刻意不與建立順序一致，也有相同之值，檢查排序與同值時依 id 接續。
+        upload_time = datetime(2025, 10, 16, 18, tzinfo=UTC)
+        for _ in range(count):
+            TestListing.file_count += 1
+            batch = UploadBatch(batch_idno=str(ULID()), upload_time=upload_time - timedelta(minutes=TestListing.file_count % 7))
+            db_session.add(batch)
+            db_session.flush()
+            db_session.add(FcsFile(
+                file_idno=str(ULID()), file_name='a.fcs', file_size_byte=TestListing.file_count % 5, s3_key='a.fcs', public=False,
+                upload_time=batch.upload_time, user_id=TestListing.user_id, upload_batch_id=batch.id,
+            ))
+            for job_type in JobTypeEnum: db_session.add(Job(
+                queue_job_id=uuid4(), job_type=job_type, job_args={'user_id': TestListing.user_id}, status=JobStatusEnum.FINISHED,
+                user_id=TestListing.user_id,
+            ))
+        db_session.commit()
+
+
+    async def _get(self, path: str, params: dict | None = None):
+        TestListing.statement_count = 0
+        event.listen(_async_engine.sync_engine, 'before_cursor_execute', TestListing._count_statement)
+        try: response = await TestListing.async_client.get(path, params=params)
+        finally: event.remove(_async_engine.sync_engine, 'before_cursor_execute', TestListing._count_statement)
+        assert response.status_code == HTTPStatus.OK
+        return TestListing.statement_count, response.json()
+
+
+    @pytest.mark.asyncio
+    async def test_seed(self, async_client: AsyncClient, new_user: User, db_session: Session):
+        TestListing.async_client = async_client
+        TestListing.user_id = new_user.id
+
+        sign_in_response = await async_client.post('/auth/sign-in', data={'username': new_user.username, 'password': new_user.username})
+        access_token = Token.model_validate(sign_in_response.json())
+        async_client.headers.update({'Authorization': f'{access_token.token_type} {access_token.access_token}'})
+        TestListing._seed(db_session=db_session, count=1)
+
+
+    @pytest.mark.asyncio
+    async def test_query_count_is_constant(self, db_session: Session):
+        paths = ['/files/mine', '/me/files/stat-jobs', '/fcs-files/fcs-info-jobs']
+        await self._get(paths[0]) # 先讓登入用戶進快取，之後每個請求之查詢數才一致
+        before = {path: await self._get(path) for path in paths}
+        TestListing._seed(db_session=db_session, count=50)
+        after = {path: await self._get(path) for path in paths}
+        for path in paths:
+            assert len(before[path][1]['items']) == 1
+            assert len(after[path][1]['items']) == 51
+            assert after[path][0] == before[path][0], path
+
+
+    @pytest.mark.asyncio
+    async def test_paginate_files(self):
+        for sort, key in [('upload_time', lambda f: f.upload_time), ('size', lambda f: f.file_size_byte)]:
+            for descending in [False, True]:
+                files = []
+                cursor = None
+                while True:
+                    params = {'limit': 7, 'sort': sort, 'descending': descending} | ({'after': cursor} if cursor else {})
+                    _, page_dict = await self._get('/files/mine', params=params)
+                    page = FileInfoPage.model_validate(page_dict)
+                    assert len(page.items) <= 7
+                    files += page.items
+                    if not page.next_cursor: break
+                    cursor = page.next_cursor
+                assert len({f.file_idno for f in files}) == len(files) == TestListing.file_count
+                assert [key(f) for f in files] == sorted((key(f) for f in files), reverse=descending)
+
+
+    @pytest.mark.asyncio
+    async def test_paginate_jobs(self):
+        for path in ['/me/files/stat-jobs', '/fcs-files/fcs-info-jobs']:
+            _, first_dict = await self._get(path, params={'limit': 50})
+            first = JobReadPage.model_validate(first_dict)
+            assert len(first.items) == 50 and first.next_cursor
+            _, second_dict = await self._get(path, params={'limit': 50, 'after': first.next_cursor})
+            second = JobReadPage.model_validate(second_dict)
+            assert len(second.items) == 1 and second.next_cursor is None
+            assert second.items[0].queue_job_id not in {j.queue_job_id for j in first.items}
+
+
+    @pytest.mark.asyncio
+    async def test_invalid_cursor(self):
+        response = await TestListing.async_client.get('/files/mine', params={'after': 'invalid'})
+        assert response.status_code == HTTPStatus.BAD_REQUEST
+        _, page_dict = await self._get('/files/mine', params={'limit': 1})
+        response = await TestListing.async_client.get('/files/mine', params={'after': page_dict['next_cursor'], 'sort': 'size'})
+        assert response.status_code == HTTPStatus.BAD_REQUEST
+
+
+    @pytest.mark.asyncio
+    async def test_openapi_schema(self):
+        '''列表回應不經 FastAPI 序列化，文件仍須標示回傳型別。'''
+        response = await TestListing.async_client.get('/openapi.json')
+        paths = response.json()['paths']
+        for path, schema_name in [('/files/mine', 'FileInfoPage'), ('/me/files/stat-jobs', 'JobReadPage'), ('/fcs-files/fcs-info-jobs', 'JobReadPage')]:
+            schema = paths[path]['get']['responses']['200']['content']['application/json']['schema']
+            assert schema == {'$ref': f'#/components/schemas/{schema_name}'}
+
+
+    @pytest.mark.asyncio
+    async def test_teardown(self, db_session: Session):
+        user_id = TestListing.user_id
+        batch_ids = db_session.exec(select(FcsFile.upload_batch_id).where(FcsFile.user_id == user_id)).all()
+        db_session.exec(delete(Job).where(Job.user_id == user_id))
+        db_session.exec(delete(FcsFile).where(FcsFile.user_id == user_id))
+        db_session.exec(delete(UploadBatch).where(UploadBatch.id.in_(batch_ids)))
+        db_session.exec(delete(User).where(User.id == user_id))
+        db_session.commit()
@@ -0,0 +1,113 @@
+import asyncio
+from datetime import UTC, datetime
+from http import HTTPStatus
+
+from httpx import ASGITransport, AsyncClient
+import pytest
+from sqlalchemy import event
+from sqlmodel import Session, delete
+from ulid import ULID
+
+from app.db import FcsFile, UploadBatch, User, _async_engine
+from app.main import app
+from app.models import FileInfo, Token
+
+
+
+class TestFileInfoCache:
+    '''
+    檔案資訊經 Redis 快取：命中時不查資料庫，同時 miss 只查一次，公開與否異動後立即生效。
+
+    資料直接寫入資料庫，不經上傳，故不需要 S3。
+    '''
+    async_client: AsyncClient # 已登入
+    anonymous_client: AsyncClient
+    user_id: int
+    batch_id: int
+    file_idnos: list[str]
+    statement_count = 0
+
+
+    @staticmethod
+    def _count_statement(*args):
+        TestFileInfoCache.statement_count += 1
+
+
+    async def _get_statement_count(self, *requests):
+        '''同時送出請求，回傳各回應與期間之 SQL 語句數。'''
+        TestFileInfoCache.statement_count = 0
+        event.listen(_async_engine.sync_engine, 'before_cursor_execute', TestFileInfoCache._count_statement)
+        try: responses = await asyncio.gather(*requests)
+        finally: event.remove(_async_engine.sync_engine, 'before_cursor_execute', TestFileInfoCache._count_statement)
+        return TestFileInfoCache.statement_count, responses
+
+
+    @pytest.mark.asyncio
+    async def test_seed(self, async_client: AsyncClient, new_user: User, db_session: Session):
+        TestFileInfoCache.async_client = async_client
+        TestFileInfoCache.anonymous_client = AsyncClient(base_url='http://test', transport=ASGITransport(app))
+        TestFileInfoCache.user_id = new_user.id
+
+        sign_in_response = await async_client.post('/auth/sign-in', data={'username': new_user.username, 'password': new_user.username})
+        access_token = Token.model_validate(sign_in_response.json())
+        async_client.headers.update({'Authorization': f'{access_token.token_type} {access_token.access_token}'})
+
+        batch = UploadBatch(batch_idno=str(ULID()), upload_time=datetime.now(UTC).replace(microsecond=0))
+        db_session.add(batch)
+        db_session.flush()
+        TestFileInfoCache.batch_id = batch.id
+        TestFileInfoCache.file_idnos = [str(ULID()) for _ in range(2)]
+        for file_idno in TestFileInfoCache.file_idnos: db_session.add(FcsFile(
+            file_idno=file_idno, file_name='a.fcs', file_size_byte=1, s3_key='a.fcs', public=True,
+            upload_time=batch.upload_time, user_id=new_user.id, upload_batch_id=batch.id,
+        ))
+        db_session.commit()
+
+
+    @pytest.mark.asyncio
+    async def test_hit_skips_database(self):
+        file_idno = TestFileInfoCache.file_idnos[0]
+        client = TestFileInfoCache.anonymous_client
+        miss_count, (miss,) = await self._get_statement_count(client.get(f'/files/{file_idno}'))
+        assert miss.status_code == HTTPStatus.OK and miss_count == 1
+        hit_count, (hit, url) = await self._get_statement_count(client.get(f'/files/{file_idno}'), client.get(f'/files/{file_idno}/generate-download-url'))
+        assert hit.status_code == HTTPStatus.OK and url.status_code == HTTPStatus.CREATED and hit_count == 0
+        assert FileInfo.model_validate(hit.json()) == FileInfo.model_validate(miss.json())
+        assert 's3_key' not in hit.json() and 'user_id' not in hit.json()
+
+
+    @pytest.mark.asyncio
+    async def test_concurrent_misses_are_coalesced(self):
+        file_idno = TestFileInfoCache.file_idnos[1]
+        statement_count, responses = await self._get_statement_count(*(TestFileInfoCache.anonymous_client.get(f'/files/{file_idno}') for _ in range(10)))
+        assert all(response.status_code == HTTPStatus.OK for response in responses)
+        assert statement_count == 1
+
+        metrics_response = await TestFileInfoCache.anonymous_client.get('/system/metrics')
+        assert 'file_info_cache_requests_total{result="coalesced"}' in metrics_response.text
+
+
+    @pytest.mark.asyncio
+    async def test_visibility_change_invalidates(self):
+        file_idno = TestFileInfoCache.file_idnos[0]
+        response = await TestFileInfoCache.async_client.post(f'/files/mine/{file_idno}/make-private')
+        assert response.status_code == HTTPStatus.OK
+        response = await TestFileInfoCache.anonymous_client.get(f'/files/{file_idno}')
+        assert response.status_code == HTTPStatus.NOT_FOUND
+        response = await TestFileInfoCache.anonymous_client.get(f'/files/{file_idno}/generate-download-url')
+        assert response.status_code == HTTPStatus.NOT_FOUND
+        response = await TestFileInfoCache.async_client.get(f'/files/{file_idno}')
+        assert response.status_code == HTTPStatus.OK and FileInfo.model_validate(response.json()).public is False
+
+        response = await TestFileInfoCache.async_client.post(f'/files/mine/{file_idno}/make-public')
+        assert response.status_code == HTTPStatus.OK
+        response = await TestFileInfoCache.anonymous_client.get(f'/files/{file_idno}')
+        assert response.status_code == HTTPStatus.OK and FileInfo.model_validate(response.json()).public is True
+
+
+    @pytest.mark.asyncio
+    async def test_teardown(self, db_session: Session):
+        db_session.exec(delete(FcsFile).where(FcsFile.user_id == TestFileInfoCache.user_id))
+        db_session.exec(delete(UploadBatch).where(UploadBatch.id == TestFileInfoCache.batch_id))
+        db_session.exec(delete(User).where(User.id == TestFileInfoCache.user_id))
+        db_session.commit()
@@ -0,0 +1,113 @@
+from datetime import UTC, datetime
+from http import HTTPStatus
+from uuid import uuid4
+
+from httpx import AsyncClient
+import pytest
+from sqlmodel import Session, delete, select
+from ulid import ULID
+
+from app.db import FcsFile, Job, JobStatusEnum, JobTypeEnum, UploadBatch, User
+from app.etag import CACHE_CONTROL_IMMUTABLE, CACHE_CONTROL_REVALIDATE
+from app.models import FilesStat, FilesStatJobRead, Token
+
+
+
+class TestConditionalGet:
+    '''
+    Job 與檔案資訊之 ETag：帶 If-None-Match 且版本未變時回 304 不含本體，已完成之 job 標為 immutable。
+
+    資料直接寫入資料庫，不經上傳與 job queue，故不需要 S3 與 worker。
+    '''
+    async_client: AsyncClient
+    user_id: int
+    batch_id: int
+    file_idno: str
+    job_id: str
+    job_etag: str
+
+
+    @pytest.mark.asyncio
+    async def test_seed(self, async_client: AsyncClient, new_user: User, db_session: Session):
+        TestConditionalGet.async_client = async_client
+        TestConditionalGet.user_id = new_user.id
+
+        sign_in_response = await async_client.post('/auth/sign-in', data={'username': new_user.username, 'password': new_user.username})
+        access_token = Token.model_validate(sign_in_response.json())
+        async_client.headers.update({'Authorization': f'{access_token.token_type} {access_token.access_token}'})
+
+        batch = UploadBatch(batch_idno=str(ULID()), upload_time=datetime.now(UTC).replace(microsecond=0))
+        db_session.add(batch)
+        db_session.flush()
+        TestConditionalGet.batch_id = batch.id
+        TestConditionalGet.file_idno = str(ULID())
+        db_session.add(FcsFile(
+            file_idno=TestConditionalGet.file_idno, file_name='a.fcs', file_size_byte=1, s3_key='a.fcs', public=True,
+            upload_time=batch.upload_time, user_id=new_user.id, upload_batch_id=batch.id,
+        ))
+        job = Job(queue_job_id=uuid4(), job_type=JobTypeEnum.FILES_STAT, job_args={'user_id': new_user.id}, status=JobStatusEnum.PENDING, user_id=new_user.id)
+        db_session.add(job)
+        db_session.commit()
+        TestConditionalGet.job_id = str(job.queue_job_id)
+
+
+    @pytest.mark.asyncio
+    async def test_pending_job(self):
+        response = await TestConditionalGet.async_client.get(f'/me/files/stat-jobs/{TestConditionalGet.job_id}')
+        assert response.status_code == HTTPStatus.OK
+        assert response.headers['Cache-Control'] == CACHE_CONTROL_REVALIDATE
+        TestConditionalGet.job_etag = response.headers['ETag']
+
+        response = await TestConditionalGet.async_client.get(
+            f'/me/files/stat-jobs/{TestConditionalGet.job_id}', headers={'If-None-Match': TestConditionalGet.job_etag},
+        )
+        assert response.status_code == HTTPStatus.NOT_MODIFIED
+        assert response.content == b''
+        assert response.headers['ETag'] == TestConditionalGet.job_etag
+
+
+    @pytest.mark.asyncio
+    async def test_finished_job(self, db_session: Session):
+        job = db_session.exec(select(Job).where(Job.user_id == TestConditionalGet.user_id)).one()
+        job.status = JobStatusEnum.FINISHED
+        job.job_working_duration_second = 0.01
+        job.result = FilesStat(files_count=1, files_size_byte_sum=1).model_dump()
+        db_session.add(job)
+        db_session.commit()
+
+        response = await TestConditionalGet.async_client.get(
+            f'/me/files/stat-jobs/{TestConditionalGet.job_id}', headers={'If-None-Match': TestConditionalGet.job_etag},
+        )
+        assert response.status_code == HTTPStatus.OK
+        assert response.headers['Cache-Control'] == CACHE_CONTROL_IMMUTABLE
+        assert response.headers['ETag'] != TestConditionalGet.job_etag
+        assert FilesStatJobRead.model_validate(response.json()).result == FilesStat(files_count=1, files_size_byte_sum=1)
+
+        response = await TestConditionalGet.async_client.get(
+            f'/me/files/stat-jobs/{TestConditionalGet.job_id}', headers={'If-None-Match': f'"other", {response.headers["ETag"]}'},
+        )
+        assert response.status_code == HTTPStatus.NOT_MODIFIED
+
+
+    @pytest.mark.asyncio
+    async def test_file_info(self):
+        path = f'/files/{TestConditionalGet.file_idno}'
+        response = await TestConditionalGet.async_client.get(path)
+        assert response.status_code == HTTPStatus.OK
+        etag = response.headers['ETag']
+        response = await TestConditionalGet.async_client.get(path, headers={'If-None-Match': etag})
+        assert response.status_code == HTTPStatus.NOT_MODIFIED
+
+        await TestConditionalGet.async_client.post(f'/files/mine/{TestConditionalGet.file_idno}/make-private')
+        response = await TestConditionalGet.async_client.get(path, headers={'If-None-Match': etag})
+        assert response.status_code == HTTPStatus.OK
+        assert response.headers['ETag'] != etag
+
+
+    @pytest.mark.asyncio
+    async def test_teardown(self, db_session: Session):
+        db_session.exec(delete(Job).where(Job.user_id == TestConditionalGet.user_id))
+        db_session.exec(delete(FcsFile).where(FcsFile.user_id == TestConditionalGet.user_id))
+        db_session.exec(delete(UploadBatch).where(UploadBatch.id == TestConditionalGet.batch_id))
+        db_session.exec(delete(User).where(User.id == TestConditionalGet.user_id))
+        db_session.commit()
@@ -0,0 +1,116 @@
+from datetime import UTC, datetime, timedelta
+from http import HTTPStatus
+
+from httpx import AsyncClient
+import pytest
+from sqlmodel import Session, delete, select
+from ulid import ULID
+
+from app.db import FcsFile, UploadBatch, User
+from app.models import FileInfoPage, Token
+
+
+
+_UPLOAD_TIME = datetime(2025, 10, 16, 18, tzinfo=UTC)
+
+
+
+class TestFileSearch:
+    '''
+    /files/search 之各條件與分頁，只搜得到自己的檔案。
+
+    資料直接寫入資料庫，不經上傳，故不需要 S3。
+    '''
+    async_client: AsyncClient
+    user_id: int
+    other_user_id: int
+    batch_idnos: list[str]
+
+
+    async def _search(self, **params) -> list[str]:
+        '''走完所有分頁，回傳檔名。'''
+        file_names = []
+        cursor = None
+        while True:
+            response = await TestFileSearch.async_client.get('/files/search', params=params | {'limit': 2} | ({'after': cursor} if cursor else {}))
+            assert response.status_code == HTTPStatus.OK
+            page = FileInfoPage.model_validate(response.json())
+            file_names += [f.file_name for f in page.items]
+            if not page.next_cursor: return file_names
+            cursor = page.next_cursor
+
+
+    @pytest.mark.asyncio
+    async def test_seed(self, async_client: AsyncClient, new_user: User, db_session: Session):
+        TestFileSearch.async_client = async_client
+        TestFileSearch.user_id = new_user.id
+        other_user = User(username=f'other-{new_user.username}', hashed_password='', email_verified=False)
+        db_session.add(other_user)
+
+        sign_in_response = await async_client.post('/auth/sign-in', data={'username': new_user.username, 'password': new_user.username})
+        access_token = Token.model_validate(sign_in_response.json())
+        async_client.headers.update({'Authorization': f'{access_token.token_type} {access_token.access_token}'})
+
+        batches = [UploadBatch(batch_idno=str(ULID()), upload_time=_UPLOAD_TIME + timedelta(days=i)) for i in range(2)]
+        db_session.add_all(batches)
+        db_session.flush()
+        TestFileSearch.other_user_id = other_user.id
+        TestFileSearch.batch_idnos = [batch.batch_idno for batch in batches]
+        # （檔名, 大小, 批次, 公開）；上傳時間同批次。
+        for file_name, size_byte, batch, public, user_id in [
+            ('AML_tube1.fcs', 100, batches[0], True, new_user.id),
+            ('aml_tube2.fcs', 200, batches[0], False, new_user.id),
+            ('CLL_tube1.fcs', 300, batches[0], True, new_user.id),
+            ('control_AML.fcs', 400, batches[1], False, new_user.id),
+            ('100%_done.fcs', 500, batches[1], True, new_user.id),
+            ('AML_other.fcs', 100, batches[1], True, other_user.id),
+        ]: db_session.add(FcsFile(
+            file_idno=str(ULID()), file_name=file_name, file_size_byte=size_byte, s3_key=file_name, public=public,
+            upload_time=batch.upload_time, user_id=user_id, upload_batch_id=batch.id,
+        ))
+        db_session.commit()
+
+
+    @pytest.mark.asyncio
+    async def test_name(self):
+        assert await self._search(name='aml') == ['AML_tube1.fcs', 'aml_tube2.fcs', 'control_AML.fcs']
+        assert await self._search(name_prefix='aml') == ['AML_tube1.fcs', 'aml_tube2.fcs']
+        assert await self._search(name='tube', name_prefix='c') == ['CLL_tube1.fcs']
+        # LIKE 之萬用字元照字面比對。
+        assert await self._search(name='%') == ['100%_done.fcs']
+        assert await self._search(name='_tube1') == ['AML_tube1.fcs', 'CLL_tube1.fcs']
+        assert await self._search(name='l_t') == ['AML_tube1.fcs', 'aml_tube2.fcs', 'CLL_tube1.fcs']
+        assert await self._search(name='x_x') == []
+
+
+    @pytest.mark.asyncio
+    async def test_size_and_time(self):
+        assert await self._search(min_size_byte=200, max_size_byte=400, sort='size', descending=True) == [
+            'control_AML.fcs', 'CLL_tube1.fcs', 'aml_tube2.fcs',
+        ]
+        assert await self._search(uploaded_after=(_UPLOAD_TIME + timedelta(days=1)).isoformat()) == ['control_AML.fcs', '100%_done.fcs']
+        assert await self._search(uploaded_before=(_UPLOAD_TIME + timedelta(days=1)).isoformat(), min_size_byte=200) == ['aml_tube2.fcs', 'CLL_tube1.fcs']
+
+
+    @pytest.mark.asyncio
+    async def test_visibility_and_batch(self):
+        assert await self._search(public=False) == ['aml_tube2.fcs', 'control_AML.fcs']
+        assert await self._search(batch_idno=TestFileSearch.batch_idnos[1]) == ['control_AML.fcs', '100%_done.fcs']
+        assert await self._search(batch_idno=TestFileSearch.batch_idnos[1], public=True, name='done') == ['100%_done.fcs']
+        assert await self._search(batch_idno='unknown') == []
+
+
+    @pytest.mark.asyncio
+    async def test_unauthorized(self, async_client: AsyncClient):
+        response = await async_client.get('/files/search', params={'name': 'aml'})
+        assert response.status_code == HTTPStatus.UNAUTHORIZED
+
+
+    @pytest.mark.asyncio
+    async def test_teardown(self, db_session: Session):
+        user_ids = [TestFileSearch.user_id, TestFileSearch.other_user_id]
+        batch_ids = db_session.exec(select(UploadBatch.id).where(UploadBatch.batch_idno.in_(TestFileSearch.batch_idnos))).all()
+        db_session.exec(delete(FcsFile).where(FcsFile.user_id.in_(user_ids)))
+        db_session.exec(delete(UploadBatch).where(UploadBatch.id.in_(batch_ids)))
+        db_session.exec(delete(User).where(User.id.in_(user_ids)))
+        db_session.commit()
@@ -0,0 +1,192 @@
+from datetime import UTC, datetime
+import hashlib
+from http import HTTPStatus
+from uuid import UUID
+
+from httpx import AsyncClient
+import pytest
+from sqlmodel import Session, delete, select
+from ulid import ULID
+
+from app.db import FcsBlob, FcsFile, Job, JobStatusEnum, UploadBatch, User, UserFilesStat, UserFilesTotal, get_db_session
+from app.metrics import UploadMetrics
+from app.models import FilesStat, FilesStatGroup, FilesStatJobRead, FilesStatReport, Token
+from app.presign import download_url_signer
+from app.upload import register_upload_batch
+
+
+
+class TestUserFilesStat:
+    '''
+    檔案統計由計數作答：上傳、公開與否異動與刪除後立即反映，files stat job 建立時即完成。
+
+    上傳直接呼叫 register_upload_batch 登記，不經 S3；內容相同之兩個檔案共用一個 blob。
+    '''
+    async_client: AsyncClient
+    user_id: int
+    other_user_id: int
+    batch_idnos: list[str]
+    file_idnos: list[str]
+    other_file_idno: str
+    blob_sha256 = hashlib.sha256(str(ULID()).encode()).hexdigest()
+
+
+    async def _get_stat(self, *breakdown: str):
+        response = await TestUserFilesStat.async_client.get('/me/files/stat', params={'breakdown': list(breakdown)})
+        assert response.status_code == HTTPStatus.OK
+        return FilesStatReport.model_validate(response.json())
+
+
+    @staticmethod
+    async def _upload(user: User, files: list[tuple[str, int, bool, str | None]]):
+        '''files 為（檔名, 大小, 公開, sha256）；相同 sha256 者第二個起標為已去重複，指向第一個之 key。'''
+        batch = UploadBatch(batch_idno=str(ULID()), upload_time=datetime.now(UTC).replace(microsecond=0))
+        keys: dict[str, str] = {}
+        results = []
+        for file_name, size_byte, public, sha256 in files:
+            key = f'{batch.batch_idno}/{file_name}'
+            result = {'success': True, 'filename': file_name, 'size_byte': size_byte, 'key': keys.get(sha256, key), 'public': public}
+            if sha256: result.update(sha256=sha256, deduplicated=sha256 in keys)
+            keys.setdefault(sha256, key)
+            results.append(result)
+        async for db_session in get_db_session():
+            response = await register_upload_batch(
+                db_session=db_session, s3_client=None, batch=batch, results=results, user=user, metrics=UploadMetrics(route='test'),
+            )
+        return response
+
+
+    @pytest.mark.asyncio
+    async def test_seed(self, async_client: AsyncClient, new_user: User, db_session: Session):
+        TestUserFilesStat.async_client = async_client
+        TestUserFilesStat.user_id = new_user.id
+        other_user = User(username=f'other-{new_user.username}', hashed_password='', email_verified=False)
+        db_session.add(other_user)
+        db_session.commit()
+        TestUserFilesStat.other_user_id = other_user.id
+
+        sign_in_response = await async_client.post('/auth/sign-in', data={'username': new_user.username, 'password': new_user.username})
+        access_token = Token.model_validate(sign_in_response.json())
+        async_client.headers.update({'Authorization': f'{access_token.token_type} {access_token.access_token}'})
+
+        sha256 = TestUserFilesStat.blob_sha256
+        batches = [
+            await self._upload(new_user, [('a.fcs', 100, True, sha256), ('b.fcs', 100, False, sha256), ('c.fcs', 300, True, None)]),
+            await self._upload(new_user, [('d.fcs', 400, False, None)]),
+        ]
+        other_batch = await self._upload(other_user, [('e.fcs', 500, True, None)])
+        TestUserFilesStat.batch_idnos = [batch.batch_idno for batch in (*batches, other_batch)]
+        TestUserFilesStat.file_idnos = [file.file_idno for batch in batches for file in batch.files]
+        TestUserFilesStat.other_file_idno = other_batch.files[0].file_idno
+        assert db_session.exec(select(FcsBlob.ref_count).where(FcsBlob.sha256 == sha256)).one() == 2
+
+
+    @pytest.mark.asyncio
+    async def test_stat(self):
+        stat = await self._get_stat()
+        assert (stat.files_count, stat.files_size_byte_sum, stat.groups) == (4, 900, [])
+        assert (await self._get_stat('visibility')).groups == [
+            FilesStatGroup(public=False, files_count=2, files_size_byte_sum=500), FilesStatGroup(public=True, files_count=2, files_size_byte_sum=400),
+        ]
+        first_batch, second_batch = TestUserFilesStat.batch_idnos[:2]
+        assert (await self._get_stat('batch')).groups == [
+            FilesStatGroup(batch_idno=first_batch, files_count=3, files_size_byte_sum=500),
+            FilesStatGroup(batch_idno=second_batch, files_count=1, files_size_byte_sum=400),
+        ]
+        stat = await self._get_stat('batch', 'visibility')
+        assert stat.files_count == 4 and stat.groups == [
+            FilesStatGroup(batch_idno=first_batch, public=False, files_count=1, files_size_byte_sum=100),
+            FilesStatGroup(batch_idno=first_batch, public=True, files_count=2, files_size_byte_sum=400),
+            FilesStatGroup(batch_idno=second_batch, public=False, files_count=1, files_size_byte_sum=400),
+        ]
+
+
+    @pytest.mark.asyncio
+    async def test_visibility_change(self):
+        file_idno = TestUserFilesStat.file_idnos[2] # c.fcs
+        s3_key = f'{TestUserFilesStat.batch_idnos[0]}/c.fcs'
+        response = await TestUserFilesStat.async_client.get(f'/files/{file_idno}/generate-download-url')
+        assert response.status_code == HTTPStatus.CREATED
+        assert (s3_key, True) in download_url_signer._cache
+        for _ in range(2): # 已是私有者不重複移動計數
+            response = await TestUserFilesStat.async_client.post(f'/files/mine/{file_idno}/make-private')
+            assert response.status_code == HTTPStatus.OK
+        assert (s3_key, True) not in download_url_signer._cache # 已簽之網址隨公開與否異動清除
+        assert (await self._get_stat('visibility')).groups == [
+            FilesStatGroup(public=False, files_count=3, files_size_byte_sum=800), FilesStatGroup(public=True, files_count=1, files_size_byte_sum=100),
+        ]
+        response = await TestUserFilesStat.async_client.post(f'/files/mine/{TestUserFilesStat.other_file_idno}/make-private')
+        assert response.status_code == HTTPStatus.NOT_FOUND
+
+
+    @pytest.mark.asyncio
+    async def test_delete(self, db_session: Session):
+        a_idno, b_idno, *_ = TestUserFilesStat.file_idnos
+        response = await TestUserFilesStat.async_client.delete(f'/files/mine/{a_idno}')
+        assert response.status_code == HTTPStatus.OK
+        assert db_session.exec(select(FcsBlob.ref_count).where(FcsBlob.sha256 == TestUserFilesStat.blob_sha256)).one() == 1
+        response = await TestUserFilesStat.async_client.get(f'/files/{a_idno}')
+        assert response.status_code == HTTPStatus.NOT_FOUND
+
+        # 最後一個引用刪除後 blob 一併刪除。
+        response = await TestUserFilesStat.async_client.delete(f'/files/mine/{b_idno}')
+        assert response.status_code == HTTPStatus.OK
+        assert not db_session.exec(select(FcsBlob).where(FcsBlob.sha256 == TestUserFilesStat.blob_sha256)).first()
+        response = await TestUserFilesStat.async_client.delete(f'/files/mine/{b_idno}')
+        assert response.status_code == HTTPStatus.NOT_FOUND
+        response = await TestUserFilesStat.async_client.delete(f'/files/mine/{TestUserFilesStat.other_file_idno}')
+        assert response.status_code == HTTPStatus.NOT_FOUND
+
+        stat = await self._get_stat('batch')
+        assert (stat.files_count, stat.files_size_byte_sum) == (2, 700)
+        assert [group.batch_idno for group in stat.groups] == TestUserFilesStat.batch_idnos[:2]
+
+
+    @pytest.mark.asyncio
+    async def test_register_deleted_blob(self, db_session: Session):
+        '''收檔前比對到之 blob 於登記前已刪除者列為失敗，不重建指向已刪物件之 blob。'''
+        batch = UploadBatch(batch_idno=str(ULID()), upload_time=datetime.now(UTC).replace(microsecond=0))
+        TestUserFilesStat.batch_idnos.append(batch.batch_idno)
+        result = {
+            'success': True, 'filename': 'f.fcs', 'size_byte': 100, 'key': f'{TestUserFilesStat.batch_idnos[0]}/a.fcs', 'public': True,
+            'sha256': TestUserFilesStat.blob_sha256, 'deduplicated': True,
+        }
+        async for async_db_session in get_db_session():
+            response = await register_upload_batch(
+                db_session=async_db_session, s3_client=None, batch=batch, results=[result], user=db_session.get(User, TestUserFilesStat.user_id),
+                metrics=UploadMetrics(route='test'),
+            )
+        assert not response.files and [f['filename'] for f in response.failed_files] == ['f.fcs']
+        assert not db_session.exec(select(FcsBlob).where(FcsBlob.sha256 == TestUserFilesStat.blob_sha256)).first()
+        assert (await self._get_stat()).files_count == 2
+
+
+    @pytest.mark.asyncio
+    async def test_files_stat_job(self):
+        response = await TestUserFilesStat.async_client.post('/me/files/stat-jobs/create')
+        assert response.status_code == HTTPStatus.CREATED
+        response = await TestUserFilesStat.async_client.get(f'/me/files/stat-jobs/{UUID(response.json())}')
+        job = FilesStatJobRead.model_validate(response.json())
+        assert job.status == JobStatusEnum.FINISHED
+        assert job.result == FilesStat(files_count=2, files_size_byte_sum=700)
+
+
+    @pytest.mark.asyncio
+    async def test_unauthorized(self, async_client: AsyncClient):
+        response = await async_client.get('/me/files/stat')
+        assert response.status_code == HTTPStatus.UNAUTHORIZED
+        response = await async_client.delete(f'/files/mine/{TestUserFilesStat.file_idnos[2]}')
+        assert response.status_code == HTTPStatus.UNAUTHORIZED
+
+
+    @pytest.mark.asyncio
+    async def test_teardown(self, db_session: Session):
+        user_ids = [TestUserFilesStat.user_id, TestUserFilesStat.other_user_id]
+        db_session.exec(delete(Job).where(Job.user_id.in_(user_ids)))
+        db_session.exec(delete(FcsFile).where(FcsFile.user_id.in_(user_ids)))
+        db_session.exec(delete(FcsBlob).where(FcsBlob.sha256 == TestUserFilesStat.blob_sha256))
+        db_session.exec(delete(UploadBatch).where(UploadBatch.batch_idno.in_(TestUserFilesStat.batch_idnos)))
+        db_session.exec(delete(User).where(User.id.in_(user_ids))) # user_files_stats 與 user_files_totals 隨用戶刪除
+        db_session.commit()
+        assert not db_session.exec(select(UserFilesStat).where(UserFilesStat.user_id.in_(user_ids))).first()
+        assert not db_session.exec(select(UserFilesTotal).where(UserFilesTotal.user_id.in_(user_ids))).first()
@@ -0,0 +1,142 @@
+import asyncio
+from http import HTTPStatus
+
+from httpx import AsyncClient
+from pwdlib import PasswordHash
+from pwdlib.hashers.argon2 import Argon2Hasher
+import pytest
+from sqlalchemy import event
+from sqlmodel import Session, delete, select, update
+
+from app.db import User, _async_engine
+from app.models import Token
+from app.user_cache import UserCache, user_cache
+
+
+
+class TestUserCache:
+    '''
+    登入用戶經快取：命中時不查資料庫，用戶資料異動後立即失效，Redis 上之版本號讓其他副本也一併失效。
+
+    快取本身之行為以獨立之 UserCache 測，load 回傳記憶體中之 User，不需資料庫。
+    '''
+    async_client: AsyncClient
+    user_id: int
+    username: str
+    statement_count = 0
+
+
+    @staticmethod
+    def _count_statement(*args):
+        TestUserCache.statement_count += 1
+
+
+    async def _get_statement_count(self, path: str):
+        TestUserCache.statement_count = 0
+        event.listen(_async_engine.sync_engine, 'before_cursor_execute', TestUserCache._count_statement)
+        try: response = await TestUserCache.async_client.get(path)
+        finally: event.remove(_async_engine.sync_engine, 'before_cursor_execute', TestUserCache._count_statement)
+        assert response.status_code == HTTPStatus.OK
+        return TestUserCache.statement_count
+
+
+    @staticmethod
+    def _loader(loads: list[str], username: str, email_verified: bool = False):
+        async def load():
+            loads.append(username)
+            return User(id=1, username=username, hashed_password='', email_verified=email_verified)
+
+        return load
+
+
+    @pytest.mark.asyncio
+    async def test_seed(self, async_client: AsyncClient, new_user: User):
+        TestUserCache.async_client = async_client
+        TestUserCache.user_id = new_user.id
+        TestUserCache.username = new_user.username
+
+        sign_in_response = await async_client.post('/auth/sign-in', data={'username': new_user.username, 'password': new_user.username})
+        access_token = Token.model_validate(sign_in_response.json())
+        async_client.headers.update({'Authorization': f'{access_token.token_type} {access_token.access_token}'})
+
+
+    @pytest.mark.asyncio
+    async def test_hit_skips_database(self):
+        miss_count = await self._get_statement_count('/me/files/stat')
+        hit_count = await self._get_statement_count('/me/files/stat')
+        assert hit_count == miss_count - 1
+
+        # 用戶資料異動後重新查詢。
+        response = await TestUserCache.async_client.post('/auth/verify-email', json={'email': TestUserCache.username, 'verification_code': ''})
+        assert response.json() is True
+        assert await self._get_statement_count('/me/files/stat') == miss_count
+
+
+    @pytest.mark.asyncio
+    async def test_rehash_on_sign_in(self, db_session: Session):
+        '''登入時換成新參數之雜湊並 commit，快取失效。'''
+        outdated_hash = PasswordHash((Argon2Hasher(time_cost=1),)).hash(TestUserCache.username)
+        db_session.exec(update(User).where(User.id == TestUserCache.user_id).values(hashed_password=outdated_hash))
+        db_session.commit()
+        await self._get_statement_count('/me/files/stat')
+        hit_count = await self._get_statement_count('/me/files/stat')
+
+        response = await TestUserCache.async_client.post('/auth/sign-in', data={'username': TestUserCache.username, 'password': TestUserCache.username})
+        assert response.status_code == HTTPStatus.OK
+        db_session.expire_all()
+        assert db_session.exec(select(User.hashed_password).where(User.id == TestUserCache.user_id)).one() != outdated_hash
+        assert await self._get_statement_count('/me/files/stat') == hit_count + 1
+
+
+    @pytest.mark.asyncio
+    async def test_lru_and_ttl(self):
+        cache = UserCache(size=2, ttl_second=1, redis_version=False)
+        loads: list[str] = []
+        for username in ['a', 'b', 'a', 'c', 'a', 'b']: await cache.get(username=username, load=self._loader(loads, username))
+        assert loads == ['a', 'b', 'c', 'b'] # 放入 c 時淘汰最久沒用到之 b
+
+        user = await cache.get(username='a', load=self._loader(loads, 'a'))
+        assert user == User(id=1, username='a', hashed_password='', email_verified=False)
+        assert user is not await cache.get(username='a', load=self._loader(loads, 'a')) # 每次回傳新物件
+        await asyncio.sleep(1.1)
+        await cache.get(username='a', load=self._loader(loads, 'a'))
+        assert loads == ['a', 'b', 'c', 'b', 'a']
+
+
+    @pytest.mark.asyncio
+    async def test_invalidate_across_replicas(self):
+        replicas = [UserCache(size=10, ttl_second=60, redis_version=True) for _ in range(2)]
+        loads: list[str] = []
+        for replica in replicas: await replica.get(username=TestUserCache.username, load=self._loader(loads, TestUserCache.username))
+        assert len(loads) == 2
+
+        await replicas[0].invalidate(TestUserCache.username)
+        for replica in replicas:
+            user = await replica.get(username=TestUserCache.username, load=self._loader(loads, TestUserCache.username, email_verified=True))
+            assert user.email_verified
+        assert len(loads) == 4
+        await replicas[1].get(username=TestUserCache.username, load=self._loader(loads, TestUserCache.username))
+        assert len(loads) == 4
+
+
+    @pytest.mark.asyncio
+    async def test_invalidate_during_load(self):
+        '''查詢期間有 invalidate 者，查到之舊資料不回填。'''
+        cache = UserCache(size=10, ttl_second=60, redis_version=False)
+        loads: list[str] = []
+        load = self._loader(loads, 'a')
+
+        async def invalidated_load():
+            await cache.invalidate('a')
+            return await load()
+
+        await cache.get(username='a', load=invalidated_load)
+        await cache.get(username='a', load=load)
+        assert loads == ['a', 'a']
+
+
+    @pytest.mark.asyncio
+    async def test_teardown(self, db_session: Session):
+        await user_cache.invalidate(TestUserCache.username)
+        db_session.exec(delete(User).where(User.id == TestUserCache.user_id))
+        db_session.commit()
@@ -0,0 +1,247 @@
+from dataclasses import dataclass
+from enum import StrEnum
+import pathlib
+from typing import AsyncIterator
+
+from aiobotocore.client import AioBaseClient
+from fastapi import HTTPException, Request, status
+from pathvalidate import ValidationError as FileNameValidationError, validate_filename
+from python_multipart.multipart import MultipartParser, parse_options_header
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from ulid import ULID
+
+from app.db import FcsBlob, FcsFile, FcsMetadata, StorageCodecEnum, UploadBatch, User, fcs_file_readable_by
+from app.files_stat import FilesStatDelta, update_files_stat
+from app.logging import logger
+from app.metrics import UploadMetrics, UploadPhaseEnum
+from app.models import FileInfo, UploadBatchResult
+from app.s3 import delete_objects
+from app.settings import get_settings
+
+
+
+_SETTINGS = get_settings()
+FCS_FILE_MAX_SIZE_BYTE = 1000 * 1024 * 1024
+
+
+
+def validate_upload_filename(filename: str | None):
+    if not filename or pathlib.Path(filename).suffix != '.fcs':
+        raise HTTPException(status.HTTP_403_FORBIDDEN, f"File '{filename}' is not a .fcs file")
+    try: validate_filename(filename)
+    except FileNameValidationError as e:
+        logger.warning({'title': 'Invalid uploading filename', 'error': e, 'filename': filename})
+        raise HTTPException(status.HTTP_403_FORBIDDEN, f"File name '{filename}' is invalid") from e
+
+
+
+async def find_blob(db_session: AsyncSession, sha256: str, user: User | None = None, readable_only: bool = False):
+    '''
+    依內容雜湊找既有 blob。
+
+    readable_only 時只找請求者本來就讀得到之 blob（公開檔案或自己的檔案），
+    避免只憑雜湊值就取得他人私有檔案之引用；伺服器未親自驗證內容之上傳（例如預簽網址）須用此模式。
+    '''
+    statement = select(FcsBlob).where(FcsBlob.sha256 == sha256)
+    if readable_only:
+        statement = statement.where(FcsBlob.files.any(fcs_file_readable_by(user)))
+    return (await db_session.exec(statement)).first()
+
+
+
+async def get_blobs_metadata(db_session: AsyncSession, sha256s: set[str]):
+    '''
+    取出既有 blob 與任一引用檔案已解析之 metadata（都沒有解析出時為 None），回傳 sha256 對應之（blob, metadata）。
+    引用既有內容之上傳直接複製，不必再讀 S3；一個 DISTINCT ON 查詢取完，有 metadata 者優先。
+    '''
+    if not sha256s: return {}
+    statement = (
+        select(FcsBlob, FcsMetadata).where(FcsBlob.sha256.in_(sha256s))
+        .outerjoin(FcsFile, FcsFile.blob_id == FcsBlob.id).outerjoin(FcsMetadata, FcsMetadata.fcs_file_id == FcsFile.id)
+        .distinct(FcsBlob.sha256).order_by(FcsBlob.sha256, FcsMetadata.id.nulls_last())
+    )
+    return {blob.sha256: (blob, metadata) for blob, metadata in await db_session.exec(statement)}
+
+
+
+async def _upsert_blobs(db_session: AsyncSession, results: list[dict]):
+    '''
+    以一個多列 INSERT ... ON CONFLICT 新增 blob 或累加既有 blob 之 ref_count，回傳 sha256 對應之實際 blob。
+
+    同一批次內相同內容先合併成一列，一個語句不會碰同一列兩次；依 sha256 排序，並行之批次鎖列順序一致，不會互相死結。
+    '''
+    grouped: dict[str, dict] = {}
+    for result in results:
+        if result['sha256'] in grouped: grouped[result['sha256']]['ref_count'] += 1
+        else: grouped[result['sha256']] = {
+            'sha256': result['sha256'], 's3_key': result['key'], 'size_byte': result['size_byte'], 'ref_count': 1,
+            'storage_codec': result.get('storage_codec', StorageCodecEnum.IDENTITY), 'stored_size_byte': result.get('stored_size_byte', result['size_byte']),
+        }
+    if not grouped: return {}
+    statement = insert(FcsBlob).values([grouped[sha256] for sha256 in sorted(grouped)])
+    statement = statement.on_conflict_do_update(
+        index_elements=[FcsBlob.sha256], set_={'ref_count': FcsBlob.ref_count + statement.excluded.ref_count},
+    ).returning(FcsBlob.id, FcsBlob.sha256, FcsBlob.s3_key, FcsBlob.storage_codec, FcsBlob.stored_size_byte)
+    return {row.sha256: row for row in await db_session.exec(statement)}
+
+
+
+async def _lock_blobs(db_session: AsyncSession, sha256s: set[str]):
+    '''
+    以 SELECT ... FOR SHARE 鎖住仍有引用之 blob，回傳鎖到之 sha256；依 sha256 排序，與 _upsert_blobs 鎖列順序一致。
+
+    刪除檔案時遞減 ref_count 與刪除 blob 在同一交易並持有列鎖：刪除先 commit 者這裡查不到；
+    這裡先鎖到者刪除要等本交易 commit，屆時 ref_count 已含本次之引用，不會歸零，S3 物件也不會被刪。
+    '''
+    if not sha256s: return set()
+    statement = (
+        select(FcsBlob.sha256).where(FcsBlob.sha256.in_(sha256s)).where(FcsBlob.ref_count > 0)
+        .order_by(FcsBlob.sha256).with_for_update(read=True)
+    )
+    return set((await db_session.exec(statement)).all())
+
+
+
+async def register_upload_batch(
+    db_session: AsyncSession, s3_client: AioBaseClient, batch: UploadBatch, results: list[dict], user: User | None, metrics: UploadMetrics,
+):
+    '''
+    將上傳結果登記入庫。結果帶有 sha256 者以內容定址：內容已存在時改指向既有 blob，並於 commit 後刪除這次多寫入之 S3 物件。
+
+    批次、blob、檔案與 metadata 各以一個多列 INSERT 寫入，以 RETURNING 取回之資料直接組成回應，不經 ORM 逐筆 flush 與 refresh，
+    commit 時間不隨檔案數增加而明顯變長。用戶之檔案計數（user_files_stats）於同一交易內累加。
+
+    引用既有內容（deduplicated，未寫入 S3）者先鎖住 blob；收檔期間 blob 已被刪除者沒有內容可指，列為失敗，重新上傳即存成新的 blob。
+    '''
+    redundant_keys: list[str] = []
+    files: list[FcsFile] = []
+
+    with metrics.phase(UploadPhaseEnum.DB_COMMIT):
+        # 同批次另有寫入 S3 之相同內容者，由本批次之 blob 提供內容。
+        uploaded_sha256s = {r['sha256'] for r in results if r['success'] and r.get('sha256') and not r.get('deduplicated')}
+        available_sha256s = uploaded_sha256s | await _lock_blobs(
+            db_session=db_session, sha256s={r['sha256'] for r in results if r['success'] and r.get('deduplicated')} - uploaded_sha256s,
+        )
+        for result in results:
+            if result['success'] and result.get('deduplicated') and result['sha256'] not in available_sha256s:
+                result.update(success=False, error='File content was deleted during upload, upload it again')
+        failed_files = [{'filename': r['filename'], 'error': r['error']} for r in results if not r['success']]
+        succeeded = [r for r in results if r['success']]
+
+        batch_id = (await db_session.exec(
+            insert(UploadBatch).values(batch_idno=batch.batch_idno, upload_time=batch.upload_time).returning(UploadBatch.id)
+        )).scalar_one()
+        blobs = await _upsert_blobs(db_session=db_session, results=[r for r in succeeded if r.get('sha256')])
+
+        file_rows: list[dict] = []
+        for result in succeeded:
+            row = {
+                'file_idno': str(ULID()), 'file_name': result['filename'], 'file_size_byte': result['size_byte'], 's3_key': result['key'],
+                'storage_codec': result.get('storage_codec', StorageCodecEnum.IDENTITY), 'stored_size_byte': result.get('stored_size_byte', result['size_byte']),
+                'public': result['public'], 'upload_time': batch.upload_time, 'blob_id': None, 'user_id': user.id if user else None, 'upload_batch_id': batch_id,
+            }
+            if blob := blobs.get(result.get('sha256')):
+                row.update(s3_key=blob.s3_key, storage_codec=blob.storage_codec, stored_size_byte=blob.stored_size_byte, blob_id=blob.id)
+                if blob.s3_key != result['key'] and not result.get('deduplicated'): redundant_keys.append(result['key'])
+            file_rows.append(row)
+
+        if file_rows:
+            # insertmanyvalues 會把多筆參數合成多列 VALUES，並保證 RETURNING 順序與參數順序一致。
+            statement = insert(FcsFile.__table__).returning(*FcsFile.__table__.columns, sort_by_parameter_order=True)
+            files = [FcsFile.model_validate(row._mapping) for row in await db_session.exec(statement, params=file_rows)]
+            metadata_rows = [
+                r['fcs_metadata'].model_dump(exclude={'id', 'fcs_file_id'}) | {'fcs_file_id': f.id}
+                for r, f in zip(succeeded, files) if r.get('fcs_metadata')
+            ]
+            if metadata_rows: await db_session.exec(insert(FcsMetadata.__table__), params=metadata_rows)
+            await update_files_stat(db_session=db_session, deltas=(FilesStatDelta(f.user_id, f.upload_batch_id, f.public, 1, f.file_size_byte) for f in files))
+        await db_session.commit()
+
+    if redundant_keys:
+        logger.info({'title': 'Duplicate uploads deduplicated', 'keys': redundant_keys})
+        await delete_objects(s3_client=s3_client, keys=redundant_keys)
+
+    file_infos = [
+        FileInfo(file_idno=f.file_idno, file_name=f.file_name, file_size_byte=f.file_size_byte, public=f.public, upload_time=batch.upload_time)
+        for f in files
+    ]
+    return UploadBatchResult(batch_idno=batch.batch_idno, upload_time=batch.upload_time, files=file_infos, failed_files=failed_files)
+
+
+
+class MultipartEventEnum(StrEnum):
+    PART_BEGIN = 'PART_BEGIN'
+    PART_DATA = 'PART_DATA'
+    PART_END = 'PART_END'
+
+
+
+@dataclass
+class MultipartPart:
+    name: str
+    filename: str | None = None
+
+
+
+async def stream_multipart(request: Request) -> AsyncIterator[tuple[MultipartEventEnum, MultipartPart | bytes | None]]:
+    '''
+    逐段解析 multipart/form-data 請求本體，收到多少就吐多少，不會把整個本體讀進記憶體或暫存檔。
+
+    事件依序為 PART_BEGIN（MultipartPart）、零至多個 PART_DATA（bytes）、PART_END（None）。
+    '''
+    content_type, params = parse_options_header(request.headers.get('content-type', ''))
+    boundary: bytes | None = params.get(b'boundary')
+    if content_type != b'multipart/form-data' or not boundary:
+        raise HTTPException(status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, 'Request body must be multipart/form-data')
+
+    events: list[tuple[MultipartEventEnum, MultipartPart | bytes | None]] = []
+    headers: dict[bytes, bytes] = {}
+    header_field = bytearray()
+    header_value = bytearray()
+
+    def on_part_begin():
+        headers.clear()
+
+    def on_header_field(data: bytes, start: int, end: int):
+        header_field.extend(data[start:end])
+
+    def on_header_value(data: bytes, start: int, end: int):
+        header_value.extend(data[start:end])
+
+    def on_header_end():
+        headers[bytes(header_field).lower()] = bytes(header_value)
+        header_field.clear()
+        header_value.clear()
+
+    def on_headers_finished():
+        _, options = parse_options_header(headers.get(b'content-disposition', b''))
+        filename: bytes | None = options.get(b'filename')
+        events.append((MultipartEventEnum.PART_BEGIN, MultipartPart(
+            name=options.get(b'name', b'').decode(),
+            filename=filename.decode() if filename is not None else None,
+        )))
+
+    def on_part_data(data: bytes, start: int, end: int):
+        events.append((MultipartEventEnum.PART_DATA, bytes(data[start:end])))
+
+    def on_part_end():
+        events.append((MultipartEventEnum.PART_END, None))
+
+    parser = MultipartParser(boundary, {
+        'on_part_begin': on_part_begin,
+        'on_header_field': on_header_field,
+        'on_header_value': on_header_value,
+        'on_header_end': on_header_end,
+        'on_headers_finished': on_headers_finished,
+        'on_part_data': on_part_data,
+        'on_part_end': on_part_end,
+    })
+    async for chunk in request.stream():
+        parser.write(chunk)
+        _events = events.copy()
+        events.clear()
+        for event in _events: yield event
+    parser.finalize()
+    for event in events: yield event
@@ -0,0 +1,87 @@
+from collections import OrderedDict
+import time
+from typing import Any, Awaitable, Callable
+
+from redis.exceptions import RedisError
+from ulid import ULID
+
+from app.db import User
+from app.kv import kv
+from app.logging import logger
+from app.metrics import USER_CACHE_REQUESTS
+from app.settings import get_settings
+
+
+
+_SETTINGS = get_settings()
+
+
+
+class UserCache:
+    '''
+    以 token subject（username）為 key，於本 worker 快取 get_requestor_user 查到之用戶，有筆數上限（LRU）與效期（TTL），
+    輪詢等頻繁之已登入請求不必每次都查資料庫。
+
+    每筆記下查詢前讀到之版本號，用戶資料異動並 commit 後以 invalidate 換新版本號，版本不符者視為 miss。
+    redis_version 時版本號存於 Redis，每次多讀一次 Redis，各 worker 與副本立即一致；Redis 無法連線時直接查資料庫。
+    否則只清本 worker 之快取，其他 worker 與副本最多晚 TTL 才看到異動。
+    '''
+
+    def __init__(
+        self,
+        size: int = _SETTINGS.USER_CACHE_SIZE,
+        ttl_second: int = _SETTINGS.USER_CACHE_TTL_SECOND,
+        redis_version: bool = _SETTINGS.USER_CACHE_REDIS_VERSION,
+    ):
+        self.size = size
+        self.ttl_second = ttl_second
+        self.redis_version = redis_version
+        self._cache: OrderedDict[str, tuple[float, str | None, dict[str, Any]]] = OrderedDict() # username -> （過期時間, 版本號, 欄位）
+        self._invalidation_count = 0 # 本 worker 內查詢期間有 invalidate 者不回填
+
+
+    @staticmethod
+    def _kv_key(username: str): return f'user-version:{username}'
+
+
+    async def get(self, username: str, load: Callable[[], Awaitable[User | None]]):
+        '''取得快取之用戶，沒有時以 load 查詢並回填；每次回傳新的 User，不與其他請求共用物件。用戶不存在時回 None，不快取。'''
+        if self.ttl_second <= 0: return await load()
+        version = None
+        if self.redis_version:
+            try: version = await kv.get(self._kv_key(username))
+            except RedisError as error:
+                USER_CACHE_REQUESTS.labels(result='error').inc()
+                logger.warning({'title': 'Read user version failed', 'username': username, 'error': error})
+                return await load()
+
+        now = time.monotonic()
+        cached = self._cache.get(username)
+        if cached and cached[0] > now and cached[1] == version:
+            self._cache.move_to_end(username)
+            USER_CACHE_REQUESTS.labels(result='hit').inc()
+            return User.model_validate(cached[2])
+
+        USER_CACHE_REQUESTS.labels(result='miss').inc()
+        invalidation_count = self._invalidation_count
+        user = await load()
+        if not user: self._cache.pop(username, None)
+        elif invalidation_count == self._invalidation_count:
+            self._cache[username] = (now + self.ttl_second, version, user.model_dump())
+            self._cache.move_to_end(username)
+            while len(self._cache) > self.size: self._cache.popitem(last=False)
+        return user
+
+
+    async def invalidate(self, username: str):
+        '''
+        用戶資料異動並 commit 後呼叫。Redis 上之版本號每次換成新的 ULID，不會與任何舊快取相同；
+        效期同 TTL 即可，過期後讀到 None 時，版本為 None 之快取也都已過期。Redis 錯誤不吞掉，重試異動即可再 invalidate。
+        '''
+        self._cache.pop(username, None)
+        self._invalidation_count += 1
+        if self.redis_version: await kv.set(self._kv_key(username), str(ULID()), ex=max(self.ttl_second, 1))
+
+
+
+user_cache = UserCache()
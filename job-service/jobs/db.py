@@ -1,9 +1,12 @@
 from datetime import datetime
 from enum import StrEnum
+import time
 from typing import Any
 from uuid import UUID
 
 from pydantic import AwareDatetime, BaseModel, ConfigDict
+from sqlalchemy import BigInteger, Connection, event
+from sqlalchemy.pool import ConnectionPoolEntry, QueuePool
 from sqlmodel import JSON, TIMESTAMP, AutoString, Field, Relationship, SQLModel, Session, create_engine
 
 from jobs.settings import get_settings
@@ -78,6 +81,12 @@ class UploadBatch(SQLModel, table=True):
 
 
 
+class StorageCodecEnum(StrEnum):
+    IDENTITY = 'IDENTITY'
+    ZSTD = 'ZSTD'
+
+
+
 class FcsFile(SQLModel, table=True):
     __tablename__ = 'fcs_files'
 
@@ -85,8 +94,12 @@ class FcsFile(SQLModel, table=True):
     file_idno: str = Field(unique=True)
     file_name: str
     file_size_byte: int
-    s3_key: str | None = Field(unique=True)
+    s3_key: str | None = None # 內容重複之檔案共用 blob 之 key，故不唯一。
+    storage_codec: StorageCodecEnum = Field(StorageCodecEnum.IDENTITY, sa_type=AutoString)
+    stored_size_byte: int | None = None
     public: bool = True
+    upload_time: datetime = Field(sa_type=TIMESTAMP(True))
+    blob_id: int | None = None
 
     user_id: int | None
 
@@ -107,6 +120,29 @@ class FcsFile(SQLModel, table=True):
 
 
 
+class UserFilesStat(SQLModel, table=True):
+    '''api-service 於上傳、公開與否異動與刪除時在同一交易內累加之計數，依上傳批次與公開與否分列。'''
+    __tablename__ = 'user_files_stats'
+
+    user_id: int = Field(primary_key=True)
+    upload_batch_id: int = Field(primary_key=True)
+    public: bool = Field(primary_key=True)
+    files_count: int = 0
+    files_size_byte_sum: int = Field(0, sa_type=BigInteger)
+
+
+
+class UserFilesTotal(SQLModel, table=True):
+    '''同 UserFilesStat，但只依公開與否分列，每個用戶至多兩列。'''
+    __tablename__ = 'user_files_totals'
+
+    user_id: int = Field(primary_key=True)
+    public: bool = Field(primary_key=True)
+    files_count: int = 0
+    files_size_byte_sum: int = Field(0, sa_type=BigInteger)
+
+
+
 class FilesStat(BaseModel):
     files_count: int
     files_size_byte_sum: int
@@ -145,7 +181,55 @@ class FcsInfo(BaseModel):
 
 
 
+class _TimedQueuePool(QueuePool):
+    '''累計取得連線之等待時間（含開新連線）；job-service 沒有指標端點，由 pool_status() 於每個 job 結束時寫入 log。'''
+
+    checkout_count = 0
+    checkout_wait_second = 0.0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try: return super()._do_get()
+        finally:
+            self.checkout_count += 1
+            self.checkout_wait_second += time.perf_counter() - start
+
+
+
+# statement_timeout 與 prepared statement 之處理同 api-service：PgBouncer transaction 模式下改為每個交易 SET LOCAL，並關閉 prepared statement。
+_connect_args: dict[str, Any] = {'prepare_threshold': None if _SETTINGS.DB_PGBOUNCER_TRANSACTION_MODE else _SETTINGS.DB_PREPARE_THRESHOLD}
+if _SETTINGS.DB_STATEMENT_TIMEOUT_MS and not _SETTINGS.DB_PGBOUNCER_TRANSACTION_MODE:
+    _connect_args['options'] = f'-c statement_timeout={_SETTINGS.DB_STATEMENT_TIMEOUT_MS}'
 engine = create_engine(
     _SETTINGS.DATABASE_URL,
     # echo='debug',
+    poolclass=_TimedQueuePool,
+    pool_size=_SETTINGS.DB_POOL_SIZE,
+    max_overflow=_SETTINGS.DB_MAX_OVERFLOW,
+    pool_timeout=_SETTINGS.DB_POOL_TIMEOUT_SECOND,
+    pool_recycle=_SETTINGS.DB_POOL_RECYCLE_SECOND,
+    pool_pre_ping=_SETTINGS.DB_POOL_PRE_PING,
+    connect_args=_connect_args,
 )
+
+
+
+@event.listens_for(engine, 'connect')
+def _set_prepared_max(dbapi_connection, connection_record: ConnectionPoolEntry):
+    connection_record.driver_connection.prepared_max = _SETTINGS.DB_PREPARED_MAX
+
+
+
+if _SETTINGS.DB_PGBOUNCER_TRANSACTION_MODE and _SETTINGS.DB_STATEMENT_TIMEOUT_MS:
+    @event.listens_for(engine, 'begin')
+    def _set_statement_timeout(connection: Connection):
+        connection.exec_driver_sql(f'SET LOCAL statement_timeout = {_SETTINGS.DB_STATEMENT_TIMEOUT_MS}')
+
+
+
+def pool_status():
+    pool: _TimedQueuePool = engine.pool
+    return {
+        'in_use': pool.checkedout(), 'idle': pool.checkedin(),
+        'checkout_count': pool.checkout_count, 'checkout_wait_second': round(pool.checkout_wait_second, 6),
+    }
@@ -1,3 +1,4 @@
+import shutil
 from tempfile import NamedTemporaryFile
 import time
 
@@ -6,8 +7,9 @@ from botocore.exceptions import BotoCoreError, ClientError
 from flowio import FlowData
 from rq import get_current_job
 from sqlmodel import Session, select, func
+import zstandard
 
-from jobs.db import FcsFile, FcsInfo, FilesStat, Job, JobStatusEnum, engine
+from jobs.db import FcsFile, FcsInfo, FilesStat, Job, JobStatusEnum, StorageCodecEnum, UserFilesTotal, engine, pool_status
 from jobs.logging import logger
 from jobs.settings import get_settings
 
@@ -38,9 +40,11 @@ def do_files_stat(user_id: int):
         session.refresh(db_job)
 
         # Run the job
-        files_count = session.exec(select(func.count(FcsFile.id)).where(FcsFile.user_id == user_id)).one()
-        files_size_byte_sum: int | None = session.exec(select(func.sum(FcsFile.file_size_byte)).where(FcsFile.user_id == user_id)).one()
-        if files_size_byte_sum is None: files_size_byte_sum = 0
+        # 讀 api-service 維護之計數，一個查詢只讀該用戶至多兩列，不掃過所有檔案。
+        statement = select(
+            func.coalesce(func.sum(UserFilesTotal.files_count), 0), func.coalesce(func.sum(UserFilesTotal.files_size_byte_sum), 0),
+        ).where(UserFilesTotal.user_id == user_id)
+        files_count, files_size_byte_sum = session.exec(statement).one()
         result = FilesStat(files_count=files_count, files_size_byte_sum=files_size_byte_sum)
 
         # Finish the job
@@ -50,7 +54,7 @@ def do_files_stat(user_id: int):
         session.add(db_job)
         session.commit()
         session.refresh(db_job)
-        logger.info(f'Job {job.id} is finished')
+        logger.info(f'Job {job.id} is finished, DB pool {pool_status()}')
     return result
 
 
@@ -89,19 +93,28 @@ def do_fcs_info(user_id: int, file_idno: str):
             aws_secret_access_key=_SETTINGS.AWS_SECRET_ACCESS_KEY.get_secret_value(),
         )
         with NamedTemporaryFile(suffix='.fcs', prefix=db_file.file_name, delete=False) as fcs_file:
-            try: s3_client.download_fileobj(Bucket='ahead-fcs-files', Key=db_file.s3_key, Fileobj=fcs_file)
+            try:
+                if db_file.storage_codec == StorageCodecEnum.ZSTD:
+                    # 邊讀邊解壓，暫存檔為原始內容，FlowData 照常讀取。
+                    response = s3_client.get_object(Bucket='ahead-fcs-files', Key=db_file.s3_key)
+                    with zstandard.ZstdDecompressor().stream_reader(response['Body'], read_across_frames=True) as reader:
+                        shutil.copyfileobj(reader, fcs_file)
+                else: s3_client.download_fileobj(Bucket='ahead-fcs-files', Key=db_file.s3_key, Fileobj=fcs_file)
             except BotoCoreError as boto_error:
                 logger.error(boto_error)
                 return
             except ClientError as client_error:
                 logger.error(client_error)
                 return
+            except zstandard.ZstdError as zstd_error: # 壓縮內容損毀或不完整
+                logger.error(zstd_error)
+                return
             fd = FlowData(fcs_file)
             # logger.debug(fd.name) # /var/folders/8k/cxl3xhj13bj4n8rb_r83ds200000gn/T/0000123456_1234567_AML_ClearLLab10C_BTube.fcsklhz2za3.fcs
             # logger.debug(db_file.file_size_byte) # 2585280
             # logger.debug(fd.file_size) # 2585280
             result = FcsInfo(
-                file_name=db_file.file_name, file_size_byte=db_file.file_size_byte, file_upload_time=db_file.upload_batch.upload_time,
+                file_name=db_file.file_name, file_size_byte=db_file.file_size_byte, file_upload_time=db_file.upload_time,
                 fcs_version=fd.version, fcs_pnn_labels=fd.pnn_labels, fcs_event_count=fd.event_count,
             )
 
@@ -112,5 +125,5 @@ def do_fcs_info(user_id: int, file_idno: str):
         session.add(db_job)
         session.commit()
         session.refresh(db_job)
-        logger.info(f'Job {job.id} is finished')
+        logger.info(f'Job {job.id} is finished, DB pool {pool_status()}')
     return result
\ No newline at end of file
@@ -14,6 +14,15 @@ class Settings(BaseSettings):
     ]
 
     DATABASE_URL: str
+    DB_POOL_SIZE: int = Field(1, ge=1) # SimpleWorker 一次只跑一個 job，一條連線即夠用
+    DB_MAX_OVERFLOW: int = Field(1, ge=0)
+    DB_POOL_TIMEOUT_SECOND: float = 30
+    DB_POOL_RECYCLE_SECOND: int = -1 # -1 為不重開
+    DB_POOL_PRE_PING: bool = True # worker 可能閒置很久，連線可能已被伺服器或防火牆切斷
+    DB_STATEMENT_TIMEOUT_MS: int = Field(0, ge=0) # 0 為不限制
+    DB_PREPARE_THRESHOLD: int | None = 5 # None 為不使用 prepared statement
+    DB_PREPARED_MAX: int = Field(100, ge=1)
+    DB_PGBOUNCER_TRANSACTION_MODE: bool = False
     REDIS_URL: RedisDsn
 
     AWS_ACCESS_KEY_ID: str
@@ -25,6 +34,15 @@ class Settings(BaseSettings):
         'ENVIRONMENT_MODE': 'DEVELOPMENT',
 
         'DATABASE_URL': 'sqlite:///database.db',
+        'DB_POOL_SIZE': 1,
+        'DB_MAX_OVERFLOW': 1,
+        'DB_POOL_TIMEOUT_SECOND': 30,
+        'DB_POOL_RECYCLE_SECOND': 1800,
+        'DB_POOL_PRE_PING': True,
+        'DB_STATEMENT_TIMEOUT_MS': 300000,
+        'DB_PREPARE_THRESHOLD': 5,
+        'DB_PREPARED_MAX': 100,
+        'DB_PGBOUNCER_TRANSACTION_MODE': False,
         'REDIS_URL': 'redis://redis-15500.c290.ap-northeast-1-2.ec2.redns.redis-cloud.com:15500',
 
         'AWS_ACCESS_KEY_ID': 'AWSID',